@@ -6,6 +6,10 @@ class BaseAgent(object):
     '''
     BaseAgent Class is mainly used for creating a base agent and base methods.
     '''
+    # whether get_reward is a linear function of the lane arrays its reward generators read,
+    # then rewards averaged over an action interval are generated once from averaged lane arrays
+    linear_reward = False
+
     def __init__(self, world):
         # revise if it is multi-agents in one model
         self.world = world
@@ -8,6 +8,7 @@ import gym
 
 from generator.lane_vehicle import LaneVehicleGenerator
 from generator.intersection_phase import IntersectionPhaseGenerator
+from generator.batched_lane import BatchedLaneGenerator
 import torch
 from torch import nn
 import torch.nn.functional as F
@@ -49,28 +50,34 @@ class CoLightAgent(RLAgent):
         for inter in self.world.intersections:
             node_id = inter.id if 'GS_' not in inter.id else inter.id[3:]
             node_idx = self.graph['node_id2idx'][node_id]
-            tmp_generator = LaneVehicleGenerator(self.world, inter, ['lane_count'], in_only=True, average=None)
+            tmp_generator = LaneVehicleGenerator.shared(self.world, inter, ['lane_count'], in_only=True, average=None)
             observation_generators.append((node_idx, tmp_generator))
         sorted(observation_generators, key=lambda x: x[0])  # now generator's order is according to its index in graph
         self.ob_generator = observation_generators
+        # observations and rewards of all intersections in one call, rows follow self.world.intersections
+        self.batched_ob_generator = BatchedLaneGenerator.shared(self.world, self.world.intersections, ['lane_count'],
+                                                         in_only=True, average=None)
 
         #  get reward generator for CoLightAgent
         rewarding_generators = []
         for inter in self.world.intersections:
             node_id = inter.id if 'GS_' not in inter.id else inter.id[3:]
             node_idx = self.graph['node_id2idx'][node_id]
-            tmp_generator = LaneVehicleGenerator(self.world, inter, ["lane_waiting_count"],
+            tmp_generator = LaneVehicleGenerator.shared(self.world, inter, ["lane_waiting_count"],
                                                  in_only=True, average='all', negative=True)
             rewarding_generators.append((node_idx, tmp_generator))
         sorted(rewarding_generators, key=lambda x: x[0])  # now generator's order is according to its index in graph
         self.reward_generator = rewarding_generators
+        self.batched_reward_generator = BatchedLaneGenerator.shared(self.world, self.world.intersections,
+                                                             ["lane_waiting_count"], in_only=True, average='all',
+                                                             negative=True)
 
         #  get queue generator for CoLightAgent
         queues = []
         for inter in self.world.intersections:
             node_id = inter.id if 'GS_' not in inter.id else inter.id[3:]
             node_idx = self.graph['node_id2idx'][node_id]
-            tmp_generator = LaneVehicleGenerator(self.world, inter, ["lane_waiting_count"], 
+            tmp_generator = LaneVehicleGenerator.shared(self.world, inter, ["lane_waiting_count"], 
                                                  in_only=True, negative=False)
             queues.append((node_idx, tmp_generator))
         # now generator's order is according to its index in graph
@@ -82,7 +89,7 @@ class CoLightAgent(RLAgent):
         for inter in self.world.intersections:
             node_id = inter.id if 'GS_' not in inter.id else inter.id[3:]
             node_idx = self.graph['node_id2idx'][node_id]
-            tmp_generator = LaneVehicleGenerator(self.world, inter, ["lane_delay"], 
+            tmp_generator = LaneVehicleGenerator.shared(self.world, inter, ["lane_delay"], 
                                                  in_only=True, average="all", negative=False)
             delays.append((node_idx, tmp_generator))
         # now generator's order is according to its index in graph
@@ -94,7 +101,7 @@ class CoLightAgent(RLAgent):
         for inter in self.world.intersections:
             node_id = inter.id if 'GS_' not in inter.id else inter.id[3:]
             node_idx = self.graph['node_id2idx'][node_id]
-            tmp_generator = IntersectionPhaseGenerator(self.world, inter, ['phase'],
+            tmp_generator = IntersectionPhaseGenerator.shared(self.world, inter, ['phase'],
                                                        targets=['cur_phase'], negative=False)
             phasing_generators.append((node_idx, tmp_generator))
         sorted(phasing_generators, key=lambda x: x[0])  # now generator's order is according to its index in graph
@@ -137,28 +144,34 @@ class CoLightAgent(RLAgent):
         for inter in self.world.intersections:
             node_id = inter.id if 'GS_' not in inter.id else inter.id[3:]
             node_idx = self.graph['node_id2idx'][node_id]
-            tmp_generator = LaneVehicleGenerator(self.world, inter, ['lane_count'], in_only=True, average=None)
+            tmp_generator = LaneVehicleGenerator.shared(self.world, inter, ['lane_count'], in_only=True, average=None)
             observation_generators.append((node_idx, tmp_generator))
         sorted(observation_generators, key=lambda x: x[0])  # now generator's order is according to its index in graph
         self.ob_generator = observation_generators
+        # observations and rewards of all intersections in one call, rows follow self.world.intersections
+        self.batched_ob_generator = BatchedLaneGenerator.shared(self.world, self.world.intersections, ['lane_count'],
+                                                         in_only=True, average=None)
 
         #  get reward generator for CoLightAgent
         rewarding_generators = []
         for inter in self.world.intersections:
             node_id = inter.id if 'GS_' not in inter.id else inter.id[3:]
             node_idx = self.graph['node_id2idx'][node_id]
-            tmp_generator = LaneVehicleGenerator(self.world, inter, ["lane_waiting_count"],
+            tmp_generator = LaneVehicleGenerator.shared(self.world, inter, ["lane_waiting_count"],
                                                  in_only=True, average='all', negative=True)
             rewarding_generators.append((node_idx, tmp_generator))
         sorted(rewarding_generators, key=lambda x: x[0])  # now generator's order is according to its index in graph
         self.reward_generator = rewarding_generators
+        self.batched_reward_generator = BatchedLaneGenerator.shared(self.world, self.world.intersections,
+                                                             ["lane_waiting_count"], in_only=True, average='all',
+                                                             negative=True)
 
         #  phase generator
         phasing_generators = []
         for inter in self.world.intersections:
             node_id = inter.id if 'GS_' not in inter.id else inter.id[3:]
             node_idx = self.graph['node_id2idx'][node_id]
-            tmp_generator = IntersectionPhaseGenerator(self.world, inter, ['phase'],
+            tmp_generator = IntersectionPhaseGenerator.shared(self.world, inter, ['phase'],
                                                        targets=['cur_phase'], negative=False)
             phasing_generators.append((node_idx, tmp_generator))
         sorted(phasing_generators, key=lambda x: x[0])  # now generator's order is according to its index in graph
@@ -169,7 +182,7 @@ class CoLightAgent(RLAgent):
         for inter in self.world.intersections:
             node_id = inter.id if 'GS_' not in inter.id else inter.id[3:]
             node_idx = self.graph['node_id2idx'][node_id]
-            tmp_generator = LaneVehicleGenerator(self.world, inter, ["lane_waiting_count"], 
+            tmp_generator = LaneVehicleGenerator.shared(self.world, inter, ["lane_waiting_count"], 
                                                  in_only=True, negative=False)
             queues.append((node_idx, tmp_generator))
         # now generator's order is according to its index in graph
@@ -181,7 +194,7 @@ class CoLightAgent(RLAgent):
         for inter in self.world.intersections:
             node_id = inter.id if 'GS_' not in inter.id else inter.id[3:]
             node_idx = self.graph['node_id2idx'][node_id]
-            tmp_generator = LaneVehicleGenerator(self.world, inter, ["lane_delay"], 
+            tmp_generator = LaneVehicleGenerator.shared(self.world, inter, ["lane_delay"], 
                                                  in_only=True, average="all", negative=False)
             delays.append((node_idx, tmp_generator))
         # now generator's order is according to its index in graph
@@ -189,23 +202,18 @@ class CoLightAgent(RLAgent):
         self.delay = delays
 
     def get_ob(self):
-        x_obs = []  # sub_agents * lane_nums,
-        for i in range(len(self.ob_generator)):
-            x_obs.append((self.ob_generator[i][1].generate()) / self.vehicle_max)
+        x_obs, _ = self.batched_ob_generator.generate()  # sub_agents * lane_nums,
+        x_obs /= self.vehicle_max
         # construct edge information.
-        length = set([len(i) for i in x_obs])
-        if len(length) == 1: # each intersections may has  different lane nums
-            x_obs = np.array(x_obs, dtype=np.float32)
-        else:
-            x_obs = [np.expand_dims(x,axis=0) for x in x_obs]
-        return x_obs
+        ob_lengths = self.batched_ob_generator.ob_lengths
+        if (ob_lengths == self.batched_ob_generator.ob_length).all(): # each intersections may has  different lane nums
+            return x_obs
+        return [x_obs[i:i + 1, :l] for i, l in enumerate(ob_lengths)]
 
     def get_reward(self):
         # TODO: test output
-        rewards = []  # sub_agents
-        for i in range(len(self.reward_generator)):
-            rewards.append(self.reward_generator[i][1].generate())
-        rewards = np.squeeze(np.array(rewards, dtype=np.float32)) * 12
+        rewards, _ = self.batched_reward_generator.generate()  # sub_agents
+        rewards = np.squeeze(rewards) * 12
         return rewards
 
     def get_phase(self):
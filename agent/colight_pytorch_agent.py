@@ -196,6 +196,9 @@ class ColightNet(nn.Module):
 
 
 class CoLightAgent(RLAgent_t):
+    # rewards are read from world infos instead of reward_generator
+    linear_reward = False
+
     def __init__(self, action_space, ob_generator, reward_generator, world, traffic_env_conf, graph_setting, args):
         super().__init__(action_space, ob_generator[0][1], reward_generator)
         self.action_space = action_space
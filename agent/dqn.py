@@ -37,11 +37,11 @@ class DQNAgent(RLAgent):
         inter_id = self.world.intersection_ids[self.rank]
         inter_obj = self.world.id2intersection[inter_id]
         self.inter = inter_obj
-        self.ob_generator = LaneVehicleGenerator(self.world,  self.inter, ['lane_count'], in_only=True, average=None)
+        self.ob_generator = LaneVehicleGenerator.shared(self.world,  self.inter, ['lane_count'], in_only=True, average=None)
 
-        self.phase_generator = IntersectionPhaseGenerator(world,  self.inter, ["phase"],
+        self.phase_generator = IntersectionPhaseGenerator.shared(world,  self.inter, ["phase"],
                                                           targets=["cur_phase"], negative=False)
-        self.reward_generator = LaneVehicleGenerator(self.world,  self.inter, ["lane_waiting_count"],
+        self.reward_generator = LaneVehicleGenerator.shared(self.world,  self.inter, ["lane_waiting_count"],
                                                      in_only=True, average='all', negative=True)
         self.action_space = gym.spaces.Discrete(len(self.world.id2intersection[inter_id].phases))
 
@@ -83,15 +83,15 @@ class DQNAgent(RLAgent):
         '''
         inter_id = self.world.intersection_ids[self.rank]
         inter_obj = self.world.id2intersection[inter_id]
-        self.ob_generator = LaneVehicleGenerator(self.world, inter_obj, ['lane_count'], in_only=True, average=None)
-        self.phase_generator = IntersectionPhaseGenerator(self.world, inter_obj, ["phase"],
+        self.ob_generator = LaneVehicleGenerator.shared(self.world, inter_obj, ['lane_count'], in_only=True, average=None)
+        self.phase_generator = IntersectionPhaseGenerator.shared(self.world, inter_obj, ["phase"],
                                                           targets=["cur_phase"], negative=False)
-        self.reward_generator = LaneVehicleGenerator(self.world, inter_obj, ["lane_waiting_count"],
+        self.reward_generator = LaneVehicleGenerator.shared(self.world, inter_obj, ["lane_waiting_count"],
                                                      in_only=True, average='all', negative=True)
-        self.queue = LaneVehicleGenerator(self.world, inter_obj,
+        self.queue = LaneVehicleGenerator.shared(self.world, inter_obj,
                                                      ["lane_waiting_count"], in_only=True,
                                                      negative=False)
-        self.delay = LaneVehicleGenerator(self.world, inter_obj,
+        self.delay = LaneVehicleGenerator.shared(self.world, inter_obj,
                                                      ["lane_delay"], in_only=True, average="all",
                                                      negative=False)
 
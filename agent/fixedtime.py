@@ -9,6 +9,8 @@ class FixedTimeAgent(BaseAgent):
     '''
     FixedTimeAgent gives a predefined time duration and phase order.
     '''
+    linear_reward = True
+
     def __init__(self, world, rank):
         super().__init__(world)
         self.world = world
@@ -18,17 +20,17 @@ class FixedTimeAgent(BaseAgent):
         # get generator for each MaxPressure
         inter_id = self.world.intersection_ids[self.rank]
         self.inter_obj = self.world.id2intersection[inter_id]
-        self.ob_generator = self.ob_generator = LaneVehicleGenerator(self.world, self.inter_obj, ['lane_count'], in_only=True, average=None)
-        self.phase_generator = IntersectionPhaseGenerator(world, self.inter_obj, ["phase"],
+        self.ob_generator = self.ob_generator = LaneVehicleGenerator.shared(self.world, self.inter_obj, ['lane_count'], in_only=True, average=None)
+        self.phase_generator = IntersectionPhaseGenerator.shared(world, self.inter_obj, ["phase"],
                                                           targets=["cur_phase"], negative=False)
-        self.reward_generator = LaneVehicleGenerator(self.world, self.inter_obj, ["lane_count"],
+        self.reward_generator = LaneVehicleGenerator.shared(self.world, self.inter_obj, ["lane_count"],
                                                      in_only=True, average='all', negative=True)
         
-        self.queue = LaneVehicleGenerator(self.world, self.inter_obj,
+        self.queue = LaneVehicleGenerator.shared(self.world, self.inter_obj,
                                                      ["lane_waiting_count"], in_only=True,
                                                      negative=False)
 
-        self.delay = LaneVehicleGenerator(self.world, self.inter_obj,
+        self.delay = LaneVehicleGenerator.shared(self.world, self.inter_obj,
                                                      ["lane_delay"], in_only=True,
                                                      negative=False) 
 
@@ -49,17 +51,17 @@ class FixedTimeAgent(BaseAgent):
         '''
         inter_id = self.world.intersection_ids[self.rank]
         self.inter_obj = self.world.id2intersection[inter_id]
-        self.ob_generator = self.ob_generator = LaneVehicleGenerator(self.world, self.inter_obj, ['lane_count'], in_only=True, average=None)
-        self.phase_generator = IntersectionPhaseGenerator(self.world, self.inter_obj, ["phase"],
+        self.ob_generator = self.ob_generator = LaneVehicleGenerator.shared(self.world, self.inter_obj, ['lane_count'], in_only=True, average=None)
+        self.phase_generator = IntersectionPhaseGenerator.shared(self.world, self.inter_obj, ["phase"],
                                                           targets=["cur_phase"], negative=False)
-        self.reward_generator = LaneVehicleGenerator(self.world, self.inter_obj, ["lane_count"],
+        self.reward_generator = LaneVehicleGenerator.shared(self.world, self.inter_obj, ["lane_count"],
                                                      in_only=True, average='all', negative=True)
         
-        self.queue = LaneVehicleGenerator(self.world, self.inter_obj,
+        self.queue = LaneVehicleGenerator.shared(self.world, self.inter_obj,
                                                      ["lane_waiting_count"], in_only=True,
                                                      negative=False)
 
-        self.delay = LaneVehicleGenerator(self.world, self.inter_obj,
+        self.delay = LaneVehicleGenerator.shared(self.world, self.inter_obj,
                                                      ["lane_delay"], in_only=True,
                                                      negative=False)
 
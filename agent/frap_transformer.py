@@ -46,18 +46,18 @@ class FRAP_TRANSFORMERAgent(RLAgent):
         self.inter_id = self.world.intersection_ids[self.rank]
         self.inter_obj = self.world.id2intersection[self.inter_id]
         self.action_space = gym.spaces.Discrete(len(self.inter_obj.phases))
-        self.ob_generator = LaneVehicleGenerator(self.world, self.inter_obj,
+        self.ob_generator = LaneVehicleGenerator.shared(self.world, self.inter_obj,
                                                  ["lane_count"], in_only=True, average=None)
-        self.phase_generator = IntersectionPhaseGenerator(self.world, self.inter_obj,
+        self.phase_generator = IntersectionPhaseGenerator.shared(self.world, self.inter_obj,
                                                           ['phase'], targets=['cur_phase'], negative=False)
-        self.reward_generator = LaneVehicleGenerator(self.world, self.inter_obj,
+        self.reward_generator = LaneVehicleGenerator.shared(self.world, self.inter_obj,
                                                      ["lane_waiting_count"], in_only=True, average="all",
                                                      negative=True)
         
-        self.queue = LaneVehicleGenerator(self.world, self.inter_obj,
+        self.queue = LaneVehicleGenerator.shared(self.world, self.inter_obj,
                                                      ["lane_waiting_count"], in_only=True,
                                                      negative=False)
-        self.delay = LaneVehicleGenerator(self.world, self.inter_obj,
+        self.delay = LaneVehicleGenerator.shared(self.world, self.inter_obj,
                                                      ["lane_delay"], in_only=True, average="all",
                                                      negative=False)
 
@@ -116,17 +116,17 @@ class FRAP_TRANSFORMERAgent(RLAgent):
         self.inter_id = self.world.intersection_ids[self.rank]
         self.inter_obj = self.world.id2intersection[self.inter_id]
         self.action_space = gym.spaces.Discrete(len(self.inter_obj.phases))
-        self.ob_generator = LaneVehicleGenerator(self.world, self.inter_obj,
+        self.ob_generator = LaneVehicleGenerator.shared(self.world, self.inter_obj,
                                                  ["lane_count"], in_only=True, average=None)
-        self.phase_generator = IntersectionPhaseGenerator(self.world, self.inter_obj,
+        self.phase_generator = IntersectionPhaseGenerator.shared(self.world, self.inter_obj,
                                                           ['phase'], targets=['cur_phase'], negative=False)
-        self.reward_generator = LaneVehicleGenerator(self.world, self.inter_obj,
+        self.reward_generator = LaneVehicleGenerator.shared(self.world, self.inter_obj,
                                                      ["lane_waiting_count"], in_only=True, average="all",
                                                      negative=True)
-        self.queue = LaneVehicleGenerator(self.world, self.inter_obj,
+        self.queue = LaneVehicleGenerator.shared(self.world, self.inter_obj,
                                                      ["lane_waiting_count"], in_only=True,
                                                      negative=False)
-        self.delay = LaneVehicleGenerator(self.world, self.inter_obj,
+        self.delay = LaneVehicleGenerator.shared(self.world, self.inter_obj,
                                                      ["lane_delay"], in_only=True, average="all",
                                                      negative=False)
     
@@ -20,6 +20,9 @@ from torch.nn.utils import clip_grad_norm_
 
 @Registry.register_model('maddpg')
 class MADDPGAgent(RLAgent):
+    # the reward has a bonus for keeping the last action
+    linear_reward = False
+
     def __init__(self, world, rank):
         super().__init__(world, world.intersection_ids[rank])
         self.buffer_size = Registry.mapping['trainer_mapping']['trainer_setting'].param['buffer_size']
@@ -39,10 +42,10 @@ class MADDPGAgent(RLAgent):
         inter_id = self.world.intersection_ids[self.rank]
         inter_obj = self.world.id2intersection[inter_id]
         self.inter = inter_obj
-        self.ob_generator = LaneVehicleGenerator(self.world,  self.inter, ['lane_count'], in_only=True, average=None)
-        self.phase_generator = IntersectionPhaseGenerator(world,  self.inter, ["phase"],
+        self.ob_generator = LaneVehicleGenerator.shared(self.world,  self.inter, ['lane_count'], in_only=True, average=None)
+        self.phase_generator = IntersectionPhaseGenerator.shared(world,  self.inter, ["phase"],
                                                           targets=["cur_phase"], negative=False)
-        self.reward_generator = LaneVehicleGenerator(self.world,  self.inter, ["lane_waiting_count"],
+        self.reward_generator = LaneVehicleGenerator.shared(self.world,  self.inter, ["lane_waiting_count"],
                                                      in_only=True, average='all', negative=True)
         self.action_space = gym.spaces.Discrete(len(self.world.id2intersection[inter_id].phases))
 
@@ -115,10 +118,10 @@ class MADDPGAgent(RLAgent):
         inter_id = self.world.intersection_ids[self.rank]
         inter_obj = self.world.id2intersection[inter_id]
         self.inter = inter_obj
-        self.ob_generator = LaneVehicleGenerator(self.world, inter_obj, ['lane_count'], in_only=True, average=None)
-        self.phase_generator = IntersectionPhaseGenerator(self.world, inter_obj, ["phase"],
+        self.ob_generator = LaneVehicleGenerator.shared(self.world, inter_obj, ['lane_count'], in_only=True, average=None)
+        self.phase_generator = IntersectionPhaseGenerator.shared(self.world, inter_obj, ["phase"],
                                                           targets=["cur_phase"], negative=False)
-        self.reward_generator = LaneVehicleGenerator(self.world, inter_obj, ["lane_waiting_count"],
+        self.reward_generator = LaneVehicleGenerator.shared(self.world, inter_obj, ["lane_waiting_count"],
                                                      in_only=True, average='all', negative=True)
         self.action = 0
         self.last_action = 0
@@ -114,6 +114,9 @@ def q_train(make_obs_ph_n, act_space_n, q_index, q_func, optimizer, grad_norm_cl
         return train, update_target_q, {'q_values': q_values, 'target_q_values': target_q_values}
 
 class MADDPGAgent(RLAgent):
+    # the reward has a bonus for keeping the last action
+    linear_reward = False
+
     def __init__(self, action_space, ob_generator, reward_generator, args, iid, local_q_func=False):
         super().__init__(action_space, ob_generator, reward_generator)
 
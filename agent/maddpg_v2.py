@@ -20,6 +20,9 @@ from torch.nn.utils import clip_grad_norm_
 
 @Registry.register_model('maddpg_v2')
 class MADDPGAgent(RLAgent):
+    # rewards are lists of sub-agent rewards
+    linear_reward = False
+
     def __init__(self, world, rank):
         super().__init__(world, world.intersection_ids[rank])
         self.buffer_size = Registry.mapping['trainer_mapping']['trainer_setting'].param['buffer_size']
@@ -204,10 +207,10 @@ class MADDPG_SUBAgent(object):
         self.inter = inter_id
         self.inter_obj = self.world.id2intersection[inter_id]
 
-        self.ob_generator = LaneVehicleGenerator(self.world, self.inter_obj, ['lane_count'], in_only=True, average=None)
-        self.phase_generator = IntersectionPhaseGenerator(self.world, self.inter_obj, ["phase"],
+        self.ob_generator = LaneVehicleGenerator.shared(self.world, self.inter_obj, ['lane_count'], in_only=True, average=None)
+        self.phase_generator = IntersectionPhaseGenerator.shared(self.world, self.inter_obj, ["phase"],
                                                           targets=["cur_phase"], negative=False)
-        self.reward_generator = LaneVehicleGenerator(self.world, self.inter_obj, ["lane_waiting_count"],
+        self.reward_generator = LaneVehicleGenerator.shared(self.world, self.inter_obj, ["lane_waiting_count"],
                                                      in_only=True, average='all', negative=True)
         self.action_space = gym.spaces.Discrete(len(self.world.id2intersection[inter_id].phases))
         if self.phase:
@@ -254,10 +257,10 @@ class MADDPG_SUBAgent(object):
     def reset(self):
         inter_obj = self.world.id2intersection[self.inter]
         self.inter = inter_obj
-        self.ob_generator = LaneVehicleGenerator(self.world, inter_obj, ['lane_count'], in_only=True, average=None)
-        self.phase_generator = IntersectionPhaseGenerator(self.world, inter_obj, ["phase"],
+        self.ob_generator = LaneVehicleGenerator.shared(self.world, inter_obj, ['lane_count'], in_only=True, average=None)
+        self.phase_generator = IntersectionPhaseGenerator.shared(self.world, inter_obj, ["phase"],
                                                           targets=["cur_phase"], negative=False)
-        self.reward_generator = LaneVehicleGenerator(self.world, inter_obj, ["lane_waiting_count"],
+        self.reward_generator = LaneVehicleGenerator.shared(self.world, inter_obj, ["lane_waiting_count"],
                                                      in_only=True, average='all', negative=True)
 
     """
@@ -10,6 +10,8 @@ class MaxPressureAgent(BaseAgent):
     '''
     MaxPressureAgent using Max-Pressure method to control traffic light.
     '''
+    linear_reward = True
+
     def __init__(self, world, rank):
         super().__init__(world)
         self.world = world
@@ -19,23 +21,39 @@ class MaxPressureAgent(BaseAgent):
         # get generator for each MaxPressure
         inter_id = self.world.intersection_ids[self.rank]
         self.inter_obj = self.world.id2intersection[inter_id]
-        self.ob_generator = self.ob_generator = LaneVehicleGenerator(self.world, self.inter_obj, ['lane_count'], in_only=True, average=None)
-        self.phase_generator = IntersectionPhaseGenerator(world, self.inter_obj, ["phase"],
+        self.ob_generator = self.ob_generator = LaneVehicleGenerator.shared(self.world, self.inter_obj, ['lane_count'], in_only=True, average=None)
+        self.phase_generator = IntersectionPhaseGenerator.shared(world, self.inter_obj, ["phase"],
                                                           targets=["cur_phase"], negative=False)
-        self.reward_generator = LaneVehicleGenerator(self.world, self.inter_obj, ["lane_count"],
+        self.reward_generator = LaneVehicleGenerator.shared(self.world, self.inter_obj, ["lane_count"],
                                                      in_only=True, average='all', negative=True)
         
-        self.queue = LaneVehicleGenerator(self.world, self.inter_obj,
+        self.queue = LaneVehicleGenerator.shared(self.world, self.inter_obj,
                                                      ["lane_waiting_count"], in_only=True,
                                                      negative=False)
 
-        self.delay = LaneVehicleGenerator(self.world, self.inter_obj,
+        self.delay = LaneVehicleGenerator.shared(self.world, self.inter_obj,
                                                      ["lane_delay"], in_only=True,
                                                      negative=False)
         self.action_space = gym.spaces.Discrete(len(self.inter_obj.phases))
         
         # the minimum duration of time of one phase
         self.t_min = Registry.mapping['model_mapping']['setting'].param['t_min']
+        self._build_phase_lane_index()
+
+    def _build_phase_lane_index(self):
+        '''
+        _build_phase_lane_index
+        Precompute start and end lane positions of each phase in the world's lane arrays.
+
+        :param: None
+        :return: None
+        '''
+        lane_index = self.world.lane_index
+        self.phase_start_idx = []
+        self.phase_end_idx = []
+        for lanelinks in self.inter_obj.phase_available_lanelinks:
+            self.phase_start_idx.append(np.array([lane_index[start] for start, end in lanelinks], dtype=np.int64))
+            self.phase_end_idx.append(np.array([lane_index[end] for start, end in lanelinks], dtype=np.int64))
 
     def reset(self):
         '''
@@ -48,19 +66,20 @@ class MaxPressureAgent(BaseAgent):
         # get generator for each MaxPressure
         inter_id = self.world.intersection_ids[self.rank]
         self.inter_obj = self.world.id2intersection[inter_id]
-        self.ob_generator = self.ob_generator = LaneVehicleGenerator(self.world, self.inter_obj, ['lane_count'], in_only=True, average=None)
-        self.phase_generator = IntersectionPhaseGenerator(self.world, self.inter_obj, ["phase"],
+        self.ob_generator = self.ob_generator = LaneVehicleGenerator.shared(self.world, self.inter_obj, ['lane_count'], in_only=True, average=None)
+        self.phase_generator = IntersectionPhaseGenerator.shared(self.world, self.inter_obj, ["phase"],
                                                           targets=["cur_phase"], negative=False)
-        self.reward_generator = LaneVehicleGenerator(self.world, self.inter_obj, ["lane_count"],
+        self.reward_generator = LaneVehicleGenerator.shared(self.world, self.inter_obj, ["lane_count"],
                                                      in_only=True, average='all', negative=True)
         
-        self.queue = LaneVehicleGenerator(self.world, self.inter_obj,
+        self.queue = LaneVehicleGenerator.shared(self.world, self.inter_obj,
                                                      ["lane_waiting_count"], in_only=True,
                                                      negative=False)
 
-        self.delay = LaneVehicleGenerator(self.world, self.inter_obj,
+        self.delay = LaneVehicleGenerator.shared(self.world, self.inter_obj,
                                                      ["lane_delay"], in_only=True,
                                                      negative=False)
+        self._build_phase_lane_index()
 
     def __repr__(self):
         return 'Maxpressure Agent has no Network model'
@@ -116,14 +135,14 @@ class MaxPressureAgent(BaseAgent):
         :return action: action that has the highest score
         '''
         # get lane pressure
-        lvc = self.world.get_info("lane_count")
         if self.inter_obj.current_phase_time < self.t_min:
             return self.inter_obj.current_phase
+        lvc = self.world.get_lane_array("lane_count")
 
         max_pressure = None
         action = -1
         for phase_id in range(len(self.inter_obj.phases)):
-            pressure = sum([lvc[start] - lvc[end] for start, end in self.inter_obj.phase_available_lanelinks[phase_id]])
+            pressure = lvc[self.phase_start_idx[phase_id]].sum() - lvc[self.phase_end_idx[phase_id]].sum()
             if max_pressure is None or pressure > max_pressure:
                 action = phase_id
                 max_pressure = pressure
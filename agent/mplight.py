@@ -77,7 +77,7 @@ class MPLightAgent(RLAgent):
             node_id = inter.id
             node_idx = self.world.id2idx[node_id]
             node_obj = self.world.id2intersection[node_id]
-            tmp_generator = LaneVehicleGenerator(self.world, node_obj, ['lane_count'], in_only=True, average=None)
+            tmp_generator = LaneVehicleGenerator.shared(self.world, node_obj, ['lane_count'], in_only=True, average=None)
             observation_generators.append((node_idx, tmp_generator))
         sorted(observation_generators, key=lambda x: x[0])  # now generator's order is according to its index in graph
         self.ob_generator = observation_generators
@@ -88,7 +88,7 @@ class MPLightAgent(RLAgent):
             node_id = inter.id
             node_idx = self.world.id2idx[node_id]
             node_obj = self.world.id2intersection[node_id]
-            tmp_generator = LaneVehicleGenerator(self.world, node_obj, ["lane_waiting_count"],
+            tmp_generator = LaneVehicleGenerator.shared(self.world, node_obj, ["lane_waiting_count"],
                                                  in_only=True, average='all', negative=True)
             rewarding_generators.append((node_idx, tmp_generator))
         sorted(rewarding_generators, key=lambda x: x[0])  # now generator's order is according to its index in graph
@@ -100,7 +100,7 @@ class MPLightAgent(RLAgent):
             node_id = inter.id
             node_idx = self.world.id2idx[node_id]
             node_obj = self.world.id2intersection[node_id]
-            tmp_generator = IntersectionPhaseGenerator(self.world, node_obj, ['phase'],
+            tmp_generator = IntersectionPhaseGenerator.shared(self.world, node_obj, ['phase'],
                                                        targets=['cur_phase'], negative=False)
             phasing_generators.append((node_idx, tmp_generator))
         sorted(phasing_generators, key=lambda x: x[0])  # now generator's order is according to its index in graph
@@ -112,7 +112,7 @@ class MPLightAgent(RLAgent):
             node_id = inter.id
             node_idx = self.world.id2idx[node_id]
             node_obj = self.world.id2intersection[node_id]
-            tmp_generator = LaneVehicleGenerator(self.world, node_obj, ["lane_waiting_count"], 
+            tmp_generator = LaneVehicleGenerator.shared(self.world, node_obj, ["lane_waiting_count"], 
                                                  in_only=True, negative=False)
             queues.append((node_idx, tmp_generator))
         sorted(queues, key=lambda x: x[0])
@@ -124,7 +124,7 @@ class MPLightAgent(RLAgent):
             node_id = inter.id
             node_idx = self.world.id2idx[node_id]
             node_obj = self.world.id2intersection[node_id]
-            tmp_generator = LaneVehicleGenerator(self.world, node_obj, ["lane_delay"], 
+            tmp_generator = LaneVehicleGenerator.shared(self.world, node_obj, ["lane_delay"], 
                                                  in_only=True, average="all", negative=False)
             delays.append((node_idx, tmp_generator))
         sorted(delays, key=lambda x: x[0])
@@ -156,7 +156,7 @@ class MPLightAgent(RLAgent):
             node_id = inter.id
             node_idx = self.world.id2idx[node_id]
             node_obj = self.world.id2intersection[node_id]
-            tmp_generator = LaneVehicleGenerator(self.world, node_obj, ['lane_count'], in_only=True, average=None)
+            tmp_generator = LaneVehicleGenerator.shared(self.world, node_obj, ['lane_count'], in_only=True, average=None)
             observation_generators.append((node_idx, tmp_generator))
         sorted(observation_generators, key=lambda x: x[0])  # now generator's order is according to its index in graph
         self.ob_generator = observation_generators
@@ -166,7 +166,7 @@ class MPLightAgent(RLAgent):
             node_id = inter.id
             node_idx = self.world.id2idx[node_id]
             node_obj = self.world.id2intersection[node_id]
-            tmp_generator = LaneVehicleGenerator(self.world, node_obj, ["lane_waiting_count"],
+            tmp_generator = LaneVehicleGenerator.shared(self.world, node_obj, ["lane_waiting_count"],
                                                  in_only=True, average='all', negative=True)
             rewarding_generators.append((node_idx, tmp_generator))
         sorted(rewarding_generators, key=lambda x: x[0])  # now generator's order is according to its index in graph
@@ -177,7 +177,7 @@ class MPLightAgent(RLAgent):
             node_id = inter.id
             node_idx = self.world.id2idx[node_id]
             node_obj = self.world.id2intersection[node_id]
-            tmp_generator = IntersectionPhaseGenerator(self.world, node_obj, ['phase'],
+            tmp_generator = IntersectionPhaseGenerator.shared(self.world, node_obj, ['phase'],
                                                        targets=['cur_phase'], negative=False)
             phasing_generators.append((node_idx, tmp_generator))
         sorted(phasing_generators, key=lambda x: x[0])  # now generator's order is according to its index in graph
@@ -188,7 +188,7 @@ class MPLightAgent(RLAgent):
             node_id = inter.id
             node_idx = self.world.id2idx[node_id]
             node_obj = self.world.id2intersection[node_id]
-            tmp_generator = LaneVehicleGenerator(self.world, node_obj, ["lane_waiting_count"], 
+            tmp_generator = LaneVehicleGenerator.shared(self.world, node_obj, ["lane_waiting_count"], 
                                                  in_only=True, negative=False)
             queues.append((node_idx, tmp_generator))
         sorted(queues, key=lambda x: x[0])
@@ -199,7 +199,7 @@ class MPLightAgent(RLAgent):
             node_id = inter.id
             node_idx = self.world.id2idx[node_id]
             node_obj = self.world.id2intersection[node_id]
-            tmp_generator = LaneVehicleGenerator(self.world, node_obj, ["lane_delay"], 
+            tmp_generator = LaneVehicleGenerator.shared(self.world, node_obj, ["lane_delay"], 
                                                  in_only=True, average="all", negative=False)
             delays.append((node_idx, tmp_generator))
         sorted(delays, key=lambda x: x[0])
@@ -36,6 +36,9 @@ def lecun_init(layer, gain=1.0):
 
 @Registry.register_model('ppo_pfrl')
 class IPPO_pfrl(RLAgent):
+    # rewards are clipped
+    linear_reward = False
+
     def __init__(self, world, rank):
         super().__init__(world, world.intersection_ids[rank])
         self.world = world
@@ -53,10 +56,10 @@ class IPPO_pfrl(RLAgent):
         inter_id = self.world.intersection_ids[self.rank]
         inter_obj = self.world.id2intersection[inter_id]
         self.inter = inter_obj
-        self.ob_generator = LaneVehicleGenerator(self.world, self.inter, ['lane_count'], in_only=True, average=None)
-        self.phase_generator = IntersectionPhaseGenerator(world, self.inter, ["phase"],
+        self.ob_generator = LaneVehicleGenerator.shared(self.world, self.inter, ['lane_count'], in_only=True, average=None)
+        self.phase_generator = IntersectionPhaseGenerator.shared(world, self.inter, ["phase"],
                                                           targets=["cur_phase"], negative=False)
-        self.reward_generator = LaneVehicleGenerator(self.world, self.inter, ["lane_waiting_count"],
+        self.reward_generator = LaneVehicleGenerator.shared(self.world, self.inter, ["lane_waiting_count"],
                                                      in_only=True, average='all', negative=True)
         self.action_space = gym.spaces.Discrete(len(self.world.id2intersection[inter_id].phases))
 
@@ -81,15 +84,15 @@ class IPPO_pfrl(RLAgent):
         inter_id = self.world.intersection_ids[self.rank]
         inter_obj = self.world.id2intersection[inter_id]
         self.inter = inter_obj
-        self.ob_generator_lane = LaneVehicleGenerator(self.world, inter_obj, ['lane_count'],
+        self.ob_generator_lane = LaneVehicleGenerator.shared(self.world, inter_obj, ['lane_count'],
                                                       in_only=True, average=None)
-        self.ob_generator_wait = LaneVehicleGenerator(self.world, inter_obj, ['lane_waiting_count'],
+        self.ob_generator_wait = LaneVehicleGenerator.shared(self.world, inter_obj, ['lane_waiting_count'],
                                                       in_only=True, average=None)
-        self.ob_generator_wait_time = LaneVehicleGenerator(self.world, inter_obj, ['lane_waiting_time_count'],
+        self.ob_generator_wait_time = LaneVehicleGenerator.shared(self.world, inter_obj, ['lane_waiting_time_count'],
                                                            in_only=True, average=None)
-        self.phase_generator = IntersectionPhaseGenerator(self.world, inter_obj, ["phase"],
+        self.phase_generator = IntersectionPhaseGenerator.shared(self.world, inter_obj, ["phase"],
                                                           targets=["cur_phase"], negative=False)
-        self.reward_generator = LaneVehicleGenerator(self.world, inter_obj, ["lane_waiting_time_count"],
+        self.reward_generator = LaneVehicleGenerator.shared(self.world, inter_obj, ["lane_waiting_time_count"],
                                                      in_only=True, average='all', negative=True)
         # self.vehicles_generator = IntersectionVehicleGenerator(self.world, inter_obj, ["lane_vehicles"])
     def get_ob(self):
@@ -34,10 +34,10 @@ class PressLightAgent(RLAgent):
         # get generator
         inter_id = self.world.intersection_ids[self.rank]
         inter_obj = self.world.id2intersection[inter_id]
-        self.ob_generator = LaneVehicleGenerator(world, inter_obj, ["lane_count"], average=None)
-        self.phase_generator = IntersectionPhaseGenerator(world, inter_obj, ["phase"],
+        self.ob_generator = LaneVehicleGenerator.shared(world, inter_obj, ["lane_count"], average=None)
+        self.phase_generator = IntersectionPhaseGenerator.shared(world, inter_obj, ["phase"],
                                                           targets=["cur_phase"], negative=False)
-        self.reward_generator = LaneVehicleGenerator(world, inter_obj, ["pressure"], average="all", negative=True)
+        self.reward_generator = LaneVehicleGenerator.shared(world, inter_obj, ["pressure"], average="all", negative=True)
         self.action_space = gym.spaces.Discrete(len(inter_obj.phases))
         if self.phase:
             if self.one_hot:
@@ -78,14 +78,14 @@ class PressLightAgent(RLAgent):
         '''
         inter_id = self.world.intersection_ids[self.rank]
         inter_obj = self.world.id2intersection[inter_id]
-        self.ob_generator = LaneVehicleGenerator(self.world, inter_obj, ["lane_count"], average=None)
-        self.phase_generator = IntersectionPhaseGenerator(self.world, inter_obj, ["phase"],
+        self.ob_generator = LaneVehicleGenerator.shared(self.world, inter_obj, ["lane_count"], average=None)
+        self.phase_generator = IntersectionPhaseGenerator.shared(self.world, inter_obj, ["phase"],
                                                           targets=["cur_phase"], negative=False)
-        self.reward_generator = LaneVehicleGenerator(self.world, inter_obj, ["pressure"], average="all", negative=True)
-        self.queue = LaneVehicleGenerator(self.world, inter_obj,
+        self.reward_generator = LaneVehicleGenerator.shared(self.world, inter_obj, ["pressure"], average="all", negative=True)
+        self.queue = LaneVehicleGenerator.shared(self.world, inter_obj,
                                                      ["lane_waiting_count"], in_only=True,
                                                      negative=False)
-        self.delay = LaneVehicleGenerator(self.world, inter_obj,
+        self.delay = LaneVehicleGenerator.shared(self.world, inter_obj,
                                                      ["lane_delay"], in_only=True, average="all",
                                                      negative=False)
 
@@ -11,22 +11,24 @@ class RLAgent(BaseAgent):
     '''
     RLAgent Class is mainly used for creating a rl-based agent and base methods.
     '''
+    linear_reward = True
+
     def __init__(self, world, intersection_ids):
         super().__init__(world)
         self.id = intersection_ids
         self.inter_obj = self.world.id2intersection[self.id]
         self.action_space = gym.spaces.Discrete(len(self.inter_obj.phases))
-        self.ob_generator = LaneVehicleGenerator(self.world, self.inter_obj,
+        self.ob_generator = LaneVehicleGenerator.shared(self.world, self.inter_obj,
                                                  ["lane_count"], in_only=True, average=None)
-        self.phase_generator = IntersectionPhaseGenerator(self.world, self.inter_obj,
+        self.phase_generator = IntersectionPhaseGenerator.shared(self.world, self.inter_obj,
                                                           ['phase'], targets=['cur_phase'], negative=False)
-        self.reward_generator = LaneVehicleGenerator(self.world, self.inter_obj,
+        self.reward_generator = LaneVehicleGenerator.shared(self.world, self.inter_obj,
                                                      ["lane_waiting_count"], in_only=True, average="all",
                                                      negative=True)
-        self.queue = LaneVehicleGenerator(self.world, self.inter_obj,
+        self.queue = LaneVehicleGenerator.shared(self.world, self.inter_obj,
                                                      ["lane_waiting_count"], in_only=True,
                                                      negative=False)
-        self.delay = LaneVehicleGenerator(self.world, self.inter_obj,
+        self.delay = LaneVehicleGenerator.shared(self.world, self.inter_obj,
                                                      ["lane_delay"], in_only=True, average="all",
                                                      negative=False)
     def get_ob(self):
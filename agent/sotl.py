@@ -10,6 +10,8 @@ class SOTLAgent(BaseAgent):
     '''
     SOTLAgent using Self-organizing Traffic Light(SOTL) Control method to control traffic light.
     '''
+    linear_reward = True
+
     def __init__(self, world, rank):
         super().__init__(world)
         self.world = world
@@ -23,19 +25,32 @@ class SOTLAgent(BaseAgent):
         inter_obj = self.world.id2intersection[inter_id]
         self.model = None
         self.inter = inter_obj
-        self.ob_generator = LaneVehicleGenerator(self.world, self.inter, ['lane_waiting_count'], in_only=True, average=None)
-        self.phase_generator = IntersectionPhaseGenerator(world, self.inter, ["phase"],
+        self.ob_generator = LaneVehicleGenerator.shared(self.world, self.inter, ['lane_waiting_count'], in_only=True, average=None)
+        self.phase_generator = IntersectionPhaseGenerator.shared(world, self.inter, ["phase"],
                                                           targets=["cur_phase"], negative=False)
-        self.reward_generator = LaneVehicleGenerator(self.world, self.inter, ["lane_waiting_count"],
+        self.reward_generator = LaneVehicleGenerator.shared(self.world, self.inter, ["lane_waiting_count"],
                                                      in_only=True, average='all', negative=True)
-        self.queue = LaneVehicleGenerator(self.world, self.inter,
+        self.queue = LaneVehicleGenerator.shared(self.world, self.inter,
                                                      ["lane_waiting_count"], in_only=True,
                                                      negative=False)
-        self.delay = LaneVehicleGenerator(self.world, self.inter,
+        self.delay = LaneVehicleGenerator.shared(self.world, self.inter,
                                                      ["lane_delay"], in_only=True,
                                                      negative=False)
         self.action_space = gym.spaces.Discrete(len(self.inter.phases))
+        self._build_phase_lane_index()
+
+    def _build_phase_lane_index(self):
+        '''
+        _build_phase_lane_index
+        Precompute start lane positions of the intersection and each phase in the world's lane arrays.
 
+        :param: None
+        :return: None
+        '''
+        lane_index = self.world.lane_index
+        self.startlane_idx = np.array([lane_index[lane] for lane in self.inter.startlanes], dtype=np.int64)
+        self.phase_startlane_idx = [np.array([lane_index[lane] for lane in lanes], dtype=np.int64)
+                                    for lanes in self.inter.phase_available_startlanes]
 
     def __repr__(self):
         return 'SOTL Agent has no Network model'
@@ -51,17 +66,18 @@ class SOTLAgent(BaseAgent):
         inter_id = self.world.intersection_ids[self.rank]
         inter_obj = self.world.id2intersection[inter_id]
         self.inter = inter_obj
-        self.ob_generator = LaneVehicleGenerator(self.world, self.inter, ['lane_waiting_count'], in_only=True, average=None)
-        self.phase_generator = IntersectionPhaseGenerator(self.world, self.inter, ["phase"],
+        self.ob_generator = LaneVehicleGenerator.shared(self.world, self.inter, ['lane_waiting_count'], in_only=True, average=None)
+        self.phase_generator = IntersectionPhaseGenerator.shared(self.world, self.inter, ["phase"],
                                                           targets=["cur_phase"], negative=False)
-        self.reward_generator = LaneVehicleGenerator(self.world, self.inter, ["lane_waiting_count"],
+        self.reward_generator = LaneVehicleGenerator.shared(self.world, self.inter, ["lane_waiting_count"],
                                                      in_only=True, average='all', negative=True)
-        self.queue = LaneVehicleGenerator(self.world, self.inter,
+        self.queue = LaneVehicleGenerator.shared(self.world, self.inter,
                                                      ["lane_waiting_count"], in_only=True,
                                                      negative=False)
-        self.delay = LaneVehicleGenerator(self.world, self.inter,
+        self.delay = LaneVehicleGenerator.shared(self.world, self.inter,
                                                      ["lane_delay"], in_only=True,
                                                      negative=False)
+        self._build_phase_lane_index()
 
     def get_phase(self):
         '''
@@ -113,14 +129,13 @@ class SOTLAgent(BaseAgent):
         :param test: boolean, decide whether is test process
         :return action: action that has the highest score
         '''
-        lane_waiting_count = self.world.get_info("lane_waiting_count")
         assert phase[-1] == self.inter.current_phase
         action = self.inter.current_phase
         # Note: we assume current_phase_time always greater than yellow_Phase_time
         if self.inter.current_phase_time >= self.t_min:
-            num_green_vehicles = sum([lane_waiting_count[lane] for
-                                        lane in self.inter.phase_available_startlanes[self.inter.current_phase]])
-            num_red_vehicles = sum([lane_waiting_count[lane] for lane in self.inter.startlanes])
+            lane_waiting_count = self.world.get_lane_array("lane_waiting_count")
+            num_green_vehicles = lane_waiting_count[self.phase_startlane_idx[self.inter.current_phase]].sum()
+            num_red_vehicles = lane_waiting_count[self.startlane_idx].sum()
             num_red_vehicles -= num_green_vehicles
 
             if (num_green_vehicles <= self.min_green_vehicle and num_red_vehicles > self.max_red_vehicle) or ((num_green_vehicles == 0 and num_red_vehicles > 0)):
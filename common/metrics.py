@@ -25,6 +25,9 @@ class Metrics(object):
         self.lane_metrics['rewards'] =  np.array([0 for _ in range(len(self.world.intersections))], dtype=np.float32)
         self.lane_metrics.update({k : np.array([0 for _ in range(len(self.world.intersections))], dtype=np.float32) for k in self.lane_metric_List})
         self.world_metrics = world_metrics
+        if 'delay' not in self.lane_metric_List and 'real_delay' in self.world.info_functions:
+            # real delay needs vehicle trajectories, which are only recorded after subscription
+            self.world.subscribe('real_delay')
 
     def update(self, rewards=None):
         '''
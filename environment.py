@@ -1,5 +1,11 @@
+import os
+import copy
+import multiprocessing as mp
+from concurrent.futures import ThreadPoolExecutor
 import gym
 import numpy as np
+from common.registry import Registry
+from world.traci_pipeline import StepGroup
 
 
 class TSCEnv(gym.Env):
@@ -57,6 +63,74 @@ class TSCEnv(gym.Env):
 
         return obs, rewards, dones, infos
 
+    def step_interval(self, actions, n):
+        """
+        Take the same actions for n steps, e.g. a whole action_interval.
+        Observations are only generated after the last step. If rewards of all agents are linear in lane arrays,
+        they are generated once from the lane arrays averaged over the n steps,
+        otherwise they are accumulated after each step.
+        :param actions: keep action as N_agents * 1
+        :param n: number of steps
+        :return: obs after the last step, rewards averaged over the n steps as np.ndarray [agent, ...], dones, infos
+        """
+        if not actions.shape:
+            assert(self.n_agents == 1)
+            actions = actions[np.newaxis]
+        else:
+            assert len(actions) == self.n_agents
+        reward_fns = self._interval_reward_fns()
+        if reward_fns is not None:
+            lane_means = self.world.step_n(actions, n, mean_fns=reward_fns)
+            obs = [agent.get_ob() for agent in self.agents]
+            # metrics read the last step after this, so its arrays are swapped back
+            lane_state = self.world.swap_lane_state(lane_means)
+            rewards = np.stack([agent.get_reward() for agent in self.agents]).astype(np.float64)
+            self.world.swap_lane_state(lane_state)
+            return obs, rewards, [False] * self.n_agents, {}
+
+        reward_sum = []
+
+        def accumulate_rewards():
+            rewards = np.stack([agent.get_reward() for agent in self.agents])
+            if len(reward_sum) == 0:
+                reward_sum.append(rewards.astype(np.float64))
+            else:
+                reward_sum[0] += rewards
+
+        self.world.step_n(actions, n, on_step=accumulate_rewards)
+        obs = [agent.get_ob() for agent in self.agents]
+        rewards = reward_sum[0] / n
+        dones = [False] * self.n_agents
+        infos = {}
+
+        return obs, rewards, dones, infos
+
+    def _interval_reward_fns(self):
+        """
+        Get the lane infos read by reward generators of all agents, if all rewards are linear in them.
+        :return fns: list of lane info names, None if rewards of some agent must be generated at each step
+        """
+        lane_infos = getattr(self.world, "lane_infos", None)
+        if lane_infos is None:
+            return None
+        fns = []
+        for agent in self.agents:
+            if not agent.linear_reward:
+                return None
+            generators = getattr(agent, "batched_reward_generator", None) or getattr(agent, "reward_generator", None)
+            if generators is None:
+                return None
+            # multi-intersection agents keep (node index, generator) pairs
+            generators = generators if isinstance(generators, list) else [generators]
+            for generator in generators:
+                generator = generator[1] if isinstance(generator, tuple) else generator
+                for fn in generator.fns:
+                    if fn not in lane_infos:
+                        return None
+                    if fn not in fns:
+                        fns.append(fn)
+        return fns
+
     def reset(self):
         self.world.reset()
         if not len(self.agents) == 1:
@@ -65,3 +139,203 @@ class TSCEnv(gym.Env):
         else:
             obs = [self.agents[0].get_ob()]  # [agent==1, sub_agent, feature]
         return obs
+
+
+def create_agents(world):
+    """
+    Create agents of the registered model for a world, the same way as TSCTrainer.create_agents.
+    :param world: World object
+    :return agents: list of agents
+    """
+    agent_cls = Registry.mapping['model_mapping'][Registry.mapping['command_mapping']['setting'].param['agent']]
+    agents = [agent_cls(world, 0)]
+    num_agent = int(len(world.intersections) / agents[0].sub_agents)
+    for i in range(1, num_agent):
+        agents.append(agent_cls(world, i))
+    if Registry.mapping['model_mapping']['setting'].param['name'] == 'magd':
+        for ag in agents:
+            ag.link_agents(agents)
+    return agents
+
+
+def generator_agents(agents):
+    """
+    Create an agent_fn whose agents only generate observations, rewards and phases for another world.
+    Each agent is a shallow copy of a learner, sharing its networks and replay buffer, reset on the new world.
+    :param agents: list of learner agents
+    :return agent_fn: callable taking a world and returning its agents
+    """
+    def agent_fn(world):
+        return [_rebind_agent(ag, world) for ag in agents]
+    return agent_fn
+
+
+def _rebind_agent(agent, world):
+    proxy = copy.copy(agent)
+    proxy.world = world
+    sub_agents = getattr(agent, 'agents', None)
+    # maddpg_v2 keeps its own sub agents there, magd links its peers including itself
+    if isinstance(sub_agents, list) and agent not in sub_agents:
+        proxy.agents = [_rebind_agent(ag, world) for ag in sub_agents]
+    proxy.reset()
+    return proxy
+
+
+def create_sumo_env(name, agent_fn=None):
+    """
+    Create a SUMO world with its own connection name and a TSCEnv over it.
+    :param name: connection name of the world, also the name of its logger sub directory
+    :param agent_fn: None or callable taking the world and returning its agents, None means create_agents
+    :return env: TSCEnv, without metric
+    """
+    param = Registry.mapping['command_mapping']['setting'].param
+    path = os.path.join('configs/sim', param['network'] + '.cfg')
+    world = Registry.mapping['world_mapping']['sumo'](path, param['thread_num'], interface=param['interface'], name=name)
+    agents = (agent_fn or create_agents)(world)
+    env = TSCEnv(world, agents, None)
+    return env
+
+
+def _reset_env(env):
+    obs = env.reset()
+    for ag in env.agents:
+        ag.reset()
+    phases = np.stack([ag.get_phase() for ag in env.agents])
+    # observation lengths differ between intersections with different lane counts, obs stay a per-agent list
+    return obs, phases
+
+
+def _step_env(env, actions, n):
+    obs, rewards, dones, _ = env.step_interval(actions, n)
+    phases = np.stack([ag.get_phase() for ag in env.agents])
+    return obs, rewards, np.array(dones), phases
+
+
+def _sumo_worker(conn, name, agent_fn):
+    """
+    Loop of a worker process owning one libsumo world, libsumo is global in each process.
+    """
+    env = create_sumo_env(name, agent_fn)
+    try:
+        while True:
+            cmd, data = conn.recv()
+            if cmd == "reset":
+                conn.send(_reset_env(env))
+            elif cmd == "step":
+                conn.send(_step_env(env, *data))
+            elif cmd == "close":
+                break
+    finally:
+        env.eng.close()
+        conn.close()
+
+
+class SUMOEnvPool(object):
+    """
+    Pool of SUMO environments stepped concurrently, each one with its own world and agents.
+    With libsumo every environment runs in a forked worker process, since libsumo can only hold
+    one simulation per process. With traci they are labeled connections of this process, each one stepped by
+    its own thread. Their simulation steps are taken in lockstep by a StepGroup, which sends the steps of all
+    environments before waiting on any SUMO server.
+    Parameters
+    ----------
+    num_envs: number of environments
+    interface: None, "libsumo" or "traci", None means the interface of the command setting
+    agent_fn: None or callable taking a world and returning its agents, None means create_agents.
+        Agents are only used to generate observations, rewards and phases of their world,
+        actions are chosen by the caller, e.g. the learner agents of TSCTrainer.
+    prefix: connection names are "<prefix>_<k>"
+    envs: None or list of existing traci environments placed first in the pool, e.g. the trainer's own one.
+        They are counted in num_envs and left running by close.
+    """
+
+    def __init__(self, num_envs, interface=None, agent_fn=None, prefix="pool", envs=None):
+        if interface is None:
+            interface = Registry.mapping['command_mapping']['setting'].param['interface']
+        self.num_envs = num_envs
+        self.use_process = interface == 'libsumo'
+        envs = list(envs or [])
+        if envs and self.use_process:
+            raise ValueError("existing environments can only be pooled with the traci interface")
+        names = ["%s_%d" % (prefix, k) for k in range(len(envs), num_envs)]
+        if self.use_process:
+            # fork keeps the registered config, the main process must not have started libsumo itself
+            ctx = mp.get_context("fork")
+            self.conns, self.processes = [], []
+            for name in names:
+                parent_conn, child_conn = ctx.Pipe()
+                process = ctx.Process(target=_sumo_worker, args=(child_conn, name, agent_fn), daemon=True)
+                process.start()
+                child_conn.close()
+                self.conns.append(parent_conn)
+                self.processes.append(process)
+        else:
+            self.own_envs = [create_sumo_env(name, agent_fn) for name in names]
+            self.envs = envs + self.own_envs
+            # each environment needs its own thread, all of them wait for each other at every simulation step
+            self.executor = ThreadPoolExecutor(max_workers=num_envs)
+            self.step_group = None
+            if all(env.world.traci_client is not None for env in self.envs):
+                self.step_group = StepGroup(num_envs)
+
+    def reset(self):
+        """
+        Reset all environments.
+        :return: obs as list [env] of lists [agent] of np.ndarray [sub_agent, feature],
+            phases as np.ndarray [env, agent, sub_agent]
+        """
+        if self.use_process:
+            for conn in self.conns:
+                conn.send(("reset", None))
+            results = [conn.recv() for conn in self.conns]
+        else:
+            results = list(self.executor.map(_reset_env, self.envs))
+        obs, phases = zip(*results)
+        return list(obs), np.stack(phases)
+
+    def step(self, actions, n=1):
+        """
+        Take actions of each environment for n steps, see TSCEnv.step_interval.
+        :param actions: np.ndarray [env, N_agents]
+        :param n: number of steps
+        :return: obs as list [env] of lists [agent] of [sub_agent, feature], rewards [env, agent, ...], dones [env, N_agents],
+            infos with "phase" [env, agent, sub_agent]
+        """
+        if self.use_process:
+            for conn, env_actions in zip(self.conns, actions):
+                conn.send(("step", (env_actions, n)))
+            results = [conn.recv() for conn in self.conns]
+        else:
+            # worlds are only grouped while the pool steps them, e.g. the trainer still tests its own one alone
+            for env in self.envs:
+                env.world.step_group = self.step_group
+            try:
+                results = list(self.executor.map(self._step_thread, self.envs, actions, [n] * self.num_envs))
+            finally:
+                for env in self.envs:
+                    env.world.step_group = None
+        obs, rewards, dones, phases = zip(*results)
+        return list(obs), np.stack(rewards), np.stack(dones), {"phase": np.stack(phases)}
+
+    def _step_thread(self, env, actions, n):
+        try:
+            return _step_env(env, actions, n)
+        except BaseException:
+            # the other environments would wait for this one forever
+            if self.step_group is not None:
+                self.step_group.abort()
+            raise
+
+    def close(self):
+        """
+        Stop all SUMO instances started by the pool, existing environments keep running.
+        """
+        if self.use_process:
+            for conn in self.conns:
+                conn.send(("close", None))
+            for process in self.processes:
+                process.join()
+        else:
+            self.executor.shutdown()
+            for env in self.own_envs:
+                env.eng.close()
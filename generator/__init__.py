@@ -1,4 +1,5 @@
 from .base import BaseGenerator
 from .lane_vehicle import LaneVehicleGenerator
 from .intersection_vehicle import IntersectionVehicleGenerator
-from .intersection_phase import IntersectionPhaseGenerator
\ No newline at end of file
+from .intersection_phase import IntersectionPhaseGenerator
+from .batched_lane import BatchedLaneGenerator
\ No newline at end of file
@@ -1,3 +1,6 @@
+import numpy as np
+
+
 class BaseGenerator(object):
     '''
     Generate state or reward based on current simulation state.
@@ -5,10 +8,81 @@ class BaseGenerator(object):
     def generate(self):
         '''
         generate
-        Generate state or reward based on current simulation state. 
+        Generate state or reward based on current simulation state.
         Different types of generators have different methods to implement it.
-        
+
         :param: None
         :return: None
         '''
-        raise NotImplementedError()
\ No newline at end of file
+        raise NotImplementedError()
+
+    @classmethod
+    def shared(cls, world, *args, **kwargs):
+        '''
+        shared
+        Get the generator of these arguments from the world's generator registry, create it on first request.
+        Agents and metrics asking for the same statistics share one instance, whose output is computed once per step.
+
+        :param world: World object
+        :param args: arguments of the generator after world, e.g. I and fns
+        :param kwargs: keyword arguments of the generator, e.g. in_only, average and negative
+        :return generator: SharedGenerator
+        '''
+        key = (cls.__name__, _registry_key(args), _registry_key(sorted(kwargs.items())))
+        if key not in world.generator_registry:
+            world.generator_registry[key] = SharedGenerator(cls(world, *args, **kwargs))
+        return world.generator_registry[key]
+
+
+def _registry_key(value):
+    # intersections are keyed by id, lists (e.g. fns) by their hashable tuple form
+    if isinstance(value, (list, tuple)):
+        return tuple(_registry_key(v) for v in value)
+    if hasattr(value, "id"):
+        return ("I", value.id)
+    return value
+
+
+def _copy_output(value):
+    # callers keep or modify results, so each of them gets its own copy of the cached output
+    if isinstance(value, np.ndarray):
+        return value.copy()
+    if isinstance(value, tuple):
+        return tuple(_copy_output(v) for v in value)
+    if isinstance(value, list):
+        return list(value)
+    return value
+
+
+class SharedGenerator(BaseGenerator):
+    '''
+    Generator of the world's generator registry, see BaseGenerator.shared.
+    Its output is memoized until the world updates its information, i.e. the next step or reset.
+    Other attributes, e.g. ob_length and I, are those of the wrapped generator.
+
+    :param generator: generator to share
+    '''
+    def __init__(self, generator):
+        self.generator = generator
+        self.version = None
+        self.output = None
+
+    def __getattr__(self, name):
+        # only called for attributes not set in __init__, also before it when copied or unpickled
+        if "generator" not in self.__dict__:
+            raise AttributeError(name)
+        return getattr(self.__dict__["generator"], name)
+
+    def generate(self):
+        '''
+        generate
+        Generate state or reward based on current simulation state, computed at most once per step.
+
+        :param: None
+        :return: output of the wrapped generator
+        '''
+        version = self.generator.world.info_version
+        if self.version != version:
+            self.output = self.generator.generate()
+            self.version = version
+        return _copy_output(self.output)
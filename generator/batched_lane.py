@@ -0,0 +1,102 @@
+import numpy as np
+from . import BaseGenerator
+from .lane_vehicle import LaneVehicleGenerator
+
+
+class BatchedLaneGenerator(BaseGenerator):
+    '''
+    Generate state or reward of all given intersections at once based on statistics of lane vehicles.
+    Row i equals LaneVehicleGenerator(world, intersections[i], ...).generate() padded with zeros to the longest row,
+    and is computed with one gather per statistic from the world's lane arrays.
+
+    :param world: World object
+    :param intersections: list of Intersection objects, their order defines rows of the output
+    :param fns: list of statistics to get, see LaneVehicleGenerator
+    :param in_only: boolean, whether to compute incoming lanes only.
+    :param average: None or str, see LaneVehicleGenerator
+    :param negative: boolean, whether return negative values (mostly for Reward).
+    '''
+    def __init__(self, world, intersections, fns, in_only=False, average=None, negative=False):
+        self.world = world
+        self.intersections = intersections
+        self.fns = fns
+        self.average = average
+        self.negative = negative
+        # lane order, result dimensions and subscription of each row are the same as the single generator
+        self.generators = [LaneVehicleGenerator(world, I, fns, in_only=in_only, average=average, negative=negative)
+                           for I in intersections]
+
+        self.ob_lengths = np.array([g.output_length for g in self.generators], dtype=np.int64)
+        self.ob_length = int(self.ob_lengths.max()) if len(self.generators) else 0
+        rows = len(self.generators)
+        # validity mask: padding of rows and zeros padding results of 2 or 3 values to 4 are invalid
+        result_lengths = np.array([g.result_length for g in self.generators], dtype=np.int64)
+        self.mask = np.arange(self.ob_length)[None, :] < result_lengths[:, None]
+
+        # gather plan of each fn on the flattened [N, F] output
+        # lanes: lane indices of all rows concatenated, roads: road segments of these lanes across rows
+        self.plan = []
+        for k, fn in enumerate(fns):
+            starts = np.array([g.plan[k][1] for g in self.generators], dtype=np.int64)
+            row_offset = np.arange(rows, dtype=np.int64) * self.ob_length + starts
+            if fn not in world.lane_infos:
+                self.plan.append((fn, row_offset))
+                continue
+            if average is None:
+                lanes = np.concatenate([g.lane_idx for g in self.generators] + [np.zeros(0, dtype=np.int64)])
+                dest = np.concatenate([row_offset[i] + np.arange(len(g.lane_idx), dtype=np.int64)
+                                       for i, g in enumerate(self.generators)] + [np.zeros(0, dtype=np.int64)])
+                self.plan.append((fn, (lanes, dest)))
+                continue
+            lanes, lane_road, road_sizes, road_row, road_col = [], [], [], [], []
+            for i, g in enumerate(self.generators):
+                for n, road_lanes in enumerate(g.lanes):
+                    lane_road += [len(road_sizes)] * len(road_lanes)
+                    road_sizes.append(len(road_lanes))
+                    road_row.append(i)
+                    road_col.append(row_offset[i] + n)
+                lanes.append(g.lane_idx)
+            lanes = np.concatenate(lanes + [np.zeros(0, dtype=np.int64)])
+            road_sizes = np.array(road_sizes, dtype=np.float32)
+            road_row = np.array(road_row, dtype=np.int64)
+            # roads without lanes average to nan as np.mean does
+            road_sizes[road_sizes == 0] = np.nan
+            roads_per_row = np.bincount(road_row, minlength=rows).astype(np.float32)
+            self.plan.append((fn, (lanes, np.array(lane_road, dtype=np.int64), road_sizes,
+                                   np.array(road_col, dtype=np.int64), road_row, roads_per_row, row_offset)))
+
+    def generate(self):
+        '''
+        generate
+        Generate state or reward of all intersections based on current simulation state.
+
+        :param: None
+        :return ret: [N, F] float32 state or reward, N is the number of intersections
+        :return mask: [N, F] boolean, whether each entry is valid
+        '''
+        # a new array each call, agents keep observations and rewards
+        ret = np.zeros((len(self.generators), self.ob_length), dtype=np.float32)
+        flat = ret.reshape(-1)
+        for fn, plan in self.plan:
+            if fn not in self.world.lane_infos:
+                # results of intersections (e.g. pressure) have one value
+                result = self.world.get_info(fn)
+                flat[plan] = [result[I.id] for I in self.intersections]
+                continue
+            lane_array = self.world.get_lane_array(fn)
+            if self.average is None:
+                lanes, dest = plan
+                flat[dest] = lane_array[lanes]
+                continue
+            lanes, lane_road, road_sizes, road_col, road_row, roads_per_row, row_offset = plan
+            # segment sum over lanes of each road of every row at once
+            road_means = np.bincount(lane_road, weights=lane_array[lanes],
+                                     minlength=len(road_sizes)).astype(np.float32) / road_sizes
+            if self.average == "road":
+                flat[road_col] = road_means
+            else:
+                flat[row_offset] = np.bincount(road_row, weights=road_means,
+                                               minlength=len(roads_per_row)) / roads_per_row
+        if self.negative:
+            np.negative(ret, out=ret, where=self.mask)
+        return ret, self.mask
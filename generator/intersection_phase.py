@@ -1,7 +1,7 @@
-# from .base import BaseGenerator
+from .base import BaseGenerator
 
 
-class IntersectionPhaseGenerator():
+class IntersectionPhaseGenerator(BaseGenerator):
     '''
     Generate state or reward based on statistics of intersection phases.
 
@@ -1,9 +1,9 @@
 import numpy as np
-import math
-# from .base import BaseGenerator
+from itertools import chain
+from .base import BaseGenerator
 
 
-class IntersectionVehicleGenerator():
+class IntersectionVehicleGenerator(BaseGenerator):
     '''
     Generate state or reward based on statistics of intersection vehicles.
 
@@ -18,9 +18,11 @@ class IntersectionVehicleGenerator():
                                                            "cur_phase": current phase of the intersection (not before yellow phase). 
              See section 4.2 of the intelliLight paper[Hua Wei et al, KDD'18] for more detailed description on these targets.
     :param negative: boolean, whether return negative values (mostly for Reward).
+    :param sparse_map: boolean, whether "vehicle_map" returns [2, num_occupied_grids] (row, column) coordinates of
+        occupied grids (COO format) instead of the dense grid.
     :param time_interval: use to calculate
     '''
-    def __init__(self, world, I, fns=("vehicle_trajectory", "lane_vehicles", "history_vehicles", "vehicle_distance"), targets=("vehicle_map"), negative=False):
+    def __init__(self, world, I, fns=("vehicle_trajectory", "lane_vehicles", "history_vehicles", "vehicle_distance"), targets=("vehicle_map"), negative=False, sparse_map=False):
         self.world = world
         self.I = I
 
@@ -42,6 +44,28 @@ class IntersectionVehicleGenerator():
         self.all_lanes = [n for a in self.lanes for n in a ]
         self.all_in_lanes = [n for a in self.in_lanes for n in a]
 
+        # rasterizer tables of self.all_lanes, see get_vehicle_position:
+        # starting point of the lane's road, axis vehicles move along (0 x-axis, 1 y-axis) and sign of the direction
+        lane_origin, lane_axis, lane_sign = [], [], []
+        for road, road_lanes in zip(roads, self.lanes):
+            # 0 right, 1 up, 2 left, 3 down
+            direction_code = int(road["id"][-1])
+            for _ in road_lanes:
+                lane_origin.append([road["points"][0]["x"], road["points"][0]["y"]])
+                lane_axis.append(direction_code % 2)
+                lane_sign.append(1. if direction_code < 2 else -1.)
+        self.lane_origin = np.array(lane_origin, dtype=np.float64).reshape(-1, 2)
+        self.lane_axis = np.array(lane_axis, dtype=np.int64)
+        self.lane_sign = np.array(lane_sign, dtype=np.float64)
+
+        # the length and width of current intersection
+        # TODO get the length and width from RoadNet file
+        self.area_length = 600
+        self.area_width = 600
+        self.grid_width = 4 # hyper parameter, decides the density of the grid
+        self.length_num_grids = int(self.area_length / self.grid_width)
+        self.sparse_map = sparse_map
+
         # print(self.all_lanes)
         # print(self.all_in_lanes)
 
@@ -59,59 +83,33 @@ class IntersectionVehicleGenerator():
 
         self.negative = negative
 
-    def if_vehicle_passed_intersection(self, vehicle_trajectory, current_time, action_interval):
-        '''
-        if_vehicle_passed_intersection
-        Judge whether a vehicle passes through intersection during time interval ∆t after the last action.
-        
-        :param vehicle_trajectory: trajectory of a vehicle
-        :param current_time: current time of simulation
-        :param action_interval: time duration between change actions
-        :return result: boolean, whether the vehicle passes through intersection
-        '''
-        def get_target_trajectory(trajectory, last_time, current_time):
-            target = []
-
-            if len(trajectory) == 0:
-                return target
-
-            if trajectory[-1][1] + trajectory[-1][2] < current_time and trajectory[-1][1] + trajectory[-1][2] > last_time: # means this vehicle left the simulator or currently in an intersection in this period
-                target.append(trajectory[-1])
-                target.append(['left'])
-                return target
+        # exits from in-lanes of this intersection are recorded as they happen, see get_passed_events
+        self.passed_events = None
+        if "passed_count" in targets or "passed_time_count" in targets:
+            self.passed_events = self.world.get_lane_exit_events().register(self.all_in_lanes)
 
-            for i, traj in enumerate(trajectory):
-                if traj[1] > last_time:
-                    target.append(traj)
-                    if traj[1] - traj[2] > last_time and i > 0:
-                        target.append(trajectory[i - 1])
-
-            return target
-        last_time = current_time - action_interval
-
-        current_trajectory = get_target_trajectory(vehicle_trajectory, last_time, current_time)
-        for i in range(len(current_trajectory)):
-            if current_trajectory[i][0] in self.all_in_lanes:
-                if i + 1 < len(current_trajectory):
-                    return 1
-        return 0
+    def get_passed_events(self):
+        '''
+        get_passed_events
+        Get exits from in-lanes of the intersection during time interval ∆t after the last action.
+        Only events in the interval are visited. An exit is in the interval if the vehicle was last seen on the in-lane
+        at or after the last action.
 
+        :param: None
+        :return events: list of (time, time spent on the in-lane, vehicle id)
+        '''
+        last_time = self.time - self.action_interval
+        return self.world.lane_exit_events.since(self.passed_events, last_time)
 
     def get_passed_vehicles(self, fns):
         '''
         get_passed_vehicles
-        Get the total number of vehicles that pass through intersections.
+        Get vehicles that pass through the intersection during time interval ∆t after the last action.
         
         :param fns: information of current intersection, including vehicle_trajectory, lane_vehicles, etc
-        :return passed_vehicles: the number of vehicles that pass through intersections.
+        :return passed_vehicles: ids of vehicles that pass through the intersection.
         '''
-        vehicle_trajectory = fns["vehicle_trajectory"]
-        history_vehicles = fns["history_vehicles"]
-
-        passed_vehicles = []
-        for vehicle in history_vehicles:
-            if self.if_vehicle_passed_intersection(vehicle_trajectory[vehicle], current_time=self.time, action_interval=self.action_interval):
-                passed_vehicles.append(vehicle)
+        passed_vehicles = list(dict.fromkeys(vehicle for _, _, vehicle in self.get_passed_events()))
         return passed_vehicles
 
 
@@ -157,17 +155,14 @@ class IntersectionVehicleGenerator():
         '''
         passed_time_count
         Get the total time (in minutes) spent on approaching lanes of vehicles that passed the intersection during time interval ∆t after the last action.
+        The time of a vehicle is that spent on the in-lane it left last.
         
         :param fns: information of current intersection, including vehicle_trajectory, lane_vehicles, etc
         :return passed_time_count: the total time
         '''
-        vehicle_trajectory = fns["vehicle_trajectory"]
-        passed_vehicles = self.get_passed_vehicles(fns)
-        # for i in passed_vehicles:
-        #     print(vehicle_trajectory[i])
-        passed_time_count = 0
-        for vehicle in passed_vehicles:
-            passed_time_count += vehicle_trajectory[vehicle][-2][2]
+        # time spent on the in-lane it left last, for each passed vehicle
+        passed_durations = {vehicle: duration for _, duration, vehicle in self.get_passed_events()}
+        passed_time_count = sum(passed_durations.values())
         return passed_time_count
 
 
@@ -175,39 +170,40 @@ class IntersectionVehicleGenerator():
         '''
         vehicle_map
         Get the location of vehicles in the roadnet.
+        All vehicles are rasterized at once from their lanes and distances, vehicles outside the area are ignored.
         
         :param fns: information of current intersection, including vehicle_trajectory, lane_vehicles, etc
-        :return mapOfCars: matrix that record location of all vehicles appearing in the road network
+        :return mapOfCars: matrix that record location of all vehicles appearing in the road network,
+            if sparse_map, [2, num_occupied_grids] coordinates of occupied grids.
         '''
-        def vehicle_location_mapper(coordinate, area_length, area_width):
-            transformX = math.floor((coordinate[0] + area_length / 2) / grid_width)
-            length_width_map = float(area_length) / area_width
-            transformY = math.floor((coordinate[1] + area_width / 2) * length_width_map / grid_width)
-            length_num_grids = int(area_length / grid_width)
-            transformY = length_num_grids - 1 if transformY == length_num_grids else transformY
-            transformX = length_num_grids - 1 if transformX == length_num_grids else transformX
-            tempTransformTuple = (transformY, transformX)
-            return tempTransformTuple
-
-        # the length and width of current intersection
-        # TODO get the length and width from RoadNet file
-        area_length = 600
-        area_width = 600
-        grid_width = 4 # hyper parameter, decides the density of the grid
-
-        length_num_grids = int(area_length / grid_width)
-        mapOfCars = np.zeros((length_num_grids, length_num_grids))
-
         vehicle_distance = fns["vehicle_distance"]
         lane_vehicles = fns["lane_vehicles"]
-        for lane in self.all_lanes:
-            for vehicle in lane_vehicles[lane]:
-                distance = vehicle_distance[vehicle]
-                vehicle_position = self.get_vehicle_position(distance, lane)  # (double,double),tuple
-                if vehicle_position is None:
-                    continue
-                transform_tuple = vehicle_location_mapper(vehicle_position, area_length, area_width)  # transform the coordinates to location in grid
-                mapOfCars[transform_tuple[0], transform_tuple[1]] = 1
+        lists = [lane_vehicles[lane] for lane in self.all_lanes]
+        lane_vehicle_count = np.fromiter(map(len, lists), dtype=np.int64, count=len(lists))
+        vehicle_lane = np.repeat(np.arange(len(lists)), lane_vehicle_count)
+        distance = np.fromiter(map(vehicle_distance.__getitem__, chain.from_iterable(lists)),
+                               dtype=np.float64, count=len(vehicle_lane))
+
+        # positions along the road from its starting point, distances are truncated to meters
+        position = self.lane_origin[vehicle_lane]
+        position[np.arange(len(vehicle_lane)), self.lane_axis[vehicle_lane]] += \
+            self.lane_sign[vehicle_lane] * np.trunc(distance)
+
+        # transform the coordinates to location in grid
+        length_num_grids = self.length_num_grids
+        length_width_map = float(self.area_length) / self.area_width
+        grid_x = np.floor((position[:, 0] + self.area_length / 2) / self.grid_width).astype(np.int64)
+        grid_y = np.floor((position[:, 1] + self.area_width / 2) * length_width_map / self.grid_width).astype(np.int64)
+        grid_x[grid_x == length_num_grids] = length_num_grids - 1
+        grid_y[grid_y == length_num_grids] = length_num_grids - 1
+        inside = (grid_x >= 0) & (grid_x < length_num_grids) & (grid_y >= 0) & (grid_y < length_num_grids)
+        grid_x, grid_y = grid_x[inside], grid_y[inside]
+
+        if self.sparse_map:
+            occupied = np.unique(grid_y * length_num_grids + grid_x)
+            return np.stack(np.divmod(occupied, length_num_grids))
+        mapOfCars = np.zeros((length_num_grids, length_num_grids))
+        mapOfCars[grid_y, grid_x] = 1
         return mapOfCars
 
     def cur_phase(self,fns):
@@ -116,6 +116,17 @@ class LaneVehicleGenerator(BaseGenerator):
         else:
             raise Exception('NOT IMPLEMENTED YET')
 
+        # precompute positions of lanes in the world's lane arrays, lanes of each road are contiguous
+        self.lane_idx = np.array([self.world.lane_index[lane] for road_lanes in self.lanes for lane in road_lanes],
+                                 dtype=np.int64)
+        road_sizes = np.array([len(road_lanes) for road_lanes in self.lanes], dtype=np.int64)
+        # segment-reduction plan of road averages, np.add.reduceat needs non-empty segments
+        self.nonempty_roads = road_sizes > 0
+        self.all_roads_nonempty = bool(self.nonempty_roads.all())
+        self.road_starts = (np.cumsum(road_sizes) - road_sizes)[self.nonempty_roads]
+        self.road_sizes = road_sizes[self.nonempty_roads].astype(np.float32)
+        self.road_means = np.full(len(self.lanes), np.nan, dtype=np.float32)
+
         # subscribe functions
         self.world.subscribe(fns)
         self.fns = fns
@@ -133,6 +144,16 @@ class LaneVehicleGenerator(BaseGenerator):
         self.average = average
         self.negative = negative
 
+        # gather plan: each fn fills output[start:end], results of intersections (e.g. pressure) have one value
+        self.plan = []
+        end = 0
+        for fn in fns:
+            start, end = end, end + (size if fn in self.world.lane_infos else 1)
+            self.plan.append((fn, start, end))
+        self.result_length = end
+        # results of 2 or 3 values are padded with zeros to 4
+        self.output_length = 4 if end in (2, 3) else end
+
     def generate(self):
         '''
         generate
@@ -141,45 +162,32 @@ class LaneVehicleGenerator(BaseGenerator):
         :param: None
         :return ret: state or reward
         '''
-        results = [self.world.get_info(fn) for fn in self.fns]
-
-        #need modification here
-
-        ret = np.array([])
-        for i in range(len(self.fns)):
-            result = results[i]
-
+        # a new array each call, agents keep observations and rewards
+        ret = np.zeros(self.output_length, dtype=np.float32)
+        for fn, start, end in self.plan:
             # pressure returns result of each intersections, so return directly
-            if self.I.id in result:
-                ret = np.append(ret, result[self.I.id])
+            if fn not in self.world.lane_infos:
+                ret[start:end] = self.world.get_info(fn)[self.I.id]
                 continue
-            fn_result = np.array([])
-
-            for road_lanes in self.lanes:
-                road_result = []
-                for lane_id in road_lanes:
-                    road_result.append(result[lane_id])
-                if self.average == "road" or self.average == "all":
-                    road_result = np.mean(road_result)
-                else:
-                    road_result = np.array(road_result)
-                fn_result = np.append(fn_result, road_result)
-            
+
+            # gather lanes of this intersection from the world's lane array
+            fn_result = self.world.get_lane_array(fn)[self.lane_idx]
+            if self.average is None:
+                ret[start:end] = fn_result
+                continue
+            # road averages: one segment sum over the contiguous lanes of each road
+            road_means = ret[start:end] if self.average == "road" else self.road_means
+            if self.all_roads_nonempty:
+                np.add.reduceat(fn_result, self.road_starts, out=road_means)
+                road_means /= self.road_sizes
+            else:
+                # roads without lanes average to nan as np.mean does
+                road_means[:] = np.nan
+                road_means[self.nonempty_roads] = np.add.reduceat(fn_result, self.road_starts) / self.road_sizes
             if self.average == "all":
-                fn_result = np.mean(fn_result)
-            ret = np.append(ret, fn_result)
+                ret[start] = np.mean(road_means)
         if self.negative:
-            ret = ret * (-1)
-        origin_ret = ret
-        if len(ret) == 3:
-            ret_list = list(ret)
-            ret_list.append(0)
-            ret = np.array(ret_list)
-        if len(ret) == 2:
-            ret_list = list(ret)
-            ret_list.append(0)
-            ret_list.append(0)
-            ret = np.array(ret_list)
+            np.negative(ret[:self.result_length], out=ret[:self.result_length])
         return ret
 
 if __name__ == "__main__":
@@ -20,6 +20,7 @@ parser.add_argument('--seed', type=int, default=None, help="seed for pytorch bac
 parser.add_argument('--debug', type=bool, default=True)
 parser.add_argument('--interface', type=str, default="libsumo", choices=['libsumo','traci'], help="interface type") # libsumo(fast) or traci(slow)
 parser.add_argument('--delay_type', type=str, default="apx", choices=['apx','real'], help="method of calculating delay") # apx(approximate) or real
+parser.add_argument('--num_envs', type=int, default=1, help="number of SUMO environments collecting experience for the agents") # needs traci
 
 parser.add_argument('-t', '--task', type=str, default="tsc", help="task type to run")
 parser.add_argument('-a', '--agent', type=str, default="dqn", help="agent type of agents in RL environment")
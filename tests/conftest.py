@@ -0,0 +1,5 @@
+import os
+import sys
+
+# tests import the packages of the repository root, e.g. world and generator
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,139 @@
+import os
+import types
+
+import numpy as np
+import pytest
+
+pytest.importorskip("gym")
+# the world package imports both simulators
+pytest.importorskip("cityflow")
+pytest.importorskip("libsumo")
+if "SUMO_HOME" not in os.environ:
+    pytest.skip("world needs SUMO_HOME", allow_module_level=True)
+
+import gym
+from common.registry import Registry
+from environment import SUMOEnvPool, create_sumo_env, generator_agents
+from generator import LaneVehicleGenerator, IntersectionPhaseGenerator
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+class PoolAgent(object):
+    # the agent package needs torch, this one only generates observations, rewards and phases like BaseAgent
+    linear_reward = True
+
+    def __init__(self, world, rank):
+        self.world = world
+        self.rank = rank
+        self.sub_agents = 1
+        # stands in for the networks a learner holds
+        self.model = object()
+        self.reset()
+
+    def reset(self):
+        self.inter = self.world.id2intersection[self.world.intersection_ids[self.rank]]
+        self.ob_generator = LaneVehicleGenerator(self.world, self.inter, ["lane_count"], in_only=True)
+        self.phase_generator = IntersectionPhaseGenerator(self.world, self.inter, ["phase"], targets=["cur_phase"])
+        self.reward_generator = LaneVehicleGenerator(self.world, self.inter, ["lane_waiting_count"],
+                                                     in_only=True, average="all", negative=True)
+        self.action_space = gym.spaces.Discrete(len(self.inter.phases))
+
+    def get_ob(self):
+        return np.array([self.ob_generator.generate()], dtype=np.float32)
+
+    def get_reward(self):
+        return np.squeeze(np.array([self.reward_generator.generate()]))
+
+    def get_phase(self):
+        return np.concatenate([self.phase_generator.generate()]).astype(np.int8)
+
+
+def make_agents(world):
+    return [PoolAgent(world, i) for i in range(len(world.intersections))]
+
+
+@pytest.fixture
+def sumo_setting(tmp_path, monkeypatch):
+    monkeypatch.chdir(ROOT)
+    setting = types.SimpleNamespace(param={"network": "sumo1x1", "thread_num": 1, "interface": "traci"})
+    monkeypatch.setitem(Registry.mapping["command_mapping"], "setting", setting)
+    monkeypatch.setitem(Registry.mapping["logger_mapping"], "path", types.SimpleNamespace(path=str(tmp_path)))
+    return setting
+
+
+def test_pool_thread_path_reset_step_close(sumo_setting):
+    pool = SUMOEnvPool(2, interface="traci", agent_fn=make_agents, prefix="test_pool")
+    try:
+        assert not pool.use_process and pool.step_group is not None
+        obs, phases = pool.reset()
+        num_agents = len(pool.envs[0].agents)
+        assert len(obs) == 2 and all(len(o) == num_agents for o in obs)
+        assert phases.shape[:2] == (2, num_agents)
+
+        for _ in range(3):
+            actions = np.ones((2, num_agents), dtype=np.int64)
+            obs, rewards, dones, infos = pool.step(actions, n=10)
+        assert len(obs) == 2 and infos["phase"].shape[:2] == (2, num_agents)
+        assert rewards.shape[:2] == (2, num_agents) and dones.shape == (2, num_agents)
+        # identical simulations under identical actions
+        for a, b in zip(obs[0], obs[1]):
+            np.testing.assert_array_equal(a, b)
+        np.testing.assert_array_equal(rewards[0], rewards[1])
+        assert sum(o.sum() for o in obs[0]) > 0
+        # worlds are only grouped during a pool step
+        assert all(env.world.step_group is None for env in pool.envs)
+    finally:
+        pool.close()
+
+
+def test_pool_heterogeneous_lane_counts(sumo_setting):
+    # cologne3 intersections have different numbers of in-lanes
+    sumo_setting.param["network"] = "sumo1x3"
+    pool = SUMOEnvPool(2, interface="traci", agent_fn=make_agents, prefix="test_pool")
+    try:
+        obs, phases = pool.reset()
+        assert len({o.shape[-1] for o in obs[0]}) > 1
+        actions = np.zeros((2, len(obs[0])), dtype=np.int64)
+        obs, rewards, dones, infos = pool.step(actions, n=10)
+        assert len(obs) == 2 and [o.shape for o in obs[0]] == [o.shape for o in obs[1]]
+        assert rewards.shape[:2] == (2, len(obs[0]))
+    finally:
+        pool.close()
+
+
+def test_pool_with_existing_env(sumo_setting):
+    env = create_sumo_env("test_learner", make_agents)
+    pool = SUMOEnvPool(2, interface="traci", agent_fn=make_agents, prefix="test_pool", envs=[env])
+    try:
+        assert pool.envs[0] is env and len(pool.envs) == 2
+        pool.reset()
+        actions = np.zeros((2, len(env.agents)), dtype=np.int64)
+        obs, rewards, _, _ = pool.step(actions, n=10)
+        for a, b in zip(obs[0], obs[1]):
+            np.testing.assert_array_equal(a, b)
+    finally:
+        pool.close()
+    # the existing environment is left running and steps alone
+    obs, rewards, _, _ = env.step_interval(actions[0], 10)
+    assert len(obs) == len(env.agents)
+    env.eng.close()
+
+
+def test_pool_generator_agents(sumo_setting):
+    env = create_sumo_env("test_learner", make_agents)
+    pool = SUMOEnvPool(2, interface="traci", agent_fn=generator_agents(env.agents), prefix="test_pool", envs=[env])
+    try:
+        world = pool.envs[1].world
+        for learner, ag in zip(env.agents, pool.envs[1].agents):
+            assert ag is not learner and ag.world is world and ag.ob_generator.world is world
+            assert ag.model is learner.model
+        assert all(ag.world is env.world for ag in env.agents)
+        pool.reset()
+        actions = np.zeros((2, len(env.agents)), dtype=np.int64)
+        obs, rewards, _, _ = pool.step(actions, n=10)
+        for a, b in zip(obs[0], obs[1]):
+            np.testing.assert_array_equal(a, b)
+    finally:
+        pool.close()
+    env.eng.close()
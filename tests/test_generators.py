@@ -0,0 +1,128 @@
+import os
+
+import numpy as np
+import pytest
+
+# the world package imports both simulators
+pytest.importorskip("cityflow")
+pytest.importorskip("libsumo")
+if "SUMO_HOME" not in os.environ:
+    pytest.skip("world needs SUMO_HOME", allow_module_level=True)
+
+from generator import BaseGenerator, IntersectionVehicleGenerator
+
+
+class FakeWorld(object):
+    RIGHT = True
+
+    def __init__(self):
+        self.info_version = 0
+        self.generator_registry = {}
+
+    def subscribe(self, fns):
+        pass
+
+
+class FakeIntersection(object):
+    def __init__(self, roads):
+        self.id = "intersection_1_1"
+        self.current_phase = 0
+        self.roads = roads
+
+
+def make_road(road_id, x, y):
+    # the last digit of a road id is its direction: 0 right, 1 up, 2 left, 3 down
+    return {"id": road_id, "startIntersection": "intersection_1_1", "endIntersection": "intersection_2_1",
+            "points": [{"x": x, "y": y}], "lanes": [{}, {}]}
+
+
+def make_generator():
+    roads = [make_road("road_1_1_0", 0, 0), make_road("road_1_1_2", -290, 0)]
+    return IntersectionVehicleGenerator(FakeWorld(), FakeIntersection(roads), targets=["vehicle_map"])
+
+
+def test_vehicle_map_drops_vehicles_outside_area():
+    generator = make_generator()
+    fns = {
+        # inside, beyond the right edge and beyond the left edge of the 600m area
+        "lane_vehicles": {"road_1_1_0_0": ["inside", "right"], "road_1_1_0_1": [],
+                          "road_1_1_2_0": ["left"], "road_1_1_2_1": []},
+        "vehicle_distance": {"inside": 10.5, "right": 1000., "left": 100.},
+    }
+    result = generator.vehicle_map(fns)
+
+    expected = np.zeros((150, 150))
+    expected[150 // 2, (0 + 10 + 300) // 4] = 1
+    assert result.dtype == np.float64
+    np.testing.assert_array_equal(result, expected)
+
+
+def test_vehicle_map_returns_new_array():
+    generator = make_generator()
+    fns = {"lane_vehicles": {"road_1_1_0_0": ["a"], "road_1_1_0_1": [], "road_1_1_2_0": [], "road_1_1_2_1": []},
+           "vehicle_distance": {"a": 10.}}
+    first = generator.vehicle_map(fns)
+    fns["vehicle_distance"]["a"] = 50.
+    second = generator.vehicle_map(fns)
+    assert first is not second
+    assert first[75, 77] == 1 and second[75, 77] == 0
+
+
+def test_sparse_vehicle_map_matches_dense():
+    generator = make_generator()
+    fns = {"lane_vehicles": {"road_1_1_0_0": ["a", "b"], "road_1_1_0_1": ["c"], "road_1_1_2_0": ["d"],
+                             "road_1_1_2_1": []},
+           "vehicle_distance": {"a": 10., "b": 12., "c": 200., "d": 3.}}
+    dense = generator.vehicle_map(fns)
+    generator.sparse_map = True
+    rows, cols = generator.vehicle_map(fns)
+    np.testing.assert_array_equal(np.stack(np.nonzero(dense)), np.stack([rows, cols]))
+
+
+class CountingGenerator(BaseGenerator):
+    def __init__(self, world, I, fns, negative=False):
+        self.world = world
+        self.I = I
+        self.fns = fns
+        self.negative = negative
+        self.ob_length = 3
+        self.calls = 0
+
+    def generate(self):
+        self.calls += 1
+        ret = np.full(3, float(self.calls), dtype=np.float32)
+        return (-ret if self.negative else ret), [self.calls]
+
+
+def test_shared_generator_registry():
+    world = FakeWorld()
+    I = FakeIntersection([])
+    generator = CountingGenerator.shared(world, I, ["lane_count"])
+    # the same arguments share an instance, intersections are keyed by id
+    assert CountingGenerator.shared(world, FakeIntersection([]), ["lane_count"]) is generator
+    assert CountingGenerator.shared(world, I, ["lane_count"], negative=True) is not generator
+    assert CountingGenerator.shared(world, I, ["lane_waiting_count"]) is not generator
+    # attributes of the wrapped generator
+    assert generator.ob_length == 3 and generator.fns == ["lane_count"]
+
+
+def test_shared_generator_recomputes_after_info_version_bump():
+    world = FakeWorld()
+    generator = CountingGenerator.shared(world, FakeIntersection([]), ["lane_count"])
+    first, first_list = generator.generate()
+    second, second_list = generator.generate()
+    assert generator.calls == 1
+    np.testing.assert_array_equal(first, second)
+
+    # callers get copies of the cached output
+    assert first is not second and first_list is not second_list
+    first[:] = -1
+    first_list.append(0)
+    third, third_list = generator.generate()
+    np.testing.assert_array_equal(third, np.ones(3))
+    assert third_list == [1]
+
+    world.info_version += 1
+    fourth, _ = generator.generate()
+    assert generator.calls == 2
+    np.testing.assert_array_equal(fourth, np.full(3, 2.))
@@ -0,0 +1,186 @@
+import os
+import random
+
+import numpy as np
+import pytest
+
+# the world package imports both simulators
+pytest.importorskip("cityflow")
+pytest.importorskip("libsumo")
+if "SUMO_HOME" not in os.environ:
+    pytest.skip("world needs SUMO_HOME", allow_module_level=True)
+
+from world.utils import VehicleTracker, TrajectoryStore, RealDelayAccumulator, LaneExitEvents
+
+LANES = ["road_%d_0" % i for i in range(6)]
+LANE_LENGTH = [30., 45., 60., 20., 80., 50.]
+LANE_SPEED = [5., 11.11, 8., 16.67, 11.11, 4.]
+
+
+def simulate(steps=120, num_vehicles=40, seed=0):
+    '''
+    Yield (time, lane_vehicles) snapshots of vehicles running along random routes of LANES.
+    Vehicles disappear for a few steps between lanes (turning) and leave the roadnet after their route.
+    '''
+    rng = random.Random(seed)
+    plans = {}
+    for v in range(num_vehicles):
+        time = rng.randrange(steps // 2)
+        plan = {}
+        for lane in rng.sample(LANES, 3):
+            for _ in range(rng.randint(1, 8)):
+                plan[time] = lane
+                time += 1
+            time += rng.randint(0, 2)
+        plans["vehicle_%d" % v] = plan
+    for time in range(steps):
+        lane_vehicles = {lane: [] for lane in LANES}
+        for vehicle, plan in plans.items():
+            if time in plan:
+                lane_vehicles[plan[time]].append(vehicle)
+        yield time, lane_vehicles
+
+
+def update_old_trajectory(vehicle_trajectory, lane_vehicles, time):
+    # dict of trajectories kept by World.get_vehicle_trajectory before TrajectoryStore
+    vehicle_lane = {vehicle: lane for lane, vehicles in lane_vehicles.items() for vehicle in vehicles}
+    for vehicle, lane in vehicle_lane.items():
+        if vehicle not in vehicle_trajectory:
+            vehicle_trajectory[vehicle] = [[lane, time, 0]]
+        elif lane == vehicle_trajectory[vehicle][-1][0]:
+            vehicle_trajectory[vehicle][-1][2] += 1
+        else:
+            vehicle_trajectory[vehicle].append([lane, time, 0])
+
+
+def make_store(**kwargs):
+    tracker = VehicleTracker(LANES)
+    store = TrajectoryStore(LANES, **kwargs)
+    tracker.subscribe(store.update)
+    return tracker, store
+
+
+def test_store_segments_open_and_close():
+    tracker, store = make_store()
+    tracker.update({"road_0_0": ["a"]}, 0)
+    tracker.update({"road_0_0": ["a"]}, 1)
+    tracker.update({"road_1_0": ["a"]}, 2)
+    rows = store.segments("a")
+    assert store.end[rows].tolist() == [1, -1]
+    assert store["a"] == [["road_0_0", 0, 1], ["road_1_0", 2, 0]]
+
+    # open segments count until the last update, a vehicle leaving the lanes ends its segment
+    tracker.update({"road_1_0": ["a"]}, 3)
+    assert store["a"] == [["road_0_0", 0, 1], ["road_1_0", 2, 1]]
+    tracker.update({}, 4)
+    tracker.update({}, 5)
+    assert store.end[store.segments("a")].tolist() == [1, 3]
+    assert store["a"] == [["road_0_0", 0, 1], ["road_1_0", 2, 1]]
+
+
+def test_store_matches_old_trajectory_dict():
+    # a small capacity also covers growing the columns
+    tracker, store = make_store(capacity=4)
+    old = {}
+    for time, lane_vehicles in simulate():
+        tracker.update(lane_vehicles, time)
+        update_old_trajectory(old, lane_vehicles, time)
+        assert sorted(store.keys()) == sorted(old)
+        for vehicle, trajectory in old.items():
+            assert store[vehicle] == trajectory
+
+
+def old_real_delay(vehicle_trajectory, distance):
+    # former World.get_real_delay on a fresh real_delay dict, speeds capped at 11.11
+    lane_length = dict(zip(LANES, LANE_LENGTH))
+    lane_speed = dict(zip(LANES, LANE_SPEED))
+    real_delay = {}
+    for v, routes in vehicle_trajectory.items():
+        for idx, lane in enumerate(routes):
+            speed = min(lane_speed[lane[0]], 11.11)
+            length = lane_length[lane[0]]
+            if idx == len(routes) - 1:
+                length = distance[v] if v in distance else length
+            planned_tt = float(length) / speed
+            real_delay[v] = real_delay.get(v, 0.) + (lane[-1] - planned_tt if lane[-1] > planned_tt else 0.)
+    return sum(real_delay.values()) / len(real_delay)
+
+
+def new_real_delay(store, accumulator, distance):
+    # World.get_real_delay: ended segments are accumulated, open ones are added up to their distance
+    rows = store.last_row[:len(store)]
+    rows = rows[store.end[rows] < 0]
+    lengths = np.array([distance.get(store.vehicle_ids[v], np.nan) for v in store.vehicle[rows]], dtype=np.float64)
+    missing = np.isnan(lengths)
+    lengths[missing] = accumulator.lane_length[store.lane[rows[missing]]]
+    return accumulator.average(float(accumulator.segment_delays(rows, lengths).sum()))
+
+
+def test_real_delay_accumulator_matches_old_real_delay():
+    tracker, store = make_store()
+    accumulator = RealDelayAccumulator(store, LANE_LENGTH, np.minimum(LANE_SPEED, 11.11))
+    rng = random.Random(1)
+    old = {}
+    for time, lane_vehicles in simulate():
+        tracker.update(lane_vehicles, time)
+        update_old_trajectory(old, lane_vehicles, time)
+        if not old:
+            continue
+        # distance on the current lane, some running vehicles report none
+        distance = {vehicle: rng.uniform(0., 20.) for vehicles in lane_vehicles.values() for vehicle in vehicles
+                    if rng.random() < 0.9}
+        assert new_real_delay(store, accumulator, distance) == pytest.approx(old_real_delay(old, distance))
+    assert accumulator.total_delay > 0
+
+
+def test_real_delay_accumulator_reset():
+    tracker, store = make_store()
+    accumulator = RealDelayAccumulator(store, LANE_LENGTH, LANE_SPEED)
+    for time, lane_vehicles in simulate(steps=60):
+        tracker.update(lane_vehicles, time)
+    state = accumulator.get_state()
+    assert state["total_delay"] == pytest.approx(accumulator.vehicle_delay.sum())
+    accumulator.reset()
+    assert accumulator.total_delay == 0. and not accumulator.vehicle_delay.any()
+    accumulator.set_state(state)
+    assert accumulator.total_delay == state["total_delay"]
+
+
+def test_lane_exit_events_since_window():
+    tracker, store = make_store()
+    events = LaneExitEvents(store)
+    buffer = events.register(["road_0_0", "road_1_0"])
+    # a leaves road_0_0 after time 1, b and c leave road_0_0 and road_1_0 after time 2, d after time 3
+    snapshots = [{"road_0_0": ["a", "b"], "road_1_0": ["c"]},
+                 {"road_0_0": ["a", "b"], "road_1_0": ["c", "d"]},
+                 {"road_0_0": ["b"], "road_1_0": ["c", "d"], "road_2_0": ["a"]},
+                 {"road_1_0": ["d"], "road_2_0": ["a", "b", "c"]},
+                 {"road_2_0": ["a", "b", "c", "d"]}]
+    for time, lane_vehicles in enumerate(snapshots):
+        tracker.update(lane_vehicles, time)
+    assert list(buffer) == [(1, 1, "a"), (2, 2, "b"), (2, 2, "c"), (3, 2, "d")]
+
+    # the start of the window is inclusive
+    assert events.since(buffer, 0) == list(buffer)
+    assert events.since(buffer, 2) == [(2, 2, "b"), (2, 2, "c"), (3, 2, "d")]
+    assert events.since(buffer, 3) == [(3, 2, "d")]
+    assert events.since(buffer, 4) == []
+
+
+def test_lane_exit_events_buffers():
+    tracker, store = make_store()
+    events = LaneExitEvents(store)
+    buffer = events.register(["road_0_0"], maxlen=2)
+    other = events.register(["road_1_0"])
+    for time in range(4):
+        # a new vehicle enters road_0_0 and the previous one moves on to road_1_0 at each step
+        tracker.update({"road_0_0": ["v%d" % time], "road_1_0": ["v%d" % (time - 1)] if time else []}, time)
+    # only the latest events are kept, exits from other lanes are not recorded
+    assert list(buffer) == [(1, 0, "v1"), (2, 0, "v2")]
+    assert list(other) == [(1, 0, "v0"), (2, 0, "v1")]
+
+    state = events.get_state()
+    events.reset()
+    assert list(buffer) == [] and list(other) == []
+    events.set_state(state)
+    assert list(buffer) == [(1, 0, "v1"), (2, 0, "v2")]
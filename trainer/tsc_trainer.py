@@ -1,7 +1,7 @@
 import os
 import numpy as np
 from common.metrics import Metrics
-from environment import TSCEnv
+from environment import TSCEnv, SUMOEnvPool, generator_agents
 from common.registry import Registry
 from trainer.base_trainer import BaseTrainer
 
@@ -18,6 +18,8 @@ class TSCTrainer(BaseTrainer):
         cpu=False,
         name="tsc"
     ):
+        # number of SUMO environments collecting experience for the agents, see train_pool
+        self.num_envs = Registry.mapping['command_mapping']['setting'].param.get('num_envs', 1)
         super().__init__(
             logger=logger,
             gpu=gpu,
@@ -109,6 +111,14 @@ class TSCTrainer(BaseTrainer):
         '''
         # TODO: finalized list or non list
         self.env = TSCEnv(self.world, self.agents, self.metric)
+        self.pool = None
+        if self.num_envs > 1:
+            param = Registry.mapping['command_mapping']['setting'].param
+            if param['world'] != 'sumo' or param['interface'] != 'traci':
+                raise ValueError("num_envs > 1 needs the sumo world with the traci interface")
+            # self.env is the first environment of the pool, the others only generate observations and rewards
+            self.pool = SUMOEnvPool(self.num_envs, interface='traci', agent_fn=generator_agents(self.agents),
+                                    envs=[self.env])
 
     def train(self):
         '''
@@ -118,6 +128,9 @@ class TSCTrainer(BaseTrainer):
         :param: None
         :return: None
         '''
+        if self.pool is not None:
+            self.train_pool()
+            return
         total_decision_num = 0
         flush = 0
         for e in range(self.episodes):
@@ -151,12 +164,9 @@ class TSCTrainer(BaseTrainer):
                     for idx, ag in enumerate(self.agents):
                         actions_prob.append(ag.get_action_prob(last_obs[idx], last_phase[idx]))
 
-                    rewards_list = []
-                    for _ in range(self.action_interval):
-                        obs, rewards, dones, _ = self.env.step(actions.flatten())
-                        i += 1
-                        rewards_list.append(np.stack(rewards))
-                    rewards = np.mean(rewards_list, axis=0)  # [agent, intersection]
+                    # run the whole action interval at once, rewards are averaged over it
+                    obs, rewards, dones, _ = self.env.step_interval(actions.flatten(), self.action_interval)
+                    i += self.action_interval  # rewards: [agent, intersection]
                     self.metric.update(rewards)
 
                     cur_phase = np.stack([ag.get_phase() for ag in self.agents])
@@ -181,26 +191,91 @@ class TSCTrainer(BaseTrainer):
 
                 if all(dones):
                     break
-            if len(episode_loss) > 0:
-                mean_loss = np.mean(np.array(episode_loss))
-            else:
-                mean_loss = 0
-            
-            self.writeLog("TRAIN", e, self.metric.real_average_travel_time(),\
-                mean_loss, self.metric.rewards(), self.metric.queue(), self.metric.delay(), self.metric.throughput())
-            self.logger.info("step:{}/{}, q_loss:{}, rewards:{}, queue:{}, delay:{}, throughput:{}".format(i, self.steps,\
-                mean_loss, self.metric.rewards(), self.metric.queue(), self.metric.delay(), int(self.metric.throughput())))
-            if e % self.save_rate == 0:
-                [ag.save_model(e=e) for ag in self.agents]
-            self.logger.info("episode:{}/{}, real avg travel time:{}".format(e, self.episodes, self.metric.real_average_travel_time()))
-            for j in range(len(self.world.intersections)):
-                self.logger.debug("intersection:{}, mean_episode_reward:{}, mean_queue:{}".format(j, self.metric.lane_rewards()[j],\
-                     self.metric.lane_queue()[j]))
-            if self.test_when_train:
-                self.train_test(e)
+            self.end_train_episode(e, i, episode_loss)
         # self.dataset.flush([ag.replay_buffer for ag in self.agents])
         [ag.save_model(e=self.episodes) for ag in self.agents]
 
+    def train_pool(self):
+        '''
+        train_pool
+        Train the agent(s) with experience of all environments of self.pool.
+        The agents choose actions in every environment and remember their transitions,
+        metrics are those of self.env, the first environment of the pool.
+
+        :param: None
+        :return: None
+        '''
+        total_decision_num = 0
+        for e in range(self.episodes):
+            self.metric.clear()
+            last_obs, last_phase = self.pool.reset()  # env * agent * [sub_agent, feature], [env, agent, sub_agent]
+            episode_loss = []
+            i = 0
+            while i < self.steps:
+                actions, actions_prob = [], []
+                for k in range(self.num_envs):
+                    if total_decision_num > self.learning_start:
+                        actions.append(np.stack([ag.get_action(last_obs[k][idx], last_phase[k][idx], test=False)
+                                                 for idx, ag in enumerate(self.agents)]))
+                    else:
+                        actions.append(np.stack([ag.sample() for ag in self.agents]))
+                    actions_prob.append([ag.get_action_prob(last_obs[k][idx], last_phase[k][idx])
+                                         for idx, ag in enumerate(self.agents)])
+                actions = np.stack(actions)  # [env, agent, intersections]
+
+                obs, rewards, dones, infos = self.pool.step(actions.reshape(self.num_envs, -1), self.action_interval)
+                i += self.action_interval  # rewards: [env, agent, intersection]
+                self.metric.update(rewards[0])
+
+                cur_phase = infos["phase"]
+                for k in range(self.num_envs):
+                    for idx, ag in enumerate(self.agents):
+                        ag.remember(last_obs[k][idx], last_phase[k][idx], actions[k][idx], actions_prob[k][idx],
+                                    rewards[k][idx], obs[k][idx], cur_phase[k][idx], dones[k][idx],
+                                    f'{e}_{i//self.action_interval}_{ag.id}_{k}')
+                    # train and update the target network as often per transition as train does
+                    total_decision_num += 1
+                    if total_decision_num > self.learning_start and\
+                            total_decision_num % self.update_model_rate == self.update_model_rate - 1:
+                        episode_loss.append(np.stack([ag.train() for ag in self.agents]))
+                    if total_decision_num > self.learning_start and \
+                            total_decision_num % self.update_target_rate == self.update_target_rate - 1:
+                        [ag.update_target_network() for ag in self.agents]
+                last_obs, last_phase = obs, cur_phase
+                if dones.all():
+                    break
+            self.end_train_episode(e, i, episode_loss)
+        self.pool.close()
+        [ag.save_model(e=self.episodes) for ag in self.agents]
+
+    def end_train_episode(self, e, i, episode_loss):
+        '''
+        end_train_episode
+        Log metrics of a training episode, save the model and test it if required.
+
+        :param e: number of episode
+        :param i: number of steps taken in the episode
+        :param episode_loss: list of losses of the episode
+        :return: None
+        '''
+        if len(episode_loss) > 0:
+            mean_loss = np.mean(np.array(episode_loss))
+        else:
+            mean_loss = 0
+        
+        self.writeLog("TRAIN", e, self.metric.real_average_travel_time(),\
+            mean_loss, self.metric.rewards(), self.metric.queue(), self.metric.delay(), self.metric.throughput())
+        self.logger.info("step:{}/{}, q_loss:{}, rewards:{}, queue:{}, delay:{}, throughput:{}".format(i, self.steps,\
+            mean_loss, self.metric.rewards(), self.metric.queue(), self.metric.delay(), int(self.metric.throughput())))
+        if e % self.save_rate == 0:
+            [ag.save_model(e=e) for ag in self.agents]
+        self.logger.info("episode:{}/{}, real avg travel time:{}".format(e, self.episodes, self.metric.real_average_travel_time()))
+        for j in range(len(self.world.intersections)):
+            self.logger.debug("intersection:{}, mean_episode_reward:{}, mean_queue:{}".format(j, self.metric.lane_rewards()[j],\
+                 self.metric.lane_queue()[j]))
+        if self.test_when_train:
+            self.train_test(e)
+
     def train_test(self, e):
         '''
         train_test
@@ -220,12 +295,9 @@ class TSCTrainer(BaseTrainer):
                 for idx, ag in enumerate(self.agents):
                     actions.append(ag.get_action(obs[idx], phases[idx], test=True))
                 actions = np.stack(actions)
-                rewards_list = []
-                for _ in range(self.action_interval):
-                    obs, rewards, dones, _ = self.env.step(actions.flatten())  # make sure action is [intersection]
-                    i += 1
-                    rewards_list.append(np.stack(rewards))
-                rewards = np.mean(rewards_list, axis=0)  # [agent, intersection]
+                # make sure action is [intersection], rewards are averaged over the action interval
+                obs, rewards, dones, _ = self.env.step_interval(actions.flatten(), self.action_interval)
+                i += self.action_interval  # rewards: [agent, intersection]
                 self.metric.update(rewards)
             if all(dones):
                 break
@@ -264,12 +336,8 @@ class TSCTrainer(BaseTrainer):
                 for idx, ag in enumerate(self.agents):
                     actions.append(ag.get_action(obs[idx], phases[idx], test=True))
                 actions = np.stack(actions)
-                rewards_list = []
-                for j in range(self.action_interval):
-                    obs, rewards, dones, _ = self.env.step(actions.flatten())
-                    i += 1
-                    rewards_list.append(np.stack(rewards))
-                rewards = np.mean(rewards_list, axis=0)  # [agent, intersection]
+                obs, rewards, dones, _ = self.env.step_interval(actions.flatten(), self.action_interval)
+                i += self.action_interval  # rewards: [agent, intersection]
                 self.metric.update(rewards)
             if all(dones):
                 break
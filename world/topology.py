@@ -0,0 +1,231 @@
+import hashlib
+import json
+import math
+import os
+import shutil
+import xml.etree.ElementTree as ET
+
+import numpy as np
+
+
+# arrays of a compiled CityFlow roadnet, each one is saved as <name>.npy in the cache directory
+# intersection_ids: ids of non-virtual intersections, their order defines intersection indices
+# road_ids, road_start, road_end: road ids and indices of their start/end intersections, -1 for virtual ones
+# lane_ids, lane_speed, lane_length: lane ids ("<road_id>_<n>"), lanes of each road are contiguous, speed limit and length
+# in_lanes, out_lanes: indices of lanes entering / leaving non-virtual intersections
+# sparse_adj: [num_edges, 2] start and end intersection index of roads between two non-virtual intersections
+# adj_road: road index of each row of sparse_adj
+TOPOLOGY_ARRAYS = ["intersection_ids", "road_ids", "road_start", "road_end",
+                   "lane_ids", "lane_speed", "lane_length",
+                   "in_lanes", "out_lanes", "sparse_adj", "adj_road"]
+# format version of both caches, it's part of the cache keys, bump it whenever what is cached changes
+TOPOLOGY_VERSION = 1
+
+
+def get_roadnet_hash(roadnet_file):
+    '''
+    get_roadnet_hash
+    Hash the content of a roadnet file.
+
+    :param roadnet_file: path of the roadnet file
+    :return digest: sha1 hex digest of the file
+    '''
+    sha1 = hashlib.sha1()
+    with open(roadnet_file, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            sha1.update(chunk)
+    return sha1.hexdigest()
+
+
+def get_sumo_additional_files(config_file):
+    '''
+    get_sumo_additional_files
+    Get the additional files of a SUMO config file, e.g. files defining tlLogic programs.
+
+    :param config_file: path of the .sumocfg file
+    :return files: list of paths of the additional files that exist, relative paths are resolved against the config file
+    '''
+    config_dir = os.path.dirname(os.path.abspath(config_file))
+    files = []
+    for element in ET.parse(config_file).getroot().iter("additional-files"):
+        for name in element.get("value", "").replace(",", " ").split():
+            path = os.path.join(config_dir, name)
+            if os.path.isfile(path):
+                files.append(path)
+    return files
+
+
+def compile_topology(roadnet):
+    '''
+    compile_topology
+    Compile a CityFlow roadnet into index maps and arrays.
+
+    :param roadnet: roadnet dict read from the roadnet file
+    :return topology: dict of np.ndarray, see TOPOLOGY_ARRAYS
+    '''
+    # same rule as World: converted sumo files mark virtual intersections with "gt_virtual" or "cf_gt_virtual"
+    first = roadnet["intersections"][0]
+    virt = "gt_virtual" if "gt_virtual" in first else ("cf_gt_virtual" if "cf_gt_virtual" in first else "virtual")
+    intersection_ids = [i["id"] for i in roadnet["intersections"] if not i[virt]]
+    intersection_index = {iid: idx for idx, iid in enumerate(intersection_ids)}
+
+    road_ids, road_start, road_end, road_lane_offset = [], [], [], [0]
+    lane_ids, lane_speed, lane_length = [], [], []
+    for road in roadnet["roads"]:
+        road_ids.append(road["id"])
+        road_start.append(intersection_index.get(road["startIntersection"], -1))
+        road_end.append(intersection_index.get(road["endIntersection"], -1))
+        point_x = road["points"][0]["x"] - road["points"][1]["x"]
+        point_y = road["points"][0]["y"] - road["points"][1]["y"]
+        road_l = math.sqrt((point_x ** 2) + (point_y ** 2))
+        for n, lane in enumerate(road["lanes"]):
+            lane_ids.append(road["id"] + "_" + str(n))
+            lane_speed.append(lane["maxSpeed"])
+            lane_length.append(road_l)
+        road_lane_offset.append(len(lane_ids))
+
+    road_start = np.array(road_start, dtype=np.int32)
+    road_end = np.array(road_end, dtype=np.int32)
+    # lanes of road r are lane indices road_lane_offset[r]:road_lane_offset[r+1]
+    road_lane_offset = np.array(road_lane_offset, dtype=np.int32)
+    lane_count = np.diff(road_lane_offset)
+    in_roads = np.nonzero(road_end >= 0)[0]
+    out_roads = np.nonzero(road_start >= 0)[0]
+    adj_road = np.nonzero((road_start >= 0) & (road_end >= 0))[0].astype(np.int32)
+
+    def _road_lanes(roads):
+        if len(roads) == 0:
+            return np.zeros(0, dtype=np.int32)
+        return np.concatenate([np.arange(road_lane_offset[r], road_lane_offset[r] + lane_count[r], dtype=np.int32)
+                               for r in roads])
+
+    topology = {
+        "intersection_ids": np.array(intersection_ids, dtype=np.str_),
+        "road_ids": np.array(road_ids, dtype=np.str_),
+        "road_start": road_start,
+        "road_end": road_end,
+        "lane_ids": np.array(lane_ids, dtype=np.str_),
+        "lane_speed": np.array(lane_speed, dtype=np.float64),
+        "lane_length": np.array(lane_length, dtype=np.float64),
+        "in_lanes": _road_lanes(in_roads),
+        "out_lanes": _road_lanes(out_roads),
+        "sparse_adj": np.stack([road_start[adj_road], road_end[adj_road]], axis=1).reshape(-1, 2),
+        "adj_road": adj_road
+    }
+    return topology
+
+
+def load_topology(roadnet_file, roadnet=None, cache_dir=None):
+    '''
+    load_topology
+    Load the compiled topology of a roadnet from the disk cache, compile and cache it on the first run.
+    The cache is keyed by TOPOLOGY_VERSION and the hash of the roadnet file, its arrays are memory mapped read-only.
+
+    :param roadnet_file: path of the roadnet file
+    :param roadnet: None or roadnet dict already read from roadnet_file
+    :param cache_dir: None or directory of the cache, None means ".topology_cache" next to the roadnet file
+    :return topology: dict of np.ndarray, see TOPOLOGY_ARRAYS
+    '''
+    if cache_dir is None:
+        cache_dir = os.path.join(os.path.dirname(os.path.abspath(roadnet_file)), ".topology_cache")
+    path = os.path.join(cache_dir, "v%d_%s" % (TOPOLOGY_VERSION, get_roadnet_hash(roadnet_file)))
+    if not os.path.isdir(path):
+        if roadnet is None:
+            with open(roadnet_file) as f:
+                roadnet = json.load(f)
+        topology = compile_topology(roadnet)
+        try:
+            # write into a temporary directory first so concurrent jobs never read a partial cache
+            tmp_path = path + ".tmp%d" % os.getpid()
+            os.makedirs(tmp_path, exist_ok=True)
+            for name in TOPOLOGY_ARRAYS:
+                np.save(os.path.join(tmp_path, name + ".npy"), topology[name])
+            os.rename(tmp_path, path)
+        except OSError:
+            # read-only data directory or another job finished first, the compiled arrays are still usable
+            shutil.rmtree(tmp_path, ignore_errors=True)
+            return topology
+    topology = {name: np.load(os.path.join(path, name + ".npy"), mmap_mode="r") for name in TOPOLOGY_ARRAYS}
+    return topology
+
+
+def compile_sumo_topology(eng):
+    '''
+    compile_sumo_topology
+    Query the static topology of a SUMO network from a started engine.
+
+    :param eng: libsumo module or traci connection
+    :return topology: dict of lists, "roads", "lanes", "lane_max_speed", "lane_length" and "traffic_lights",
+        which maps each traffic light id to its "phase_states" (states of the running program in execution order),
+        "controlled_links" ([from_lane, to_lane] pairs of each signal index), "lane_shapes" of the controlled lanes
+        and "yellow_phase_time"
+    '''
+    lanes = list(eng.lane.getIDList())
+    topology = {
+        "roads": list(eng.edge.getIDList()),
+        "lanes": lanes,
+        "lane_max_speed": [eng.lane.getMaxSpeed(lane) for lane in lanes],
+        "lane_length": [eng.lane.getLength(lane) for lane in lanes],
+        "traffic_lights": {}
+    }
+    for tls in eng.trafficlight.getIDList():
+        program_id = eng.trafficlight.getProgram(tls)
+        programs = eng.trafficlight.getAllProgramLogics(tls)
+        logic = next((l for l in programs if l.programID == program_id), programs[0])
+        phase_states = []
+        for phase in logic.phases:
+            if phase.state not in phase_states:
+                phase_states.append(phase.state)
+        controlled_links = [[[link[0], link[1]] for link in links]
+                            for links in eng.trafficlight.getControlledLinks(tls)]
+        controlled_lanes = set(lane for links in controlled_links for link in links for lane in link)
+        topology["traffic_lights"][tls] = {
+            "phase_states": phase_states,
+            "controlled_links": controlled_links,
+            "lane_shapes": {lane: [list(p) for p in eng.lane.getShape(lane)] for lane in controlled_lanes},
+            "yellow_phase_time": min(p.duration for p in programs[0].phases)
+        }
+    return topology
+
+
+def load_sumo_topology(eng, net_file, config_file=None, cache_dir=None):
+    '''
+    load_sumo_topology
+    Load the static topology of a SUMO network from the disk cache, query and cache it on the first run.
+    The cache is keyed by TOPOLOGY_VERSION and the hash of the network file, the combined config file and
+    the additional files it refers to.
+
+    :param eng: libsumo module or traci connection, the simulation is started with net_file
+    :param net_file: path of the .net.xml file
+    :param config_file: None or path of the combined config file, tlLogic programs can come from its additional files
+    :param cache_dir: None or directory of the cache, None means ".topology_cache" next to the network file
+    :return topology: dict, see compile_sumo_topology
+    '''
+    if cache_dir is None:
+        cache_dir = os.path.join(os.path.dirname(os.path.abspath(net_file)), ".topology_cache")
+    key = "v%d_%s" % (TOPOLOGY_VERSION, get_roadnet_hash(net_file))
+    if config_file is not None:
+        key += "_" + get_roadnet_hash(config_file)
+        # tlLogic programs of additional files override those of the network
+        additional_files = get_sumo_additional_files(config_file)
+        if additional_files:
+            sha1 = hashlib.sha1()
+            for additional_file in additional_files:
+                sha1.update(get_roadnet_hash(additional_file).encode())
+            key += "_" + sha1.hexdigest()
+    path = os.path.join(cache_dir, key + "_sumo.json")
+    if os.path.isfile(path):
+        with open(path) as f:
+            return json.load(f)
+    topology = compile_sumo_topology(eng)
+    tmp_path = path + ".tmp%d" % os.getpid()
+    try:
+        os.makedirs(cache_dir, exist_ok=True)
+        with open(tmp_path, "w") as f:
+            json.dump(topology, f)
+        os.replace(tmp_path, path)
+    except OSError:
+        # read-only data directory, the queried topology is still usable
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+    return topology
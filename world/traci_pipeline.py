@@ -0,0 +1,286 @@
+import struct
+import threading
+import time
+
+import traci
+import traci.constants as tc
+from traci.exceptions import TraCIException, FatalTraCIError
+try:
+    from traci.connection import _RESULTS
+except ImportError:
+    _RESULTS = None
+
+# the client packs and parses messages with private members of traci Connection,
+# they were checked against these TraCI API versions (traci.constants.TRACI_VERSION, 22 is SUMO 1.28)
+TRACI_VERSIONS = (22,)
+CONNECTION_MEMBERS = ("_pack", "_socket", "_recvExact", "_subscriptionMapping", "_readSubscription",
+                      "manageStepListeners")
+
+
+def supports_pipelining(connection):
+    '''
+    supports_pipelining
+    Check whether PipelinedTraCIClient can be used with a connection of the installed traci.
+
+    :param connection: traci Connection
+    :return result: boolean, False if the TraCI API version is not checked or private members are missing
+    '''
+    if tc.TRACI_VERSION not in TRACI_VERSIONS or _RESULTS is None:
+        return False
+    return all(hasattr(connection, name) for name in CONNECTION_MEMBERS)
+
+
+class PipelinedTraCIClient(object):
+    '''
+    Pipelined front end of a traci Connection, see supports_pipelining.
+    Set commands are packed into a local buffer and sent together with the next simulation step as one message,
+    so a step costs one round trip. Sending a step and receiving its response are separate calls, so several
+    clients can send their steps before waiting on any SUMO server, see step_all.
+    Responses are parsed by the connection itself, so its subscription results and other commands keep working.
+    The socket stays blocking, as for the connection's own calls.
+
+    :param connection: traci Connection, e.g. traci.getConnection(label)
+    '''
+    def __init__(self, connection):
+        if not supports_pipelining(connection):
+            raise RuntimeError("traci %s (TraCI API %d) is not supported, expected API versions %s" %
+                               (getattr(traci, "__version__", "?"), tc.TRACI_VERSION, TRACI_VERSIONS))
+        self.connection = connection
+        self.buffer = bytearray()
+        self.queue = []  # command ids in the buffer, their statuses are read from the response in this order
+        self.sent = None  # command ids of the message waiting for its response
+        self.step = 0.
+
+    def queue_cmd(self, cmdID, varID, objID, format="", *values):
+        '''
+        queue_cmd
+        Pack a command like traci Connection._sendCmd, without sending it.
+
+        :param cmdID: command id, e.g. tc.CMD_SET_TL_VARIABLE
+        :param varID: None, variable id or (begin, end) of a subscription
+        :param objID: object id
+        :param format: traci pack format of values
+        :param values: values of the command
+        :return: None
+        '''
+        packed = self.connection._pack(format, *values)
+        objID = str(objID).encode("utf8")
+        length = len(packed) + 1 + 1  # length and command
+        if varID is not None:
+            if isinstance(varID, tuple):  # begin and end of a subscription
+                length += 8 + 8 + 4 + len(objID)
+            else:
+                length += 1 + 4 + len(objID)
+        if length <= 255:
+            self.buffer += struct.pack("!BB", length, cmdID)
+        else:
+            self.buffer += struct.pack("!BiB", 0, length + 4, cmdID)
+        if varID is not None:
+            if isinstance(varID, tuple):
+                self.buffer += struct.pack("!dd", *varID)
+            else:
+                self.buffer += struct.pack("!B", varID)
+            self.buffer += struct.pack("!i", len(objID)) + objID
+        self.buffer += packed
+        self.queue.append(cmdID)
+
+    def set_phase(self, tlsID, index):
+        '''
+        set_phase
+        Queue trafficlight.setPhase, it's sent with the next simulation step.
+
+        :param tlsID: traffic light id
+        :param index: phase index
+        :return: None
+        '''
+        self.queue_cmd(tc.CMD_SET_TL_VARIABLE, tc.TL_PHASE_INDEX, tlsID, "i", index)
+
+    def send_step(self, step=0.):
+        '''
+        send_step
+        Send the queued commands and a simulation step as one message, without waiting for the response.
+
+        :param step: 0 for one step, otherwise the time to simulate up to
+        :return: None
+        '''
+        sock = self.connection._socket
+        if sock is None:
+            raise FatalTraCIError("Connection already closed.")
+        self.queue_cmd(tc.CMD_SIMSTEP, None, None, "D", step)
+        message = struct.pack("!i", len(self.buffer) + 4) + bytes(self.buffer)
+        self.sent, self.step = self.queue, step
+        self.buffer = bytearray()
+        self.queue = []
+        sock.sendall(message)
+
+    def receive_step(self):
+        '''
+        receive_step
+        Wait for the response of send_step, check the status of each command and read subscription results
+        into the connection as traci Connection.simulationStep does.
+
+        :param: None
+        :return responses: subscription responses of the step
+        '''
+        connection = self.connection
+        result = connection._recvExact()
+        sent, self.sent = self.sent, None
+        if not result:
+            connection._socket.close()
+            connection._socket = None
+            raise FatalTraCIError("Connection closed by SUMO.")
+        for command in sent:
+            prefix = result.read("!BBB")
+            err = result.readString()
+            if prefix[2] or err:
+                raise TraCIException(err, prefix[1], _RESULTS[prefix[2]])
+            elif prefix[1] != command:
+                raise FatalTraCIError("Received answer %s for command %s." % (prefix[1], command))
+        for subscriptionResults in connection._subscriptionMapping.values():
+            subscriptionResults.reset()
+        numSubs = result.readInt()
+        responses = [connection._readSubscription(result) for _ in range(numSubs)]
+        connection.manageStepListeners(self.step)
+        return responses
+
+    def simulation_step(self, step=0.):
+        '''
+        simulation_step
+        Send queued commands and a simulation step in one message and wait for the response.
+
+        :param step: see send_step
+        :return responses: subscription responses of the step
+        '''
+        self.send_step(step)
+        return self.receive_step()
+
+
+def step_all(clients, step=0.):
+    '''
+    step_all
+    Step several clients at once, all steps are sent before waiting on any response,
+    so SUMO servers simulate concurrently instead of one after another.
+
+    :param clients: list of PipelinedTraCIClient
+    :param step: see PipelinedTraCIClient.send_step
+    :return responses: list of subscription responses of each client
+    '''
+    for client in clients:
+        client.send_step(step)
+    return [client.receive_step() for client in clients]
+
+
+class StepGroup(object):
+    '''
+    Lockstep simulation steps of worlds stepped by their own threads, e.g. environments of SUMOEnvPool.
+    Each world adds its client and waits, the last one to arrive steps all clients with step_all.
+    All worlds must take the same number of simulation steps, call abort if one of them stops early.
+
+    :param num_worlds: number of worlds in the group
+    '''
+    def __init__(self, num_worlds):
+        self.clients = []
+        self.barrier = threading.Barrier(num_worlds, action=self._step_all)
+
+    def _step_all(self):
+        clients, self.clients = self.clients, []
+        step_all(clients)
+
+    def step(self, client):
+        '''
+        step
+        Take one simulation step of a client together with the other worlds of the group.
+
+        :param client: PipelinedTraCIClient of the calling world
+        :return: None
+        '''
+        self.clients.append(client)
+        self.barrier.wait()
+
+    def abort(self):
+        '''
+        abort
+        Release worlds waiting for the others, e.g. after one of them raised. Waiting worlds raise BrokenBarrierError.
+
+        :param: None
+        :return: None
+        '''
+        self.barrier.abort()
+
+
+if __name__ == "__main__":
+    # benchmark: python world/traci_pipeline.py <sumo cfg> [connections] [steps]
+    import json
+    import os
+    import sys
+    import sumolib
+
+    with open(sys.argv[1]) as f:
+        sumo_dict = json.load(f)
+    num_connections = int(sys.argv[2]) if len(sys.argv) > 2 else 4
+    steps = int(sys.argv[3]) if len(sys.argv) > 3 else 1000
+    # same command as World
+    sumo_cmd = [sumolib.checkBinary('sumo')]
+    if not sumo_dict.get('combined_file'):
+        sumo_cmd += ['-n', os.path.join(sumo_dict['dir'], sumo_dict['roadnetFile']),
+                     '-r', os.path.join(sumo_dict['dir'], sumo_dict['flowFile'])]
+    else:
+        sumo_cmd += ['-c', os.path.join(sumo_dict['dir'], sumo_dict['combined_file'])]
+    sumo_cmd += ['--no-warnings', str(sumo_dict['no_warning'])]
+
+    def start(prefix):
+        connections = []
+        for k in range(num_connections):
+            traci.start(sumo_cmd, label="%s_%d" % (prefix, k))
+            connections.append(traci.getConnection("%s_%d" % (prefix, k)))
+        return connections
+
+    def report(name, elapsed):
+        print("%s: %d connections, %.3f ms per step, %.1f simulation steps/s" %
+              (name, num_connections, elapsed / steps * 1000, num_connections * steps / elapsed))
+
+    # all paths set the phase of every light before each step, as World.step does on transitions
+    connections = start("blocking")
+    lights = [conn.trafficlight.getIDList() for conn in connections]
+    begin = time.time()
+    for i in range(steps):
+        for conn, tls_ids in zip(connections, lights):
+            for tls in tls_ids:
+                conn.trafficlight.setPhase(tls, 0)
+            conn.simulationStep()
+    report("blocking", time.time() - begin)
+    for conn in connections:
+        conn.close()
+
+    connections = start("pipelined")
+    clients = [PipelinedTraCIClient(conn) for conn in connections]
+    begin = time.time()
+    for i in range(steps):
+        for client, tls_ids in zip(clients, lights):
+            for tls in tls_ids:
+                client.set_phase(tls, 0)
+        step_all(clients)
+    report("pipelined", time.time() - begin)
+    for conn in connections:
+        conn.close()
+
+    # one thread per connection as SUMOEnvPool, stepped in lockstep by a StepGroup
+    connections = start("grouped")
+    clients = [PipelinedTraCIClient(conn) for conn in connections]
+    group = StepGroup(num_connections)
+
+    def run(client, tls_ids):
+        for i in range(steps):
+            for tls in tls_ids:
+                client.set_phase(tls, 0)
+            group.step(client)
+
+    threads = [threading.Thread(target=run, args=(client, tls_ids)) for client, tls_ids in zip(clients, lights)]
+    begin = time.time()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    report("grouped threads", time.time() - begin)
+    for conn in connections:
+        conn.close()
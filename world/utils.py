@@ -0,0 +1,595 @@
+from collections import namedtuple, deque
+
+import numpy as np
+
+
+# per-step changes of lane membership, emitted by VehicleTracker
+# arrived: dict of vehicle id to the lane it appeared on, the vehicle was not on any lane at the last step
+# left: dict of vehicle id to the lane it disappeared from, the vehicle is not on any lane at this step
+# moved: dict of vehicle id to (from_lane, to_lane), the vehicle changed its lane since the last step
+VehicleDelta = namedtuple("VehicleDelta", ["time", "arrived", "left", "moved"])
+
+
+class VehicleTracker(object):
+    '''
+    Track which lane each vehicle is running on and emit per-step arrive/leave deltas.
+    The tracker is fed with the engine's lane-vehicle snapshot, a lane whose vehicle list is
+    unchanged since the last step is skipped, so no full vehicle list is rebuilt on each step.
+
+    :param lanes: list of lane ids to be tracked
+    '''
+    def __init__(self, lanes):
+        self.lanes = list(lanes)
+        self.listeners = []
+        self.reset()
+
+    def reset(self):
+        '''
+        reset
+        Forget all tracked vehicles. Listeners are kept.
+
+        :param: None
+        :return: None
+        '''
+        self.lane_vehicles = {lane: [] for lane in self.lanes}  # key: lane id, value: vehicle list of last step
+        self.vehicle_lane = {}  # key: vehicle id, value: lane id the vehicle is running on
+        self.last_delta = VehicleDelta(0, {}, {}, {})
+
+    def subscribe(self, listener):
+        '''
+        subscribe
+        Register a callback which is called with the VehicleDelta of every update.
+
+        :param listener: callable taking a VehicleDelta
+        :return: None
+        '''
+        if listener not in self.listeners:
+            self.listeners.append(listener)
+
+    def unsubscribe(self, listener):
+        '''
+        unsubscribe
+        Remove a callback registered by subscribe.
+
+        :param listener: callable registered before
+        :return: None
+        '''
+        if listener in self.listeners:
+            self.listeners.remove(listener)
+
+    def update(self, lane_vehicles, time):
+        '''
+        update
+        Compare the lane-vehicle snapshot with the last one and emit the changes.
+
+        :param lane_vehicles: dict of lane id to list of vehicle ids on the lane, lanes not tracked are ignored
+        :param time: current simulation time
+        :return delta: VehicleDelta of this step
+        '''
+        vehicle_lane = self.vehicle_lane
+        arrived = {}
+        moved = {}
+        removed = []
+        for lane, previous in self.lane_vehicles.items():
+            current = lane_vehicles.get(lane) or []
+            if current == previous:
+                continue
+            self.lane_vehicles[lane] = current
+            if not previous:
+                added_vehicles = current
+            else:
+                previous_set = set(previous)
+                added_vehicles = [vehicle for vehicle in current if vehicle not in previous_set]
+                current_set = set(current)
+                removed.extend((vehicle, lane) for vehicle in previous if vehicle not in current_set)
+            for vehicle in added_vehicles:
+                from_lane = vehicle_lane.get(vehicle)
+                if from_lane is None:
+                    arrived[vehicle] = lane
+                elif from_lane != lane:
+                    moved[vehicle] = (from_lane, lane)
+                vehicle_lane[vehicle] = lane
+        # a removed vehicle has left if it did not show up on another lane
+        left = {}
+        for vehicle, lane in removed:
+            if vehicle_lane.get(vehicle) == lane:
+                del vehicle_lane[vehicle]
+                left[vehicle] = lane
+        delta = VehicleDelta(time, arrived, left, moved)
+        self.last_delta = delta
+        for listener in self.listeners:
+            listener(delta)
+        return delta
+
+    def get_state(self):
+        '''
+        get_state
+        Copy the tracked membership, e.g. for a world snapshot. Listeners are not included.
+
+        :param: None
+        :return state: dict of copied tracking data
+        '''
+        state = {"lane_vehicles": {lane: list(vehicles) for lane, vehicles in self.lane_vehicles.items()},
+                 "vehicle_lane": dict(self.vehicle_lane)}
+        return state
+
+    def set_state(self, state):
+        '''
+        set_state
+        Restore membership copied by get_state, the state itself is left untouched.
+
+        :param state: dict returned by get_state
+        :return: None
+        '''
+        self.lane_vehicles = {lane: list(vehicles) for lane, vehicles in state["lane_vehicles"].items()}
+        self.vehicle_lane = dict(state["vehicle_lane"])
+        self.last_delta = VehicleDelta(0, {}, {}, {})
+
+    def get_vehicle_lane(self, vehicle):
+        '''
+        get_vehicle_lane
+        Get the lane a vehicle is running on.
+
+        :param vehicle: vehicle id
+        :return lane: lane id, None if the vehicle is not on any tracked lane
+        '''
+        return self.vehicle_lane.get(vehicle)
+
+    def get_vehicles(self):
+        '''
+        get_vehicles
+        Get all vehicles currently on tracked lanes.
+
+        :param: None
+        :return vehicles: view of vehicle ids
+        '''
+        return self.vehicle_lane.keys()
+
+
+class TrajectoryStore(object):
+    '''
+    Append-only columnar store of vehicle trajectories, fed by VehicleTracker deltas.
+    Each row is a segment of a vehicle on a lane: int32 vehicle index, lane index, enter time and end time,
+    rows of a vehicle are linked backwards from its last row, so no per-vehicle Python lists are kept.
+    It can be read like the former dict of trajectories: store[vehicle] returns
+    [[lane_id_1, enter_time, time_spent_on_lane_1], ... , [lane_id_n, enter_time, time_spent_on_lane_n]].
+
+    :param lanes: list of lane ids, lane indices follow this order
+    :param speed_fn: None or callable taking (vehicle, lane) and returning the vehicle's allowed speed on the lane,
+        recorded in a float32 column when a segment is opened
+    :param capacity: initial number of rows
+    '''
+    def __init__(self, lanes, speed_fn=None, capacity=1024):
+        self.lanes = list(lanes)
+        self.lane_index = {lane: idx for idx, lane in enumerate(self.lanes)}
+        self.speed_fn = speed_fn
+        self.initial_capacity = capacity
+        self.close_listeners = []
+        self.reset()
+
+    def reset(self):
+        '''
+        reset
+        Drop all recorded trajectories.
+
+        :param: None
+        :return: None
+        '''
+        capacity = self.initial_capacity
+        self.size = 0
+        self.vehicle = np.zeros(capacity, dtype=np.int32)
+        self.lane = np.zeros(capacity, dtype=np.int32)
+        self.enter = np.zeros(capacity, dtype=np.int32)
+        self.end = np.zeros(capacity, dtype=np.int32)  # -1 while the vehicle is still on the lane
+        self.prev = np.zeros(capacity, dtype=np.int32)  # previous row of the same vehicle, -1 for the first one
+        self.speed = np.zeros(capacity, dtype=np.float32) if self.speed_fn is not None else None
+        self.vehicle_ids = []  # key: vehicle index, value: vehicle id
+        self.vehicle_index = {}  # key: vehicle id, value: vehicle index
+        self.last_row = np.zeros(capacity, dtype=np.int32)  # key: vehicle index, value: its last row
+        self.time = 0
+
+    def _grow(self):
+        '''
+        _grow
+        Double the capacity of all columns.
+
+        :param: None
+        :return: None
+        '''
+        capacity = 2 * len(self.vehicle)
+        for name in ["vehicle", "lane", "enter", "end", "prev", "speed"]:
+            column = getattr(self, name)
+            if column is None:
+                continue
+            new_column = np.zeros(capacity, dtype=column.dtype)
+            new_column[:self.size] = column[:self.size]
+            setattr(self, name, new_column)
+
+    def _open(self, vehicle, lane, time):
+        '''
+        _open
+        Append a new segment of a vehicle.
+
+        :param vehicle: vehicle id
+        :param lane: lane id the vehicle entered
+        :param time: enter time
+        :return: None
+        '''
+        idx = self.vehicle_index.get(vehicle)
+        if idx is None:
+            idx = len(self.vehicle_ids)
+            self.vehicle_index[vehicle] = idx
+            self.vehicle_ids.append(vehicle)
+            if idx == len(self.last_row):
+                self.last_row = np.concatenate([self.last_row, np.zeros(idx, dtype=np.int32)])
+            prev = -1
+        else:
+            prev = self.last_row[idx]
+        if self.size == len(self.vehicle):
+            self._grow()
+        row = self.size
+        self.vehicle[row] = idx
+        self.lane[row] = self.lane_index[lane]
+        self.enter[row] = time
+        self.end[row] = -1
+        self.prev[row] = prev
+        if self.speed is not None:
+            self.speed[row] = self.speed_fn(vehicle, lane)
+        self.last_row[idx] = row
+        self.size += 1
+
+    def _close(self, vehicle, time):
+        '''
+        _close
+        End the last segment of a vehicle.
+
+        :param vehicle: vehicle id
+        :param time: last time the vehicle was seen on the lane
+        :return: None
+        '''
+        idx = self.vehicle_index.get(vehicle)
+        if idx is None:
+            # the vehicle entered before recording started
+            return
+        row = self.last_row[idx]
+        if self.end[row] < 0:
+            self.end[row] = time
+            for listener in self.close_listeners:
+                listener(row)
+
+    def subscribe_close(self, listener):
+        '''
+        subscribe_close
+        Register a callback which is called with the row index of every segment once it ends.
+
+        :param listener: callable taking a row index
+        :return: None
+        '''
+        if listener not in self.close_listeners:
+            self.close_listeners.append(listener)
+
+    def update(self, delta):
+        '''
+        update
+        Record a VehicleDelta, can be subscribed to a VehicleTracker directly.
+        A segment ends at the last time its vehicle was seen on the lane.
+
+        :param delta: VehicleDelta of the current step
+        :return: None
+        '''
+        last_time = self.time
+        time = int(delta.time)
+        for vehicle in delta.left:
+            self._close(vehicle, last_time)
+        for vehicle in delta.moved:
+            self._close(vehicle, last_time)
+            self._open(vehicle, delta.moved[vehicle][1], time)
+        for vehicle, lane in delta.arrived.items():
+            self._open(vehicle, lane, time)
+        self.time = time
+
+    def get_state(self):
+        '''
+        get_state
+        Copy recorded trajectories, e.g. for a world snapshot. Listeners are not included.
+
+        :param: None
+        :return state: dict of copied columns and vehicle tables
+        '''
+        state = {name: getattr(self, name).copy() for name in ["vehicle", "lane", "enter", "end", "prev", "last_row"]}
+        state["speed"] = self.speed.copy() if self.speed is not None else None
+        state["size"] = self.size
+        state["vehicle_ids"] = list(self.vehicle_ids)
+        state["time"] = self.time
+        return state
+
+    def set_state(self, state):
+        '''
+        set_state
+        Restore trajectories copied by get_state, the state itself is left untouched.
+
+        :param state: dict returned by get_state
+        :return: None
+        '''
+        for name in ["vehicle", "lane", "enter", "end", "prev", "last_row"]:
+            setattr(self, name, state[name].copy())
+        self.speed = state["speed"].copy() if state["speed"] is not None else None
+        self.size = state["size"]
+        self.vehicle_ids = list(state["vehicle_ids"])
+        self.vehicle_index = {vehicle: idx for idx, vehicle in enumerate(self.vehicle_ids)}
+        self.time = state["time"]
+
+    def segments(self, vehicle):
+        '''
+        segments
+        Get rows of a vehicle in the order they were recorded.
+
+        :param vehicle: vehicle id
+        :return rows: np.ndarray of row indices
+        '''
+        rows = []
+        row = self.last_row[self.vehicle_index[vehicle]]
+        while row >= 0:
+            rows.append(row)
+            row = self.prev[row]
+        rows = np.array(rows[::-1], dtype=np.int64)
+        return rows
+
+    def durations(self, rows=None):
+        '''
+        durations
+        Get time spent on the lane of each row, open rows count until the last update.
+
+        :param rows: None or row indices, None means all rows
+        :return durations: np.ndarray of int32
+        '''
+        if rows is None:
+            rows = slice(0, self.size)
+        end = self.end[rows]
+        durations = np.where(end < 0, self.time, end) - self.enter[rows]
+        return durations
+
+    def __getitem__(self, vehicle):
+        rows = self.segments(vehicle)
+        durations = self.durations(rows)
+        trajectory = [[self.lanes[lane], int(enter), int(duration)]
+                      for lane, enter, duration in zip(self.lane[rows], self.enter[rows], durations)]
+        return trajectory
+
+    def __contains__(self, vehicle):
+        return vehicle in self.vehicle_index
+
+    def __iter__(self):
+        return iter(self.vehicle_ids)
+
+    def __len__(self):
+        return len(self.vehicle_ids)
+
+    def keys(self):
+        return list(self.vehicle_ids)
+
+    def items(self):
+        for vehicle in self.vehicle_ids:
+            yield vehicle, self[vehicle]
+
+
+class LaneExitEvents(object):
+    '''
+    Ring buffers of lane exits for groups of lanes, e.g. in-lanes of an intersection, fed by TrajectoryStore as
+    segments end. Each event is (time, duration, vehicle): last time the vehicle was seen on the lane,
+    time it spent on the lane and its id. Events of a buffer are in non-decreasing time order.
+
+    :param store: TrajectoryStore
+    '''
+    def __init__(self, store):
+        self.store = store
+        self.lane_buffers = [[] for _ in store.lanes]  # key: lane index, value: buffers of groups containing the lane
+        self.buffers = []
+        store.subscribe_close(self.record)
+
+    def register(self, lanes, maxlen=4096):
+        '''
+        register
+        Create the ring buffer of a group of lanes, it records exits from now on.
+
+        :param lanes: list of lane ids
+        :param maxlen: number of latest events kept
+        :return buffer: deque of events
+        '''
+        buffer = deque(maxlen=maxlen)
+        for lane in set(lanes):
+            self.lane_buffers[self.store.lane_index[lane]].append(buffer)
+        self.buffers.append(buffer)
+        return buffer
+
+    def record(self, row):
+        '''
+        record
+        Append the exit of an ended segment to buffers of its lane, subscribed to TrajectoryStore.subscribe_close.
+
+        :param row: row index of the segment
+        :return: None
+        '''
+        buffers = self.lane_buffers[self.store.lane[row]]
+        if not buffers:
+            return
+        store = self.store
+        end = int(store.end[row])
+        event = (end, end - int(store.enter[row]), store.vehicle_ids[store.vehicle[row]])
+        for buffer in buffers:
+            buffer.append(event)
+
+    @staticmethod
+    def since(buffer, time):
+        '''
+        since
+        Get events of a buffer at or after time, only events in the window are visited.
+
+        :param buffer: deque returned by register
+        :param time: start of the window, inclusive
+        :return events: list of events in time order
+        '''
+        events = []
+        for event in reversed(buffer):
+            if event[0] < time:
+                break
+            events.append(event)
+        events.reverse()
+        return events
+
+    def reset(self):
+        '''
+        reset
+        Drop all recorded events. Registered buffers are kept.
+
+        :param: None
+        :return: None
+        '''
+        for buffer in self.buffers:
+            buffer.clear()
+
+    def get_state(self):
+        '''
+        get_state
+        Copy recorded events, e.g. for a world snapshot.
+
+        :param: None
+        :return state: list of event lists of registered buffers
+        '''
+        return [list(buffer) for buffer in self.buffers]
+
+    def set_state(self, state):
+        '''
+        set_state
+        Restore events copied by get_state, buffers registered after it was taken are cleared.
+
+        :param state: list returned by get_state
+        :return: None
+        '''
+        for i, buffer in enumerate(self.buffers):
+            buffer.clear()
+            if i < len(state):
+                buffer.extend(state[i])
+
+
+class RealDelayAccumulator(object):
+    '''
+    Accumulate real delay of vehicles from a TrajectoryStore incrementally.
+    Delay of a segment is the time spent on the lane minus the time needed to pass the lane at full speed,
+    it's added once to the per-vehicle and network sums when the segment ends.
+
+    :param store: TrajectoryStore to follow
+    :param lane_length: np.ndarray of lane lengths, ordered by the store's lane index
+    :param lane_speed: np.ndarray of lane speed limits, ordered by the store's lane index,
+        it's capped by the store's speed column if the store records speeds
+    '''
+    def __init__(self, store, lane_length, lane_speed):
+        self.store = store
+        self.lane_length = np.asarray(lane_length, dtype=np.float64)
+        self.lane_speed = np.asarray(lane_speed, dtype=np.float64)
+        self.store.subscribe_close(self.finalize)
+        self.reset()
+
+    def reset(self):
+        '''
+        reset
+        Clear accumulated delay.
+
+        :param: None
+        :return: None
+        '''
+        self.vehicle_delay = np.zeros(len(self.store.last_row), dtype=np.float64)  # key: store's vehicle index
+        self.total_delay = 0.
+
+    def get_state(self):
+        '''
+        get_state
+        Copy accumulated delay, e.g. for a world snapshot.
+
+        :param: None
+        :return state: dict of copied sums
+        '''
+        state = {"vehicle_delay": self.vehicle_delay.copy(), "total_delay": self.total_delay}
+        return state
+
+    def set_state(self, state):
+        '''
+        set_state
+        Restore delay copied by get_state, the state itself is left untouched.
+
+        :param state: dict returned by get_state
+        :return: None
+        '''
+        self.vehicle_delay = state["vehicle_delay"].copy()
+        self.total_delay = state["total_delay"]
+
+    def segment_delay(self, row, lane_length=None):
+        '''
+        segment_delay
+        Calculate delay of a segment.
+
+        :param row: row index in the store
+        :param lane_length: None or distance run on the lane, None means the whole lane
+        :return delay: non-negative delay of the segment
+        '''
+        store = self.store
+        lane = store.lane[row]
+        speed = self.lane_speed[lane]
+        if store.speed is not None:
+            speed = min(speed, store.speed[row])
+        if lane_length is None:
+            lane_length = self.lane_length[lane]
+        planned_tt = float(lane_length) / speed
+        duration = store.durations([row])[0]
+        delay = duration - planned_tt if duration > planned_tt else 0.
+        return delay
+
+    def segment_delays(self, rows, lane_length=None):
+        '''
+        segment_delays
+        Calculate delay of several segments at once, see segment_delay.
+
+        :param rows: np.ndarray of row indices in the store
+        :param lane_length: None or np.ndarray of distance run on the lane of each row, None means the whole lanes
+        :return delays: np.ndarray of non-negative delays
+        '''
+        store = self.store
+        lanes = store.lane[rows]
+        speed = self.lane_speed[lanes]
+        if store.speed is not None:
+            speed = np.minimum(speed, store.speed[rows])
+        if lane_length is None:
+            lane_length = self.lane_length[lanes]
+        planned_tt = np.asarray(lane_length, dtype=np.float64) / speed
+        delays = np.maximum(store.durations(rows) - planned_tt, 0.)
+        return delays
+
+    def finalize(self, row):
+        '''
+        finalize
+        Add delay of an ended segment to the sums, subscribed to the store's closed segments.
+
+        :param row: row index in the store
+        :return: None
+        '''
+        delay = self.segment_delay(row)
+        vehicle = self.store.vehicle[row]
+        if vehicle >= len(self.vehicle_delay):
+            self.vehicle_delay = np.concatenate([self.vehicle_delay, np.zeros(len(self.store.last_row) -
+                                                                              len(self.vehicle_delay))])
+        self.vehicle_delay[vehicle] += delay
+        self.total_delay += delay
+
+    def average(self, open_delay=0.):
+        '''
+        average
+        Get average real delay over all recorded vehicles.
+
+        :param open_delay: delay of segments not ended yet, added on top of finalized delay
+        :return avg_delay: average real delay, 0 if no vehicle is recorded
+        '''
+        count = len(self.store)
+        if count == 0:
+            return 0.
+        avg_delay = (self.total_delay + open_delay) / count
+        return avg_delay
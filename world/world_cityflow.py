@@ -1,7 +1,12 @@
 import json
 import os
+import copy
+from itertools import chain, repeat
+from bisect import bisect_right
 import cityflow
 from common.registry import Registry
+from world.utils import VehicleTracker, TrajectoryStore, RealDelayAccumulator, LaneExitEvents
+from world.topology import load_topology
 
 import numpy as np
 from math import atan2, pi
@@ -198,6 +203,30 @@ class Intersection(object):
         self.action_before_yellow = None
         self.action_executed = None
 
+    def get_state(self):
+        '''
+        get_state
+        Get phase state of current intersection, used by world snapshots.
+
+        :param: None
+        :return state: tuple of phase information
+        '''
+        state = (self.current_phase, self._current_phase, self.current_phase_time,
+                 self.action_before_yellow, self.action_executed)
+        return state
+
+    def set_state(self, state):
+        '''
+        set_state
+        Restore phase state returned by get_state.
+
+        :param state: tuple of phase information
+        :return: None
+        '''
+        (self.current_phase, self._current_phase, self.current_phase_time,
+         self.action_before_yellow, self.action_executed) = state
+        self.eng.set_tl_phase(self.id, self._current_phase)
+
     # TODO: THIS IS Y/X  But we keep it right now
     def _get_direction(self, road, out=True):
         if out:
@@ -221,6 +250,11 @@ class World(object):
         self.eng = cityflow.Engine(cityflow_config, thread_num=thread_num)
         with open(cityflow_config) as f:
             cityflow_config = json.load(f)
+        # steps simulated once before the first episode, later resets restore the warmed-up snapshot
+        self.warmup = kwargs.get("warmup", cityflow_config.get("warmup", 0))
+        # seconds of each phase of the fixed-time control during warm-up
+        self.warmup_phase_time = kwargs.get("warmup_phase_time", cityflow_config.get("warmup_phase_time", 30))
+        self.warm_snapshot = None
         self.roadnet = self._get_roadnet(cityflow_config)
         self.RIGHT = True  # vehicles moves on the right side, currently always set to true due to CityFlow's mechanism
         self.interval = cityflow_config["interval"]
@@ -260,34 +294,30 @@ class World(object):
         self.id2idx = {i: idx for idx,i in enumerate(self.id2intersection)}
         print("intersections created.")
 
-        # id of all roads and lanes
+        # id of all roads and lanes, compiled once for each roadnet file and cached on disk
         print("parsing roads...")
-        self.all_roads = []
-        self.all_lanes = []
-        self.all_lanes_speed = {}
-        self.lane_length = {}
-
-
-        for road in self.roadnet["roads"]:
-            self.all_roads.append(road["id"])
-            i = 0
-            road_l = self.get_road_length(road)
-            for lane in road["lanes"]:
-                self.all_lanes.append(road["id"] + "_" + str(i))
-                self.all_lanes_speed[road["id"] + "_" + str(i)] = lane['maxSpeed']
-                self.lane_length[road["id"] + "_" + str(i)] = road_l
-                i += 1
-
-            iid = road["startIntersection"]
-            if iid in self.intersection_ids:
-                self.id2intersection[iid].insert_road(road, True)
-            iid = road["endIntersection"]
-            if iid in self.intersection_ids:
-                self.id2intersection[iid].insert_road(road, False)
+        self.topology = load_topology(self.roadnet_file, self.roadnet)
+        self.all_roads = self.topology["road_ids"].tolist()
+        self.all_lanes = self.topology["lane_ids"].tolist()
+        self.all_lanes_speed = dict(zip(self.all_lanes, self.topology["lane_speed"].tolist()))
+        self.lane_length = dict(zip(self.all_lanes, self.topology["lane_length"].tolist()))
+
+        # topology indexes intersections in the same order as self.intersections, -1 for virtual ones
+        roads = self.roadnet["roads"]
+        road_start = self.topology["road_start"]
+        road_end = self.topology["road_end"]
+        for r in np.nonzero((road_start >= 0) | (road_end >= 0))[0].tolist():
+            if road_start[r] >= 0:
+                self.intersections[road_start[r]].insert_road(roads[r], True)
+            if road_end[r] >= 0:
+                self.intersections[road_end[r]].insert_road(roads[r], False)
 
         for i in self.intersections:
             i.sort_roads()
 
+        # intern lanes into integer indices, per-lane arrays are ordered by this index
+        self.lane_index = {lane: idx for idx, lane in enumerate(self.all_lanes)}
+
         print("roads parsed.")
 
         # initializing info functions
@@ -304,27 +334,61 @@ class World(object):
             "lane_delay": self.get_lane_delay,
             "real_delay": self.get_real_delay,
             "vehicle_trajectory": self.get_vehicle_trajectory,
-            "history_vehicles": self.get_history_vehicles,
+            "history_vehicles": (lambda: self.history_vehicles),
             "phase": self.get_cur_phase,
             "throughput": self.get_cur_throughput,
             "averate_travel_time": self.get_average_travel_time
             # "action_executed": self.get_executed_action
         }
+        # info functions are evaluated lazily, but some of them keep state across steps.
+        # their states are updated on every step once they are subscribed.
+        self.info_updaters = {
+            "lane_waiting_time_count": self._update_vehicle_waiting_time,
+            "history_vehicles": self.get_history_vehicles
+        }
+        # info functions returning a value for each lane, published as arrays in self.lane_state
+        self.lane_infos = ["lane_count", "lane_waiting_count", "lane_waiting_time_count", "lane_delay", "lane_pressure"]
+        # lane infos computed directly in array form, their dict form is only built when requested by get_info
+        self.lane_array_functions = {
+            "lane_waiting_time_count": self._get_lane_waiting_time_array,
+            "lane_delay": self._get_lane_delay_array
+        }
+        self.lane_speed_array = self.topology["lane_speed"].astype(np.float32)
+        self.vehicle_arrays = None  # vehicles on lanes of current step, see _get_vehicle_arrays
         self.fns = []
         self.info = {}
-        self.vehicle_waiting_time = {}  # key: vehicle_id, value: the waiting time of this vehicle since last halt.
-        self.vehicle_trajectory = {}  # key: vehicle_id, value: [[lane_id_1, enter_time, time_spent_on_lane_1], ... , [lane_id_n, enter_time, time_spent_on_lane_n]]
+        # bumped whenever self.info is dropped, shared generators memoize their output per version
+        self.info_version = 0
+        self.generator_registry = {}  # see BaseGenerator.shared
+        self.lane_state = {}  # key: lane info name, value: np.ndarray of shape [num_lanes]
+        # the waiting time of each vehicle since last halt, indexed by the vehicle's slot in self.vehicle_slot
+        self.vehicle_slot = {}  # key: vehicle_id, value: slot index
+        self.slot_vehicles = []  # key: slot index, value: vehicle_id
+        self.waiting_time = np.zeros(1024, dtype=np.int32)
+        # key: vehicle_id, value: [[lane_id_1, enter_time, time_spent_on_lane_1], ... , [lane_id_n, enter_time, time_spent_on_lane_n]]
+        # it's a TrajectoryStore recording only after "vehicle_trajectory" or "real_delay" is subscribed
+        self.vehicle_trajectory = {}
+        self.trajectory_store = None
+        self.real_delay_accumulator = None  # follows trajectory_store, finalizes delay of each segment once
+        self.lane_exit_events = None  # follows trajectory_store, see get_lane_exit_events
         self.history_vehicles = set()
-        self.real_delay= {}
 
         # # get in_lanes and out_lanes
         self.in_lanes, self.out_lanes = self.get_in_out_lanes()
 
-        # record lanes' vehicles to calculate arrive_leave_time
-        self.dic_lane_vehicle_previous_step = {key: None for key in self.all_lanes}
-        self.dic_lane_vehicle_current_step = {key: None for key in self.all_lanes}
+        # track lanes' vehicles to calculate arrive_leave_time, other modules can subscribe to its deltas
+        self.vehicle_tracker = VehicleTracker(self.all_lanes)
         self.dic_vehicle_arrive_leave_time = dict()  # cumulative
 
+        # roads ending at a virtual intersection, leaving them means leaving the roadnet
+        self.exit_roads = set(road["id"] for road in self.roadnet["roads"]
+                              if road["endIntersection"] not in self.id2intersection)
+        self.lane2road = {lane: lane[:lane.rfind("_")] for lane in self.all_lanes}
+        # running throughput counters, updated in _update_left_time
+        self.throughput = 0
+        self.list_leave_time = []  # first leave time of each finished vehicle, non-decreasing
+        self.exit_road_throughput = {road: 0 for road in self.exit_roads}
+
         print("world built.")
 
     def reset_vehicle_info(self):
@@ -335,13 +399,19 @@ class World(object):
         :param: None
         :return: None
         '''
-        self.vehicle_waiting_time = {}  # key: vehicle_id, value: the waiting time of this vehicle since last halt.
-        self.vehicle_trajectory = {}  # key: vehicle_id, value: [[lane_id_1, enter_time, time_spent_on_lane_1], ... , [lane_id_n, enter_time, time_spent_on_lane_n]]
+        self.vehicle_slot = {}
+        self.slot_vehicles = []
+        self.waiting_time = np.zeros(1024, dtype=np.int32)
+        if self.trajectory_store is not None:
+            self.trajectory_store.reset()
+            self.real_delay_accumulator.reset()
+            self.lane_exit_events.reset()
         self.history_vehicles = set()
-        self.real_delay= {}
-        self.dic_lane_vehicle_previous_step = {key: None for key in self.all_lanes}
-        self.dic_lane_vehicle_current_step = {key: None for key in self.all_lanes}
+        self.vehicle_tracker.reset()
         self.dic_vehicle_arrive_leave_time = dict()
+        self.throughput = 0
+        self.list_leave_time = []
+        self.exit_road_throughput = {road: 0 for road in self.exit_roads}
 
     def _update_arrive_time(self, list_vehicle_arrive):
         '''
@@ -361,24 +431,33 @@ class World(object):
                 # print("vehicle: %s already exists in entering lane!"%vehicle)
                 pass
 
-    def _update_left_time(self, list_vehicle_left):
+    def _update_left_time(self, list_vehicle_left, dic_vehicle_left_lane=None):
         '''
         _update_left_time
-        Update left time of vehicles.
+        Update left time of vehicles and the running throughput counters.
 
         :param list_vehicle_left: vehicles' id that have left from roadnet
+        :param dic_vehicle_left_lane: lane id that each vehicle has left from, used for per-exit-road throughput
         :return: None
         '''
         ts = self.eng.get_current_time()
         # update the time for vehicle to leave entering lane
         for vehicle in list_vehicle_left:
             try:
-                self.dic_vehicle_arrive_leave_time[vehicle]["leave_time"] = ts
-                self.dic_vehicle_arrive_leave_time[vehicle]["cost_time"] = ts - \
-                                                                           self.dic_vehicle_arrive_leave_time[vehicle][
-                                                                               "enter_time"]
+                record = self.dic_vehicle_arrive_leave_time[vehicle]
             except KeyError:
                 print("vehicle not recorded when entering!")
+                continue
+            if np.isnan(record["cost_time"]):
+                # first time this vehicle is seen leaving, count it once
+                self.throughput += 1
+                self.list_leave_time.append(ts)
+            record["leave_time"] = ts
+            record["cost_time"] = ts - record["enter_time"]
+            if dic_vehicle_left_lane is not None:
+                road = self.lane2road[dic_vehicle_left_lane[vehicle]]
+                if road in self.exit_road_throughput:
+                    self.exit_road_throughput[road] += 1
 
     def update_current_measurements(self):
         '''
@@ -388,25 +467,10 @@ class World(object):
         :param: None
         :return: None
         '''
-        def _change_lane_vehicle_dic_to_list(dic_lane_vehicle):
-            list_lane_vehicle = []
-            for value in dic_lane_vehicle.values():
-                if value:
-                    list_lane_vehicle.extend(value)
-            return list_lane_vehicle
-
-        # contain outflow lanes
-        self.dic_lane_vehicle_current_step = self.eng.get_lane_vehicles()
-
-        # get vehicle list
-        self.list_lane_vehicle_current_step = _change_lane_vehicle_dic_to_list(self.dic_lane_vehicle_current_step)
-        self.list_lane_vehicle_previous_step = _change_lane_vehicle_dic_to_list(self.dic_lane_vehicle_previous_step)
-        list_vehicle_new_arrive = list(
-            set(self.list_lane_vehicle_current_step) - set(self.list_lane_vehicle_previous_step))
-        list_vehicle_new_left = list(
-            set(self.list_lane_vehicle_previous_step) - set(self.list_lane_vehicle_current_step))
-        self._update_arrive_time(list_vehicle_new_arrive)
-        self._update_left_time(list_vehicle_new_left)
+        # contain outflow lanes, only lanes whose vehicles changed are compared
+        delta = self.vehicle_tracker.update(self.eng.get_lane_vehicles(), self.eng.get_current_time())
+        self._update_arrive_time(delta.arrived)
+        self._update_left_time(delta.left, delta.left)
     
 
     def get_cur_throughput(self):
@@ -417,13 +481,33 @@ class World(object):
         :param: None
         :return throughput: throughput in the whole roadnet at current step
         '''
-        throughput = 0
-        for dic in self.dic_vehicle_arrive_leave_time:
-            vehicle = self.dic_vehicle_arrive_leave_time[dic]
-            if (not np.isnan(vehicle["cost_time"])) and vehicle["leave_time"] <= self.eng.get_current_time():
-                throughput += 1
+        # maintained incrementally by _update_left_time
+        return self.throughput
+
+    def get_window_throughput(self, window):
+        '''
+        get_window_throughput
+        Get vehicles' count that finished their trips during the last time window.
+
+        :param window: length of the time window in seconds
+        :return throughput: throughput in the whole roadnet during (current_time - window, current_time]
+        '''
+        start = self.eng.get_current_time() - window
+        # leave times are appended in time order, so a binary search is enough
+        throughput = len(self.list_leave_time) - bisect_right(self.list_leave_time, start)
         return throughput
 
+    def get_exit_road_throughput(self):
+        '''
+        get_exit_road_throughput
+        Get vehicles' count that have left the roadnet through each exit road.
+        An exit road is a road that ends at a virtual intersection.
+
+        :param: None
+        :return exit_road_throughput: dict of exit road id to number of vehicles left through it
+        '''
+        return dict(self.exit_road_throughput)
+
     def get_executed_action(self):
         '''
         get_executed_action
@@ -484,23 +568,21 @@ class World(object):
         return pressures
     
     def get_in_out_lanes(self):
-        in_lanes = []
-        out_lanes = []
-        for i in self.intersections:
-            for road in i.in_roads:
-                from_zero = (road["startIntersection"] == i.id) if self.RIGHT else (
-                        road["endIntersection"] == i.id)
-                for n in range(len(road["lanes"]))[::(1 if from_zero else -1)]:
-                    in_lanes.append(road["id"] + "_" + str(n))
-            for road in i.out_roads:
-                from_zero = (road["endIntersection"] == i.id) if self.RIGHT else (
-                        road["startIntersection"] == i.id)
-                for n in range(len(road["lanes"]))[::(1 if from_zero else -1)]:
-                    out_lanes.append(road["id"] + "_" + str(n))
+        '''
+        get_in_out_lanes
+        Get lanes entering and leaving non-virtual intersections from the compiled topology, in roadnet order.
+
+        :param: None
+        :return in_lanes: list of lane ids entering non-virtual intersections
+        :return out_lanes: list of lane ids leaving non-virtual intersections, followed by all other lanes
+        '''
+        lane_ids = self.topology["lane_ids"]
+        in_lanes = lane_ids[self.topology["in_lanes"]].tolist()
+        out_lanes = lane_ids[self.topology["out_lanes"]].tolist()
         # add in_lanes of virtual intersections which can be regarded as out_lanes of non-virtual intersections.
-        for lane in self.all_lanes:
-            if lane not in out_lanes:
-                out_lanes.append(lane)
+        is_out = np.zeros(len(lane_ids), dtype=bool)
+        is_out[self.topology["out_lanes"]] = True
+        out_lanes += lane_ids[~is_out].tolist()
         return in_lanes, out_lanes
 
     def get_lane_pressure(self):
@@ -538,6 +620,61 @@ class World(object):
                 vehicle_lane[vehicle] = lane
         return vehicle_lane
 
+    def _get_vehicle_slots(self, vehicles):
+        '''
+        _get_vehicle_slots
+        Get slot indices of vehicles, vehicles seen for the first time are given new slots.
+
+        :param vehicles: list of vehicle ids
+        :return slots: np.ndarray of int64 slot indices
+        '''
+        slots = np.fromiter(map(self.vehicle_slot.get, vehicles, repeat(-1)), dtype=np.int64, count=len(vehicles))
+        new = np.nonzero(slots < 0)[0]
+        if len(new) > 0:
+            start = len(self.slot_vehicles)
+            for n, i in enumerate(new.tolist()):
+                self.vehicle_slot[vehicles[i]] = start + n
+                self.slot_vehicles.append(vehicles[i])
+            slots[new] = np.arange(start, start + len(new))
+            if len(self.slot_vehicles) > len(self.waiting_time):
+                grown = np.zeros(2 * len(self.slot_vehicles), dtype=np.int32)
+                grown[:len(self.waiting_time)] = self.waiting_time
+                self.waiting_time = grown
+        return slots
+
+    def _get_vehicle_arrays(self):
+        '''
+        _get_vehicle_arrays
+        Get vehicles on lanes of current step in array form, computed once per step.
+
+        :param: None
+        :return vehicles: list of vehicle ids ordered by lane index
+        :return vehicle_lane_idx: np.ndarray of the lane index of each vehicle
+        :return lane_vehicle_count: np.ndarray of the number of vehicles on each lane
+        '''
+        if self.vehicle_arrays is None:
+            lane_vehicles = self.eng.get_lane_vehicles()
+            lists = [lane_vehicles[lane] for lane in self.all_lanes]
+            lane_vehicle_count = np.fromiter(map(len, lists), dtype=np.int64, count=len(lists))
+            vehicles = list(chain.from_iterable(lists))
+            vehicle_lane_idx = np.repeat(np.arange(len(self.all_lanes)), lane_vehicle_count)
+            self.vehicle_arrays = (vehicles, vehicle_lane_idx, lane_vehicle_count)
+        return self.vehicle_arrays
+
+    def _update_vehicle_waiting_time(self):
+        '''
+        _update_vehicle_waiting_time
+        Update waiting time of running vehicles in self.waiting_time, it's called once per step when subscribed.
+        
+        :param: None
+        :return: None
+        '''
+        vehicles = self.eng.get_vehicles(include_waiting=False)
+        vehicle_speed = self.eng.get_vehicle_speed()
+        slots = self._get_vehicle_slots(vehicles)
+        speeds = np.fromiter(map(vehicle_speed.__getitem__, vehicles), dtype=np.float32, count=len(vehicles))
+        self.waiting_time[slots] = np.where(speeds < 0.1, self.waiting_time[slots] + 1, 0)
+
     def get_vehicle_waiting_time(self):
         '''
         get_vehicle_waiting_time
@@ -548,16 +685,24 @@ class World(object):
         :return vehicle_waiting_time: waiting time of vehicles
         '''
         # the waiting time of vehicle since last halt.
-        vehicles = self.eng.get_vehicles(include_waiting=False)
-        vehicle_speed = self.eng.get_vehicle_speed()
-        for vehicle in vehicles:
-            if vehicle not in self.vehicle_waiting_time.keys():
-                self.vehicle_waiting_time[vehicle] = 0
-            if vehicle_speed[vehicle] < 0.1:
-                self.vehicle_waiting_time[vehicle] += 1
-            else:
-                self.vehicle_waiting_time[vehicle] = 0
-        return self.vehicle_waiting_time
+        self._update_vehicle_waiting_time()
+        vehicle_waiting_time = dict(zip(self.slot_vehicles, self.waiting_time[:len(self.slot_vehicles)].tolist()))
+        return vehicle_waiting_time
+
+    def _get_lane_waiting_time_array(self):
+        '''
+        _get_lane_waiting_time_array
+        Get the sum of waiting times of vehicles on each lane, ordered by self.lane_index.
+        
+        :param: None
+        :return lane_waiting_time: np.ndarray of shape [num_lanes]
+        '''
+        # self.waiting_time is updated on every step through self.info_updaters
+        vehicles, vehicle_lane_idx, _ = self._get_vehicle_arrays()
+        slots = np.fromiter(map(self.vehicle_slot.__getitem__, vehicles), dtype=np.int64, count=len(vehicles))
+        lane_waiting_time = np.bincount(vehicle_lane_idx, weights=self.waiting_time[slots],
+                                        minlength=len(self.all_lanes)).astype(np.float32)
+        return lane_waiting_time
 
     def get_lane_waiting_time_count(self):
         '''
@@ -568,15 +713,27 @@ class World(object):
         :return lane_waiting_time: waiting time of vehicles in each lane
         '''
         # the sum of waiting times of vehicles on the lane since their last halt.
-        lane_waiting_time = {}
-        lane_vehicles = self.eng.get_lane_vehicles()
-        vehicle_waiting_time = self.get_vehicle_waiting_time()
-        for lane in self.all_lanes:
-            lane_waiting_time[lane] = 0
-            for vehicle in lane_vehicles[lane]:
-                lane_waiting_time[lane] += vehicle_waiting_time[vehicle]
+        lane_waiting_time = dict(zip(self.all_lanes, self.get_lane_array("lane_waiting_time_count").tolist()))
         return lane_waiting_time
 
+    def _get_lane_delay_array(self):
+        '''
+        _get_lane_delay_array
+        Get approximate delay of each lane, ordered by self.lane_index.
+        
+        :param: None
+        :return lane_delay: np.ndarray of shape [num_lanes]
+        '''
+        # the delay of each lane: 1 - lane_avg_speed/speed_limit, lanes without vehicles run at the speed limit
+        vehicles, vehicle_lane_idx, lane_vehicle_count = self._get_vehicle_arrays()
+        vehicle_speed = self.eng.get_vehicle_speed()
+        speeds = np.fromiter(map(vehicle_speed.__getitem__, vehicles), dtype=np.float32, count=len(vehicles))
+        lane_speed_sum = np.bincount(vehicle_lane_idx, weights=speeds, minlength=len(self.all_lanes))
+        lane_avg_speed = np.where(lane_vehicle_count > 0, lane_speed_sum / np.maximum(lane_vehicle_count, 1),
+                                  self.lane_speed_array)
+        lane_delay = (1 - lane_avg_speed / self.lane_speed_array).astype(np.float32)
+        return lane_delay
+
     def get_lane_delay(self):
         '''
         get_lane_delay
@@ -586,50 +743,41 @@ class World(object):
         :param: None
         :return lane_delay: approximate delay of each lane
         '''
-        # the delay of each lane: 1 - lane_avg_speed/speed_limit
-        lane_vehicles = self.eng.get_lane_vehicles()
-        lane_delay = {}
-        lanes = self.all_lanes
-        vehicle_speed = self.eng.get_vehicle_speed()
-
-        for lane in lanes:
-            vehicles = lane_vehicles[lane]
-            lane_vehicle_count = len(vehicles)
-            lane_avg_speed = 0.0
-            for vehicle in vehicles:
-                speed = vehicle_speed[vehicle]
-                lane_avg_speed += speed
-            if lane_vehicle_count == 0:
-                lane_avg_speed = self.all_lanes_speed[lane]
-            else:
-                lane_avg_speed /= lane_vehicle_count
-            lane_delay[lane] = 1 - lane_avg_speed / self.all_lanes_speed[lane]
+        lane_delay = dict(zip(self.all_lanes, self.get_lane_array("lane_delay").tolist()))
         return lane_delay
 
     def get_vehicle_trajectory(self):
         '''
         get_vehicle_trajectory
         Get trajectory of vehicles that have entered in roadnet, including vehicle_id, enter time, leave time or current time.
+        Trajectories are recorded from the vehicle tracker's deltas once this method or its info is used.
         
         :param: None
         :return vehicle_trajectory: trajectory of vehicles that have entered in roadnet
         '''
-        # lane_id and time spent on the corresponding lane that each vehicle went through
-        vehicle_lane = self.get_vehicle_lane() # get vehicles on tne roads except turning
-        vehicles = self.eng.get_vehicles(include_waiting=False)
-        for vehicle in vehicles:
-            if vehicle not in self.vehicle_trajectory:
-                self.vehicle_trajectory[vehicle] = [[vehicle_lane[vehicle], int(self.eng.get_current_time()), 0]]
-            else:
-                if vehicle not in vehicle_lane.keys(): # vehicle is turning
-                    continue
-                if vehicle_lane[vehicle] == self.vehicle_trajectory[vehicle][-1][0]: # vehicle is running on the same lane 
-                    self.vehicle_trajectory[vehicle][-1][2] += 1
-                else: # vehicle has changed the lane
-                    self.vehicle_trajectory[vehicle].append(
-                        [vehicle_lane[vehicle], int(self.eng.get_current_time()), 0])
+        # lane_id and time spent on the corresponding lane that each vehicle went through, turning is not recorded
+        if self.trajectory_store is None:
+            self.trajectory_store = TrajectoryStore(self.all_lanes)
+            self.vehicle_tracker.subscribe(self.trajectory_store.update)
+            self.vehicle_trajectory = self.trajectory_store
+            self.real_delay_accumulator = RealDelayAccumulator(
+                self.trajectory_store,
+                [self.lane_length[lane] for lane in self.all_lanes],
+                [min(self.all_lanes_speed[lane], 11.11) for lane in self.all_lanes])
+            self.lane_exit_events = LaneExitEvents(self.trajectory_store)
         return self.vehicle_trajectory
 
+    def get_lane_exit_events(self):
+        '''
+        get_lane_exit_events
+        Get ring buffers of lane exits, e.g. vehicles passing an intersection. Trajectories are recorded from now on.
+
+        :param: None
+        :return lane_exit_events: LaneExitEvents of the trajectory store
+        '''
+        self.get_vehicle_trajectory()
+        return self.lane_exit_events
+
     def get_history_vehicles(self):
         '''
         get_history_vehicles
@@ -693,6 +841,7 @@ class World(object):
         """
         #roadnet_file = osp.join(cityflow_config["dir"], cityflow_config["roadnetFile"])
         roadnet_file = os.path.join(cityflow_config["dir"], cityflow_config["roadnetFile"])
+        self.roadnet_file = roadnet_file
         with open(roadnet_file) as f:
             roadnet = json.load(f)
         return roadnet
@@ -711,6 +860,9 @@ class World(object):
             if fn in self.info_functions:
                 if not fn in self.fns:
                     self.fns.append(fn)
+                if fn in ["vehicle_trajectory", "real_delay"]:
+                    # trajectories are only recorded when needed
+                    self.get_vehicle_trajectory()
             else:
                 raise Exception("info function %s not exists" % fn)
 
@@ -723,9 +875,6 @@ class World(object):
         :param actions: actions list to be executed at all intersections at the next step
         :return: None
         '''
-        #  update previous measurement
-        self.dic_lane_vehicle_previous_step = self.dic_lane_vehicle_current_step
-
         if actions is not None:
             for i, action in enumerate(actions):
                 self.intersections[i].step(action, self.interval)
@@ -733,7 +882,43 @@ class World(object):
         self._update_infos()
         # update current measurement
         self.update_current_measurements()
-        self.vehicle_trajectory = self.get_vehicle_trajectory()
+
+    def step_n(self, actions, n, on_step=None, mean_fns=()):
+        '''
+        step_n
+        Take the same actions for n steps in one call, e.g. a whole action_interval.
+        
+        :param actions: actions list to be executed at all intersections at each of the n steps
+        :param n: number of steps
+        :param on_step: None or callable without arguments, called after each step to read per-step information
+        :param mean_fns: lane infos averaged over the n steps, e.g. inputs of rewards, see swap_lane_state
+        :return lane_means: dict of lane info name to its lane array averaged over the n steps
+        '''
+        # one vectorized sum per lane info and step instead of generating rewards of every agent at each step
+        lane_sums = {fn: np.zeros(len(self.all_lanes), dtype=np.float64) for fn in mean_fns}
+        for _ in range(n):
+            self.step(actions)
+            for fn, lane_sum in lane_sums.items():
+                lane_sum += self.get_lane_array(fn)
+            if on_step is not None:
+                on_step()
+        lane_means = {fn: (lane_sum / n).astype(np.float32) for fn, lane_sum in lane_sums.items()}
+        return lane_means
+
+    def swap_lane_state(self, lane_state):
+        '''
+        swap_lane_state
+        Replace the lane arrays returned by get_lane_array, e.g. by the means of step_n to generate rewards of an
+        interval once. Lane infos missing in lane_state are computed from the current step as usual.
+        
+        :param lane_state: dict of lane info name to lane array
+        :return previous: dict of replaced lane arrays, swap it back to restore them
+        '''
+        previous = self.lane_state
+        self.lane_state = lane_state
+        # shared generators must not serve outputs of the other arrays
+        self.info_version += 1
+        return previous
 
     def reset(self):
         '''
@@ -743,36 +928,176 @@ class World(object):
         :param: None
         :return: None
         '''
+        if self.warm_snapshot is not None:
+            self.load_snapshot(self.warm_snapshot)
+            return
         self.eng.reset()
         for I in self.intersections:
             I.reset()
         self._update_infos()
         # reset vehicles info
         self.reset_vehicle_info()
+        if self.warmup > 0:
+            self._warm_up()
+            self._clear_metrics()
+            self.warm_snapshot = self.save_snapshot()
+
+    def _warm_up(self):
+        '''
+        _warm_up
+        Simulate self.warmup steps with fixed-time control, switching to the next phase every
+        self.warmup_phase_time seconds.
+
+        :param: None
+        :return: None
+        '''
+        phase_time = max(int(self.warmup_phase_time), 1)
+        for _ in range(int(self.warmup)):
+            t = int(self.eng.get_current_time())
+            actions = [(t // phase_time) % max(len(I.phases), 1) for I in self.intersections]
+            self.step(actions)
+
+    def _clear_metrics(self):
+        '''
+        _clear_metrics
+        Drop throughput, leave times and trajectories recorded so far, e.g. during warm-up.
+        Vehicles still running keep their enter time and tracked lane.
+
+        :param: None
+        :return: None
+        '''
+        self.throughput = 0
+        self.list_leave_time = []
+        self.exit_road_throughput = {road: 0 for road in self.exit_roads}
+        self.dic_vehicle_arrive_leave_time = {vehicle: record for vehicle, record
+                                              in self.dic_vehicle_arrive_leave_time.items()
+                                              if np.isnan(record["cost_time"])}
+        self.history_vehicles = set(self.eng.get_vehicles())
+        if self.trajectory_store is not None:
+            # running vehicles are recorded again from the next lane they enter
+            self.trajectory_store.reset()
+            self.real_delay_accumulator.reset()
+            self.lane_exit_events.reset()
+
+    def save_snapshot(self):
+        '''
+        save_snapshot
+        Capture the engine archive together with the Python-side tracking state.
+
+        :param: None
+        :return snapshot: dict that can be passed to load_snapshot any number of times
+        '''
+        snapshot = {
+            "engine": self.eng.snapshot(),
+            "intersections": [I.get_state() for I in self.intersections],
+            "vehicle_tracker": self.vehicle_tracker.get_state(),
+            "trajectory_store": self.trajectory_store.get_state() if self.trajectory_store is not None else None,
+            "real_delay_accumulator": (self.real_delay_accumulator.get_state()
+                                       if self.real_delay_accumulator is not None else None),
+            "lane_exit_events": self.lane_exit_events.get_state() if self.lane_exit_events is not None else None,
+            "vehicle_info": copy.deepcopy({
+                "vehicle_slot": self.vehicle_slot,
+                "slot_vehicles": self.slot_vehicles,
+                "waiting_time": self.waiting_time,
+                "history_vehicles": self.history_vehicles,
+                "dic_vehicle_arrive_leave_time": self.dic_vehicle_arrive_leave_time,
+                "throughput": self.throughput,
+                "list_leave_time": self.list_leave_time,
+                "exit_road_throughput": self.exit_road_throughput
+            })
+        }
+        return snapshot
+
+    def load_snapshot(self, snapshot):
+        '''
+        load_snapshot
+        Restore the engine and the Python-side tracking state captured by save_snapshot.
+
+        :param snapshot: dict returned by save_snapshot
+        :return: None
+        '''
+        self.eng.load(snapshot["engine"])
+        for I, state in zip(self.intersections, snapshot["intersections"]):
+            I.set_state(state)
+        self.vehicle_tracker.set_state(snapshot["vehicle_tracker"])
+        if self.trajectory_store is not None:
+            # trajectory recording may start after the snapshot was taken
+            if snapshot["trajectory_store"] is not None:
+                self.trajectory_store.set_state(snapshot["trajectory_store"])
+                self.real_delay_accumulator.set_state(snapshot["real_delay_accumulator"])
+                self.lane_exit_events.set_state(snapshot["lane_exit_events"])
+            else:
+                self.trajectory_store.reset()
+                self.real_delay_accumulator.reset()
+                self.lane_exit_events.reset()
+        for key, value in copy.deepcopy(snapshot["vehicle_info"]).items():
+            setattr(self, key, value)
+        # drop cached infos, per-step states are restored above and must not be updated again
+        self.info = {}
+        self.info_version += 1
+        self.lane_state = {}
+        self.vehicle_arrays = None
 
     def _update_infos(self):
         '''
         _update_infos
         Update global information after reset or each step.
+        Information is computed lazily by get_info, only states kept across steps are updated here.
         
         :param: None
         :return: None
         '''
         self.info = {}
+        self.info_version += 1
+        self.lane_state = {}
+        self.vehicle_arrays = None
         for fn in self.fns:
-            self.info[fn] = self.info_functions[fn]()
+            if fn in self.info_updaters:
+                self.info_updaters[fn]()
 
     def get_info(self, info):
         '''
         get_info
-        Get specific information.
+        Get specific information. It's computed on first request and memoized until the next step.
         
         :param info: the name of the specific information
         :return _info: specific information
         '''
+        if info not in self.info:
+            self.info[info] = self.info_functions[info]()
         _info = self.info[info]
         return _info
 
+    def get_lane_array(self, info):
+        '''
+        get_lane_array
+        Get specific lane information as an array ordered by self.lane_index.
+        It's computed on first request and memoized until the next step.
+        
+        :param info: the name of the specific lane information, must be in self.lane_infos
+        :return lane_array: np.ndarray of shape [num_lanes], lanes without a value are set to 0
+        '''
+        if info not in self.lane_state:
+            if info in self.lane_array_functions:
+                self.lane_state[info] = self.lane_array_functions[info]()
+            else:
+                self.lane_state[info] = self._get_lane_array(self.get_info(info))
+        lane_array = self.lane_state[info]
+        return lane_array
+
+    def _get_lane_array(self, result):
+        '''
+        _get_lane_array
+        Convert a dict keyed by lane id into an array ordered by self.lane_index.
+        
+        :param result: dict of lane id to value
+        :return lane_array: np.ndarray of shape [num_lanes]
+        '''
+        lane_array = np.zeros(len(self.all_lanes), dtype=np.float32)
+        idx = np.fromiter(map(self.lane_index.__getitem__, result.keys()), dtype=np.int64, count=len(result))
+        lane_array[idx] = np.fromiter(result.values(), dtype=np.float32, count=len(result))
+        return lane_array
+
     def get_average_travel_time(self):
         '''
         get_average_travel_time
@@ -817,31 +1142,22 @@ class World(object):
         :param: None
         :return avg_delay: average real delay of all vehicles
         '''
-        self.vehicle_trajectory = self.get_vehicle_trajectory()
-        for v in self.vehicle_trajectory:
-            # get road level routes of vehicle
-            routes = self.vehicle_trajectory[v] # lane_level
-            for idx,lane in enumerate(routes):
-                # speed = min(self.all_lanes_speed[lane[0]], float(info['speed']))
-                speed = min(self.all_lanes_speed[lane[0]], 11.11)
-                lane_length = self.lane_length[lane[0]]
-                if idx == len(routes)-1: # the last lane
-                    # judge whether the vehicle run over the whole lane.
-                    dis = self.eng.get_vehicle_distance()
-                    lane_length = dis[v] if v in dis.keys() else lane_length
-                planned_tt = float(lane_length)/speed
-                real_delay = lane[-1] - planned_tt if lane[-1]>planned_tt else 0.
-                if v not in self.real_delay.keys():
-                    self.real_delay[v] = real_delay
-                else:
-                    self.real_delay[v] += real_delay
-
-        avg_delay = 0.
-        count = 0
-        for dic in self.real_delay.items():
-            avg_delay += dic[1]
-            count += 1
-        avg_delay = avg_delay / count
+        # delay of ended segments is accumulated when vehicles leave lanes,
+        # only the current lane of running vehicles is calculated here, up to their distance on it
+        self.get_vehicle_trajectory()
+        store = self.trajectory_store
+        # last segments still open are those of recorded vehicles running on lanes
+        rows = store.last_row[:len(store)]
+        rows = rows[store.end[rows] < 0]
+        dis = self.eng.get_vehicle_distance()
+        vehicle_ids = store.vehicle_ids
+        distance = np.fromiter((dis.get(vehicle_ids[v], np.nan) for v in store.vehicle[rows].tolist()),
+                               dtype=np.float64, count=len(rows))
+        # vehicles without a distance count the whole lane
+        missing = np.isnan(distance)
+        distance[missing] = self.real_delay_accumulator.lane_length[store.lane[rows[missing]]]
+        open_delay = float(self.real_delay_accumulator.segment_delays(rows, distance).sum())
+        avg_delay = self.real_delay_accumulator.average(open_delay)
         return avg_delay
         
 
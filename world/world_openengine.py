@@ -8,6 +8,8 @@ import os
 from math import atan2, pi
 import random
 import gc
+from itertools import chain, repeat
+import numpy as np
 
 
 def _get_direction(road):
@@ -71,14 +73,9 @@ class Intersection(object):
         self.current_phase_time = 0
         self.yellow_phase_time = 0
 
-        # set vehicle info on lanes. should be {in_time, speed, accumulated_wait_time, }
-        self.vehicles_cur = {lane: dict() for lane in self.lanes}
-        # should be {in_time, out_time}
-        self.vehicles = {lane: dict() for lane in self.lanes}
-        # control vehicle info on each road since it has lane change
-        self.vehicles_cur_road = {road: dict() for road in self.roads}
-        self.vehicles_road = {road: dict() for road in self.roads}
-
+        # vehicles on lanes are tracked once for the whole network by the world,
+        # lane_idx is the position of self.lanes in the world's per-lane arrays, it's set by the world
+        self.lane_idx = None
         self.full_observation = {lane: dict() for lane in self.lanes}
 
     def _sort_roads(self):
@@ -109,89 +106,26 @@ class Intersection(object):
         '''
         self.current_phase = 0
         self.current_phase_time = 0
-        self.vehicles_cur = {lane: dict() for lane in self.lanes}
-        self.vehicles = {lane: dict() for lane in self.lanes}
-        self.vehicles_cur_road = {road: dict() for road in self.roads}
-        self.vehicles_road = {road: dict() for road in self.roads}
         self.full_observation = {lane: dict() for lane in self.lanes}
 
     def observe(self):
         '''
         observe
         Get observation of the whole roadnet, including lane_waiting_time_count, lane_waiting_count, lane_count and queue_length.
+        Lane measures are sliced from the world's arrays, they are updated once per step in World._update_lane_snapshot.
         
         :param: None
         :return: None
         '''
         # TODO: DOUBLE CHECK IF OUT LANE COUNT?
-        speed = self.world.eng.get_vehicle_speed()
-        # for debug
-        """
-        print('\n')
-        print('lane_vehicle: ', self.eng.get_lane_vehicles())
-        """
-        for lane in self.lanes:
-            lane_vehicles = [v 
-                for v in self.eng.get_lane_vehicles().get(lane, [])] # basic information returned from simulator
-            # process each vehicles on this lane
-            for v in lane_vehicles:
-                if v in self.vehicles_cur[lane].keys():
-                    self.vehicles_cur[lane][v]['speed'] = speed[v]
-                    if self.vehicles_cur[lane][v]['speed'] == 0:
-                        self.vehicles_cur[lane][v]['wait_time'] += 1
-                elif v not in self.vehicles_cur_road[int(str(lane)[:-2])]:
-                    # TODO: new vehicle. since start speed is set to be 0, modifiy it
-                    self.vehicles_cur[lane][v] = {'speed': -1, 'wait_time': -1,
-                     'start_time': self.world.eng.get_current_time()}
-                    self.vehicles_cur_road[int(str(lane)[:-2])].update({v: lane})
-                else:
-                    assert v not in self.vehicles_cur[lane].keys()
-                    road = lane // 100
-                    for para_lane in self.road_lane_mapping[road]:
-                        if v in self.vehicles_cur[para_lane]:
-                            out = False
-                            # change lanes
-                            prev_lane = self.vehicles_cur_road[int(str(lane)[:-2])][v]
-                            self.vehicles_cur[lane][v] = self.vehicles_cur[para_lane].pop(v)
-                            break
-        for lane in self.lanes:
-            lane_mearsures = {'lane_waiting_time_count': 0, 'lane_waiting_count': 0,
-            'lane_count': 0, 'queue_length': 0}
-            lane_vehicles = [v 
-                for v in self.world.eng.get_lane_vehicles().get(lane, [])]
-            out = self.vehicles_cur[lane].keys() - lane_vehicles
-            for v in out:
-                self.vehicles[lane].update({v: {'start_time': self.vehicles_cur[lane][v]['start_time'],
-                 'end_time': self.world.eng.get_current_time()}})
-                 # could combine this two step
-                self.vehicles_cur[lane].pop(v)
-                self.vehicles_cur_road[int(str(lane)[:-2])].pop(v)
-                # TODO: CHECKOU HERE WHY NOT POPED
-            # process information of this lane based on vehicles states
-            
-            for k, v in self.vehicles_cur[lane].items():
-                if v['speed'] == 0:
-                    lane_mearsures['lane_waiting_count'] += 1
-                    # TODO: talk about it later
-                if v['wait_time'] > 0:
-                    lane_mearsures['lane_waiting_time_count'] += v['wait_time']
-                    # TODO: add queue length later
-                lane_mearsures['lane_count'] += 1
-            self.full_observation[lane] = lane_mearsures
-        test = 0
-        """
-        print('\n')
-        print('vehicle: ')
-        for lane in self.vehicles.keys():
-            if self.vehicles[lane].keys():
-                print(lane, ': ' , self.vehicles[lane].keys())
-        print('vehicle: ', self.vehicles)
-        print('\n')
-        print('vehicle_cur : ')
-        for lane in self.vehicles_cur.keys():
-            if self.vehicles_cur[lane].keys():
-                print(lane, ': ' , self.vehicles_cur[lane].keys())
-        """
+        world = self.world
+        for lane, waiting_time_count, waiting_count, count in zip(
+                self.lanes, world.lane_waiting_time_count[self.lane_idx].tolist(),
+                world.lane_waiting_count[self.lane_idx].tolist(), world.lane_count[self.lane_idx].tolist()):
+            # TODO: add queue length later
+            self.full_observation[lane] = {'lane_waiting_time_count': waiting_time_count,
+                                           'lane_waiting_count': waiting_count,
+                                           'lane_count': count, 'queue_length': 0}
 
     def psedo_step(self, action=None):
         '''
@@ -266,6 +200,14 @@ class World(object):
         # track vehicles in and out
         self.vehicles = dict()
         self.vehicles_cur = dict()
+        # intern lanes into integer indices, per-lane arrays are ordered by this index
+        self.lane_index = {lane: idx for idx, lane in enumerate(self.all_lanes)}
+        self.lane_road = np.array([lane // 100 for lane in self.all_lanes], dtype=np.int64)
+        self.lane_speed_limit = np.array([self.lane_maxSpeed[lane] for lane in self.all_lanes], dtype=np.float64)
+        for inter in self.intersections:
+            inter.lane_idx = np.array([self.lane_index[lane] for lane in inter.lanes], dtype=np.int64)
+        self._reset_lane_snapshot()
+        self._update_lane_snapshot()
 
 
         self.info_functions = {
@@ -284,8 +226,14 @@ class World(object):
             "throughput": None,
             "average_travel_time": None
         }
+        # infos with a value per lane, generators read them as arrays through get_lane_array
+        self.lane_infos = ["lane_count", "lane_waiting_count", "lane_waiting_time_count", "lane_delay"]
         self.fns = []
         self.info = {}
+        self.lane_state = {}  # key: lane info name, value: np.ndarray of shape [num_lanes]
+        # bumped whenever self.info is dropped, shared generators memoize their output per version
+        self.info_version = 0
+        self.generator_registry = {}  # see BaseGenerator.shared
         # subscibe it to process vehicles on each lane throught intersection objects
         self.subscribe('lane_vehicles')
         self._update_infos()
@@ -480,6 +428,7 @@ class World(object):
             self.eng.next_step()
             # update lane information of each intersection
             self._update_infos()
+            self._update_lane_snapshot()
             for inter in self.intersections:
                 inter.observe()
             v_cur = self.eng.get_vehicles()
@@ -492,6 +441,21 @@ class World(object):
         else:
             raise Exception('provide action in RL or need some spefic design for non-RL agents')
 
+    def step_n(self, actions, n, on_step=None):
+        '''
+        step_n
+        Take the same actions for n steps in one call, e.g. a whole action_interval.
+        
+        :param actions: actions list to be executed at all intersections at each of the n steps
+        :param n: number of steps
+        :param on_step: None or callable without arguments, called after each step to read per-step information
+        :return: None
+        '''
+        for _ in range(n):
+            self.step(actions)
+            if on_step is not None:
+                on_step()
+
     def subscribe(self, fns):
         '''
         subscribe
@@ -527,19 +491,129 @@ class World(object):
         self.vehicles_cur = dict()
         for inter in self.intersections:
             self.id2intersection[inter.id] = inter
+            inter.lane_idx = np.array([self.lane_index[lane] for lane in inter.lanes], dtype=np.int64)
         self.intersection_ids = [i.id for i in self.intersections]
+        self._reset_lane_snapshot()
+        self._update_lane_snapshot()
         for inter in self.intersections:
             inter.observe()
         self._update_infos()
 
+    def _reset_lane_snapshot(self):
+        '''
+        _reset_lane_snapshot
+        Forget all tracked vehicles of the per-step lane snapshot.
+        
+        :param: None
+        :return: None
+        '''
+        # records of vehicles on lanes, indexed by the vehicle's slot in self.vehicle_slot.
+        # a record starts when a vehicle enters a road and moves with it when it changes lanes on the road
+        self.vehicle_slot = {}  # key: vehicle_id, value: slot index
+        self.slot_vehicles = []  # key: slot index, value: vehicle_id
+        self.vehicle_lane = np.full(1024, -1, dtype=np.int64)  # lane index, -1 if not on a lane
+        self.vehicle_speed = np.zeros(1024, dtype=np.float64)  # -1 on the first step of a record
+        self.vehicle_wait = np.zeros(1024, dtype=np.int64)  # steps with speed 0, -1 on the first step of a record
+        self.vehicle_start = np.zeros(1024, dtype=np.float64)
+        # key: lane id, value: {vehicle_id: {'start_time', 'end_time'}} of records ended on the lane
+        self.lane_vehicle_history = {lane: dict() for lane in self.all_lanes}
+        num_lanes = len(self.all_lanes)
+        self.lane_count = np.zeros(num_lanes, dtype=np.int64)
+        self.lane_waiting_count = np.zeros(num_lanes, dtype=np.int64)
+        self.lane_waiting_time_count = np.zeros(num_lanes, dtype=np.int64)
+        self.lane_speed_sum = np.zeros(num_lanes, dtype=np.float64)
+
+    def _get_vehicle_slots(self, vehicles):
+        '''
+        _get_vehicle_slots
+        Get slot indices of vehicles, vehicles seen for the first time are given new slots.
+
+        :param vehicles: list of vehicle ids
+        :return slots: np.ndarray of int64 slot indices
+        '''
+        slots = np.fromiter(map(self.vehicle_slot.get, vehicles, repeat(-1)), dtype=np.int64, count=len(vehicles))
+        new = np.nonzero(slots < 0)[0]
+        if len(new) > 0:
+            start = len(self.slot_vehicles)
+            for n, i in enumerate(new.tolist()):
+                self.vehicle_slot[vehicles[i]] = start + n
+                self.slot_vehicles.append(vehicles[i])
+            slots[new] = np.arange(start, start + len(new))
+            if len(self.slot_vehicles) > len(self.vehicle_lane):
+                size = 2 * len(self.slot_vehicles)
+                self.vehicle_lane = np.concatenate([self.vehicle_lane,
+                                                    np.full(size - len(self.vehicle_lane), -1, dtype=np.int64)])
+                self.vehicle_speed = np.concatenate([self.vehicle_speed, np.zeros(size - len(self.vehicle_speed))])
+                self.vehicle_wait = np.concatenate([self.vehicle_wait,
+                                                    np.zeros(size - len(self.vehicle_wait), dtype=np.int64)])
+                self.vehicle_start = np.concatenate([self.vehicle_start, np.zeros(size - len(self.vehicle_start))])
+        return slots
+
+    def _update_lane_snapshot(self):
+        '''
+        _update_lane_snapshot
+        Fetch one snapshot of lane vehicles and speeds for the whole network and update vehicle records
+        and per-lane measures, intersections read their lanes from these arrays in observe.
+        
+        :param: None
+        :return: None
+        '''
+        lane_vehicles = self.eng.get_lane_vehicles()
+        speed = self.eng.get_vehicle_speed()
+        now = self.eng.get_current_time()
+        lists = [lane_vehicles.get(lane, []) for lane in self.all_lanes]
+        counts = np.fromiter(map(len, lists), dtype=np.int64, count=len(lists))
+        vehicles = list(chain.from_iterable(lists))
+        cur_lane = np.repeat(np.arange(len(self.all_lanes)), counts)
+        slots = self._get_vehicle_slots(vehicles)
+        prev_lane = self.vehicle_lane[slots]
+
+        # a vehicle stays on its lane, changes lanes on the same road or enters a new road
+        same_lane = prev_lane == cur_lane
+        changed_lane = (prev_lane >= 0) & ~same_lane & \
+            (self.lane_road[np.maximum(prev_lane, 0)] == self.lane_road[cur_lane])
+        entered = ~(same_lane | changed_lane)
+        # records end when vehicles leave the network or enter a new road
+        present = np.zeros(len(self.vehicle_lane), dtype=bool)
+        present[slots] = True
+        gone = np.nonzero((self.vehicle_lane >= 0) & ~present)[0]
+        ended = np.concatenate([gone, slots[entered & (prev_lane >= 0)]])
+        for slot, lane, start in zip(ended.tolist(), self.vehicle_lane[ended].tolist(),
+                                     self.vehicle_start[ended].tolist()):
+            self.lane_vehicle_history[self.all_lanes[lane]][self.slot_vehicles[slot]] = \
+                {'start_time': start, 'end_time': now}
+        self.vehicle_lane[gone] = -1
+
+        speeds = np.fromiter(map(speed.get, vehicles, repeat(0.)), dtype=np.float64, count=len(vehicles))
+        stay = slots[same_lane]
+        self.vehicle_speed[stay] = speeds[same_lane]
+        self.vehicle_wait[stay] += speeds[same_lane] == 0
+        # TODO: new vehicle. since start speed is set to be 0, modifiy it
+        new = slots[entered]
+        self.vehicle_speed[new] = -1
+        self.vehicle_wait[new] = -1
+        self.vehicle_start[new] = now
+        self.vehicle_lane[slots] = cur_lane
+
+        num_lanes = len(self.all_lanes)
+        wait = self.vehicle_wait[slots]
+        self.lane_count = counts
+        self.lane_waiting_count = np.bincount(cur_lane, weights=self.vehicle_speed[slots] == 0,
+                                              minlength=num_lanes).astype(np.int64)
+        self.lane_waiting_time_count = np.bincount(cur_lane, weights=np.maximum(wait, 0),
+                                                   minlength=num_lanes).astype(np.int64)
+        self.lane_speed_sum = np.bincount(cur_lane, weights=speeds, minlength=num_lanes)
+
     def get_info(self, info):
         '''
         get_info
-        Get specific information.
+        Get specific information. It's computed on first request and memoized until the next step.
         
         :param info: the name of the specific information
         :return _info: specific information
         '''
+        if info not in self.info:
+            self.info[info] = self.info_functions[info]()
         _info = self.info[info]
         return _info
 
@@ -547,14 +621,38 @@ class World(object):
         '''
         _update_infos
         Update global information after reset or each step.
+        Information is computed lazily by get_info.
         
         :param: None
         :return: None
         '''
         self.info = {}
-        for fn in self.fns:
-            self.info[fn] = self.info_functions[fn]()
-    
+        self.info_version += 1
+        self.lane_state = {}
+
+    def get_lane_array(self, info):
+        '''
+        get_lane_array
+        Get specific lane information as an array ordered by self.lane_index.
+        Waiting counts are taken from the lane snapshot, the others are converted from get_info.
+        It's computed on first request and memoized until the next step.
+
+        :param info: the name of the specific lane information, must be in self.lane_infos
+        :return lane_array: np.ndarray of shape [num_lanes], lanes without a value are set to 0
+        '''
+        if info not in self.lane_state:
+            if info == "lane_waiting_count":
+                lane_array = self.lane_waiting_count.astype(np.float32)
+            elif info == "lane_waiting_time_count":
+                lane_array = self.lane_waiting_time_count.astype(np.float32)
+            else:
+                result = self.get_info(info)
+                lane_array = np.fromiter((result.get(lane, 0) for lane in self.all_lanes), dtype=np.float32,
+                                         count=len(self.all_lanes))
+            self.lane_state[info] = lane_array
+        lane_array = self.lane_state[info]
+        return lane_array
+
     # TODO implement it
     def get_vehicles(self):
         '''
@@ -601,11 +699,7 @@ class World(object):
         :param: None
         :return result: waiting time of vehicles in each lane
         '''
-        # this is the test
-        result = dict()
-        for intsec in self.intersections:
-            for lane in intsec.lanes:
-                result.update({lane: intsec.full_observation[lane]['lane_waiting_time_count']})
+        result = dict(zip(self.all_lanes, self.lane_waiting_time_count.tolist()))
         return result
 
     def get_lane_waiting_vehicle_count(self):
@@ -616,10 +710,7 @@ class World(object):
         :param: None
         :return result: number of waiting vehicles in each lane
         '''
-        result = dict()
-        for intsec in self.intersections:
-            for lane in intsec.lanes:
-                result.update({lane: intsec.full_observation[lane]['lane_waiting_count']})
+        result = dict(zip(self.all_lanes, self.lane_waiting_count.tolist()))
         return result
 
     def get_cur_phase(self):
@@ -686,27 +777,10 @@ class World(object):
         :return lane_delay: approximate delay of each lane
         '''
         # the delay of each lane: 1 - lane_avg_speed/speed_limit
-        # set speed limit to 11.11 by default
-        cur_lane_records = dict()
-        for inter in self.intersections:
-            for k, v in inter.vehicles_cur[lane].items():
-                cur_lane_records.update({k: v})
-
-        lane_delay = dict()
-        for key in cur_lane_records.keys():
-            # could be non in the few first steps
-            vehicles = cur_lane_records[key].keys()
-            lane_vehicle_count = len(vehicles)
-            lane_avg_speed = 0.0
-            speed_limit = self.lane_maxSpeed[key]
-            for vehicle in vehicles:
-                speed = vehicle['speed']
-                lane_avg_speed += speed
-            if lane_vehicle_count == 0:
-                lane_avg_speed = speed_limit
-            else:
-                lane_avg_speed /= lane_vehicle_count
-            lane_delay[key] = 1 - lane_avg_speed / speed_limit
+        # lanes without vehicles run at the speed limit
+        lane_avg_speed = np.where(self.lane_count > 0, self.lane_speed_sum / np.maximum(self.lane_count, 1),
+                                  self.lane_speed_limit)
+        lane_delay = dict(zip(self.all_lanes, (1 - lane_avg_speed / self.lane_speed_limit).tolist()))
         return lane_delay
 
     def get_cur_throughput(self):
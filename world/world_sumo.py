@@ -13,14 +13,27 @@ if 'SUMO_HOME' in os.environ:
 else:
     sys.exit('No SUMO in environment path')
 from common.registry import Registry
+from world.utils import VehicleTracker, TrajectoryStore, RealDelayAccumulator
+from world.topology import load_sumo_topology
+from world.traci_pipeline import PipelinedTraCIClient, supports_pipelining, TRACI_VERSIONS
 
 import json
 import re
 import copy
+from itertools import compress
+import numpy as np
 
 import sumolib
 import libsumo
 import traci
+import traci.constants as tc
+
+# variables of each vehicle subscribed when it departs, results are read in one batch per step
+VEHICLE_VARIABLES = [tc.VAR_LANE_ID, tc.VAR_WAITING_TIME, tc.VAR_SPEED, tc.VAR_LANEPOSITION, tc.VAR_ALLOWED_SPEED]
+# simulation variables subscribed once, they come with the response of each simulation step
+SIMULATION_VARIABLES = [tc.VAR_TIME, tc.VAR_DEPARTED_VEHICLES_IDS, tc.VAR_ARRIVED_VEHICLES_IDS]
+# duration of phases in the programs set to the lights, phases are only left by an explicit setPhase
+PHASE_HOLD_TIME = 1e6
 
 class Intersection(object):
     '''
@@ -60,10 +73,12 @@ class Intersection(object):
         self.next_phase = 0
         self.current_phase_time = 0
 
-        self.yellow_phase_time = min([i.duration for i in self.eng.trafficlight.getAllProgramLogics(self.id)[0].phases])
+        # static links and lane shapes are shared through the world's topology, no simulator calls needed
+        topology = world.topology["traffic_lights"][self.id]
+        self.yellow_phase_time = topology["yellow_phase_time"]
         self.map_name = world.map  # TODO: try to add it to Registry later
 
-        self.lanelinks = world.eng.trafficlight.getControlledLinks(self.id)
+        self.lanelinks = topology["controlled_links"]
         for link in self.lanelinks:
             link = link[0]
             if link[0][:-2] not in self.road_lane_mapping.keys():
@@ -71,7 +86,7 @@ class Intersection(object):
                 self.road_lane_mapping[link[0][:-2]].append(link[0])
                 self.roads.append(link[0][:-2])
                 self.outs.append(False)
-                road = self.eng.lane.getShape(link[0])
+                road = topology["lane_shapes"][link[0]]
                 self.directions.append(self._get_direction(road, False))
             elif link[0][:-2] in self.road_lane_mapping.keys() and link[0] not in self.road_lane_mapping[link[0][:-2]]:
                 self.road_lane_mapping[link[0][:-2]].append(link[0])
@@ -80,7 +95,7 @@ class Intersection(object):
                 self.road_lane_mapping[link[1][:-2]].append(link[1])
                 self.roads.append(link[1][:-2])
                 self.outs.append(True)
-                road = self.eng.lane.getShape(link[1])
+                road = topology["lane_shapes"][link[1]]
                 self.directions.append(self._get_direction(road, True))
             elif link[1][:-2] in self.road_lane_mapping.keys() and link[1] not in self.road_lane_mapping[link[1][:-2]]:
                 self.road_lane_mapping[link[1][:-2]].append(link[1])
@@ -100,7 +115,7 @@ class Intersection(object):
             tmp_startane = []
             for n, i in enumerate(p.state):
                 if i == 'G' or i == 's':
-                    links = self.world.eng.trafficlight.getControlledLinks(self.id)[n][0]
+                    links = self.lanelinks[n][0]
                     tmp_lanelinks.append([links[0], links[1]])
                     if links[0] not in tmp_startane:
                         tmp_startane.append(links[0])
@@ -110,11 +125,12 @@ class Intersection(object):
             self.phase_available_lanelinks.append(tmp_lanelinks)
 
         self.full_phases, self.yellow_dict = self.create_yellows(self.green_phases, self.yellow_phase_time, self.interface_flag)
+        # current_phase is kept locally, so SUMO must not switch phases on its own
         programs = self.eng.trafficlight.getAllProgramLogics(self.id)
-        logic = programs[0]
-        logic.type = 0
-        logic.phases = self.full_phases
-        self.eng.trafficlight.setProgramLogic(self.id, logic)
+        self.program_logic = programs[0]
+        self.program_logic.type = 0
+        self.program_logic.phases = [self.eng.trafficlight.Phase(PHASE_HOLD_TIME, p.state) for p in self.full_phases]
+        self.eng.trafficlight.setProgramLogic(self.id, self.program_logic)
 
         # dictionary of remembered features
         self.waiting_times = dict()
@@ -154,13 +170,10 @@ class Intersection(object):
         self.waiting_times = dict()
         self.full_observation = None
         self.last_step_vehicles = None
-        self.current_phase = self.get_current_phase()
         # eng is set in world
-        programs = self.eng.trafficlight.getAllProgramLogics(self.id)
-        logic = programs[0]
-        logic.type = 0
-        logic.phases = self.full_phases
-        self.eng.trafficlight.setProgramLogic(self.id, logic)
+        self.eng.trafficlight.setProgramLogic(self.id, self.program_logic)
+        # the only query of the phase, it's tracked locally afterwards
+        self.current_phase = self.get_current_phase()
 
     def get_current_phase(self):
         '''
@@ -182,38 +195,28 @@ class Intersection(object):
         :param new_phase: phase that will be executed in the later
         :return: None
         '''
-        if self.get_current_phase() == new_phase:
-            self.next_phase = self.get_current_phase()
-            if self.interface_flag:
-                self.eng.trafficlight.setPhase(self.id, int(self.next_phase))
-            else:
-                self.eng.trafficlight.setPhase(self.id, self.next_phase)
-            self.current_phase = self.get_current_phase()
+        if self.current_phase == new_phase:
+            self.next_phase = self.current_phase
         else:
             self.next_phase = new_phase
             # find yellow phase between cur and next phases
-            y_key = str(self.get_current_phase()) + '_' + str(new_phase)
+            y_key = str(self.current_phase) + '_' + str(new_phase)
             if y_key in self.yellow_dict:
                 y_id = self.yellow_dict[y_key]
-                if self.interface_flag:
-                    self.eng.trafficlight.setPhase(self.id, int(y_id))  # phase turns into yellow here
-                else:
-                    self.eng.trafficlight.setPhase(self.id, y_id)  # phase turns into yellow here
-                self.current_phase = self.get_current_phase()
+                self._change_phase(y_id)  # phase turns into yellow here
 
     def _change_phase(self, phase):
         '''
         _change_phase
         Change phase at current intersection.
+        Only a real transition is queued in the world, which sends all of them before the next simulation step.
         
         :param phase: phase to be executed at the next step
         :return: None
         '''
-        if self.interface_flag:
-            self.eng.trafficlight.setPhase(self.id, int(phase))
-        else:
-            self.eng.trafficlight.setPhase(self.id, phase)
-        self.current_phase = self.get_current_phase()
+        if phase != self.current_phase:
+            self.current_phase = phase
+            self.world.pending_phases[self.id] = phase
 
     def pseudo_step(self, action):
         '''
@@ -229,7 +232,7 @@ class Intersection(object):
         if self.current_phase_time == self.yellow_phase_time:
             self._change_phase(action)
         else:
-            if action != self.get_current_phase() and self.current_phase_time > self.yellow_phase_time:
+            if action != self.current_phase and self.current_phase_time > self.yellow_phase_time:
                 self.current_phase_time = 0
             if self.current_phase_time == 0:
                 self.prep_phase(action)
@@ -257,17 +260,19 @@ class Intersection(object):
             lane_vehicles = self._get_vehicles(lane, distance)
             for v in lane_vehicles:
                 all_vehicles.add(v)
+                # subscribed variables of the vehicle, fetched by the world once per step
+                v_results = self.world.get_vehicle_results(v)
                 if v in self.waiting_times:
                     self.waiting_times[v] += step_length
-                elif self.eng.vehicle.getWaitingTime(v) > 0:
-                    self.waiting_times[v] = self.eng.vehicle.getWaitingTime(v)
+                elif v_results[tc.VAR_WAITING_TIME] > 0:
+                    self.waiting_times[v] = v_results[tc.VAR_WAITING_TIME]
                 v_measures = dict()
                 v_measures['name'] = v
                 v_measures['wait'] = self.waiting_times[v] if v in self.waiting_times else 0
                 #TODO: CHEC ITS RIGHT CALCULATION?
                 lane_measures['queue_length'] = lane_measures['queue_length'] + 1
-                v_measures['speed'] = self.eng.vehicle.getSpeed(v)
-                v_measures['position'] = self.eng.vehicle.getLanePosition(v)
+                v_measures['speed'] = v_results[tc.VAR_SPEED]
+                v_measures['position'] = v_results[tc.VAR_LANEPOSITION]
                 vehicles.append(v_measures)
                 if v_measures['wait'] > 0:
                     lane_measures['lane_waiting_time_count'] += v_measures['wait']
@@ -300,15 +305,9 @@ class Intersection(object):
         :param max_distance: distance limitation that it can only get vehicles which are within the length of the lane
         :return detectable: number of vehicles
         '''
-        # TODO: reduce complexity -> find all vehicles within max_distance and on this lane
-        detectable = []
-        for v in self.eng.lane.getLastStepVehicleIDs(lane):
-            path = self.eng.vehicle.getNextTLS(v)
-            if len(path) > 0:
-                next_light = path[0]
-                distance = next_light[2]
-                if distance <= max_distance:
-                    detectable.append(v)
+        # distances to the traffic light are computed once per step for all vehicles by the world
+        detectable_vehicles = self.world.get_detectable_vehicles(max_distance)
+        detectable = [v for v in self.world.get_lane_vehicle_ids(lane) if v in detectable_vehicles]
         return detectable
 
     # TODO: revert x and y
@@ -374,23 +373,39 @@ class World(object):
             sumo_cmd += ['-c', os.path.join(sumo_dict['dir'], sumo_dict['combined_file']),
                          '--no-warnings', str(sumo_dict['no_warning'])]
         self.net = os.path.join(sumo_dict['dir'], sumo_dict['roadnetFile'])
+        # tlLogic programs can also come from additional files of the combined config
+        self.combined_file = os.path.join(sumo_dict['dir'], sumo_dict['combined_file']) \
+            if sumo_dict.get('combined_file') else None
         self.route = os.path.join(sumo_dict['dir'], sumo_dict['flowFile'])
         self.sumo_cmd = sumo_cmd
         self.warning = sumo_dict['no_warning']
         print("building world...")
-        self.connection_name = sumo_dict['name']
+        # a name passed in kwargs overrides the config, e.g. to run several labeled traci connections
+        self.connection_name = kwargs.get('name') or sumo_dict['name']
         self.map = sumo_dict['roadnetFile'].split('/')[-1].split('.')[0]
         
         if self.interface_flag:
             libsumo.start(sumo_cmd)
             self.eng = libsumo
         else:
-            if not sumo_dict['name']:
+            if not self.connection_name:
                 traci.start(sumo_cmd)
                 self.eng = traci
             else:
-                traci.start(sumo_cmd, label=sumo_dict['name'])
-                self.eng = traci.getConnection(sumo_dict['name'])
+                traci.start(sumo_cmd, label=self.connection_name)
+                self.eng = traci.getConnection(self.connection_name)
+        # with traci, phase changes and the simulation step are pipelined into one message,
+        # blocking traci calls are kept for traci versions whose internals are not checked
+        self.traci_client = None
+        if not self.interface_flag:
+            connection = traci.getConnection(self.connection_name or 'default')
+            if supports_pipelining(connection):
+                self.traci_client = PipelinedTraCIClient(connection)
+            else:
+                print("warning: pipelined traci steps are disabled for traci %s (TraCI API %d, checked API versions "
+                      "%s), each phase change and step is a blocking call" %
+                      (getattr(traci, "__version__", "?"), tc.TRACI_VERSION, TRACI_VERSIONS))
+        self.step_group = None  # StepGroup stepping this world in lockstep with others, see SUMOEnvPool
         # TODO: roadnet not implemented but not necessary
         self.RIGHT = True  # TODO: currently set to be true
         self.interval = sumo_dict['interval']
@@ -399,8 +414,11 @@ class World(object):
         self.max_distance = 200 # TODO: set in registry
         # get all intersections (dict here)
         self.intersection_ids = self.eng.trafficlight.getIDList()
+        # static topology of the network, queried once and cached on disk
+        self.topology = load_sumo_topology(self.eng, self.net, self.combined_file)
         # prepare phase information for each intersections
         self.green_phases = self.generate_valid_phase()
+        self.pending_phases = {}  # key: intersection id, value: phase to be set before the next simulation step
 
         # creating all intersections
         self.id2intersection = dict()
@@ -411,8 +429,16 @@ class World(object):
         self.id2idx = {i: idx for idx,i in enumerate(self.id2intersection)}
         # TODO: to see if its necessary to test .intersections or .observe here
         # TODO: to see if pass observation and its shape by generator
-        self.all_roads = [x for x in self.eng.edge.getIDList()]
-        self.all_lanes = [ x for x in self.eng.lane.getIDList()]
+        self.all_roads = list(self.topology["roads"])
+        self.all_lanes = list(self.topology["lanes"])
+        # intern lanes into integer indices, per-lane arrays are ordered by this index
+        self.lane_index = {lane: idx for idx, lane in enumerate(self.all_lanes)}
+        self.lane_max_speed = dict(zip(self.all_lanes, self.topology["lane_max_speed"]))
+        self.lane_length = dict(zip(self.all_lanes, self.topology["lane_length"]))
+        # static lane attributes ordered by lane index
+        self.lane_max_speed_array = np.array(self.topology["lane_max_speed"], dtype=np.float64)
+        self.lane_length_array = np.array(self.topology["lane_length"], dtype=np.float64)
+        self._subscribe_variables()
         # for itsec in self.intersections:
         #     for road in itsec.road_lane_mapping.keys():
         #         if itsec.road_lane_mapping[road] and road not in self.all_roads:
@@ -422,24 +448,21 @@ class World(object):
                     #     if lane not in self.all_lanes:
                     #         self.all_lanes.append(lane)
 
-        # restart eng
+        # initial episode state
         self.run = 0
         self.inside_vehicles = dict()
         self.vehicles = dict()
+        self._fetch_subscriptions()
         for intsec in self.intersections:
             intsec.observe(self.step_length, self.max_distance)
-        if self.interface_flag:
-            if not self.connection_name: 
-                libsumo.switch(self.connection_name)  # TODO: make sure what's this step doing
-            libsumo.close()
-        else:
-            if not self.connection_name: 
-                traci.switch(self.connection_name)  # TODO: make sure what's this step doing
-            traci.close()
         # self.connection_name = self.map + '-' + self.connection_name
         if not os.path.exists(os.path.join(Registry.mapping['logger_mapping']['path'].path,
                                            self.connection_name)):
             os.mkdir(os.path.join(Registry.mapping['logger_mapping']['path'].path, self.connection_name))
+        # the engine keeps running, save the initial state so reset only needs to load it
+        self.state_file = os.path.join(Registry.mapping['logger_mapping']['path'].path,
+                                       self.connection_name, 'init_state.xml')
+        self.eng.simulation.saveState(self.state_file)
 
         print('Connection ID', self.connection_name)
 
@@ -461,12 +484,22 @@ class World(object):
             "throughput": self.get_cur_throughput,
             "average_travel_time": None
         }
+        # info functions returning a value for each lane, published as arrays in self.lane_state
+        self.lane_infos = ["lane_count", "lane_waiting_count", "lane_waiting_time_count", "lane_delay", "lane_pressure"]
         self.fns = []
         self.info = {}
+        # bumped whenever self.info is dropped, shared generators memoize their output per version
+        self.info_version = 0
+        self.generator_registry = {}  # see BaseGenerator.shared
+        self.lane_state = {}  # key: lane info name, value: np.ndarray of shape [num_lanes]
         # test generate observation information
+        # key: vehicle_id, value: [[lane_id_1, enter_time, time_spent_on_lane_1], ... ]
+        # it's a TrajectoryStore recording only after "vehicle_trajectory" or "real_delay" is subscribed
         self.vehicle_trajectory = {}
         self.vehicle_maxspeed = {}
-        self.real_delay = {}
+        self.vehicle_tracker = VehicleTracker(self.all_lanes)
+        self.trajectory_store = None
+        self.real_delay_accumulator = None  # follows trajectory_store, finalizes delay of each segment once
 
         # get in_lanes and out_lanes
         self.in_lanes, self.out_lanes = self.get_in_out_lanes()
@@ -480,21 +513,9 @@ class World(object):
         :return valid_phases: valid phases that will be executed by intersections later.
         '''
         valid_phases = dict()
-        for i in range(0, 500):    # TODO grab info. directly from tllogic python interface
-            for lightID in self.intersection_ids:
-                current_phase = self.eng.trafficlight.getRedYellowGreenState(lightID)
-                if not lightID in valid_phases:
-                    valid_phases[lightID] = []
-                has_phase = False
-                for phase in valid_phases[lightID]:
-                    if phase == current_phase:
-                        has_phase = True
-                if not has_phase:
-                    valid_phases[lightID].append(current_phase)
-            self.step_sim()
-        for ts in valid_phases:
+        for ts in self.intersection_ids:
             green_phases = []
-            for phase in valid_phases[ts]:     # Convert to SUMO phase type
+            for phase in self.topology["traffic_lights"][ts]["phase_states"]:     # Convert to SUMO phase type
                 if 'y' not in phase:
                     if phase.count('r') + phase.count('s') != len(phase):
                         green_phases.append(self.eng.trafficlight.Phase(self.step_length, phase))
@@ -511,7 +532,12 @@ class World(object):
         '''
         # 
         for _ in range(self.step_ratio):
-            self.eng.simulationStep()
+            if self.step_group is not None:
+                self.step_group.step(self.traci_client)
+            elif self.traci_client is not None:
+                self.traci_client.simulation_step()
+            else:
+                self.eng.simulationStep()
 
     def step(self, action=None):
         '''
@@ -525,20 +551,77 @@ class World(object):
         if action is not None:
             for i, intersection in enumerate(self.intersections):
                 intersection.pseudo_step(action[i])
+            self._flush_phases()
             self.step_sim()
+        # TODO: register vehicles here
+        entering_v = self._fetch_subscriptions()
         for intsec in self.intersections:
             intsec.observe(self.step_length, self.max_distance)
-        # TODO: register vehicles here
-        entering_v = self.eng.simulation.getDepartedIDList()
         for v in entering_v:
             self.inside_vehicles.update({v: self.get_current_time()})
-        exiting_v = self.eng.simulation.getArrivedIDList()
+        exiting_v = self.simulation_results[tc.VAR_ARRIVED_VEHICLES_IDS]
         for v in exiting_v:
             self.vehicles.update({v: self.get_current_time() - self.inside_vehicles[v]})
         self._update_infos()
-        self.vehicle_trajectory, self.vehicle_maxspeed = self.get_vehicle_trajectory()
+        if self.trajectory_store is not None:
+            self.update_vehicle_tracker()
         self.run += 1
 
+    def _flush_phases(self):
+        '''
+        _flush_phases
+        Send phases changed by intersections since the last simulation step.
+
+        :param: None
+        :return: None
+        '''
+        for ts, phase in self.pending_phases.items():
+            if self.traci_client is not None:
+                # sent together with the next simulation step
+                self.traci_client.set_phase(ts, phase)
+            elif self.interface_flag:
+                self.eng.trafficlight.setPhase(ts, int(phase))
+            else:
+                self.eng.trafficlight.setPhase(ts, phase)
+        self.pending_phases.clear()
+
+    def step_n(self, actions, n, on_step=None, mean_fns=()):
+        '''
+        step_n
+        Take the same actions for n steps in one call, e.g. a whole action_interval.
+        
+        :param actions: actions list to be executed at all intersections at each of the n steps
+        :param n: number of steps
+        :param on_step: None or callable without arguments, called after each step to read per-step information
+        :param mean_fns: lane infos averaged over the n steps, e.g. inputs of rewards, see swap_lane_state
+        :return lane_means: dict of lane info name to its lane array averaged over the n steps
+        '''
+        # one vectorized sum per lane info and step instead of generating rewards of every agent at each step
+        lane_sums = {fn: np.zeros(len(self.all_lanes), dtype=np.float64) for fn in mean_fns}
+        for _ in range(n):
+            self.step(actions)
+            for fn, lane_sum in lane_sums.items():
+                lane_sum += self.get_lane_array(fn)
+            if on_step is not None:
+                on_step()
+        lane_means = {fn: (lane_sum / n).astype(np.float32) for fn, lane_sum in lane_sums.items()}
+        return lane_means
+
+    def swap_lane_state(self, lane_state):
+        '''
+        swap_lane_state
+        Replace the lane arrays returned by get_lane_array, e.g. by the means of step_n to generate rewards of an
+        interval once. Lane infos missing in lane_state are computed from the current step as usual.
+        
+        :param lane_state: dict of lane info name to lane array
+        :return previous: dict of replaced lane arrays, swap it back to restore them
+        '''
+        previous = self.lane_state
+        self.lane_state = lane_state
+        # shared generators must not serve outputs of the other arrays
+        self.info_version += 1
+        return previous
+
     def reset(self):
         '''
         reset
@@ -547,40 +630,139 @@ class World(object):
         :param: None
         :return: None
         '''
-        if self.run != 0:
-            # TODO: test why need switch in original code
-            if self.interface_flag:
-                libsumo.close()
-            else:
-                traci.close()
+        # the engine is still running, roll it back and keep static Intersection topology
+        self.eng.simulation.loadState(self.state_file)
+        self.pending_phases.clear()
+        for intsec in self.intersections:
+            intsec.reset()
         self.run = 0
         self.vehicles = dict()
         self.inside_vehicles = dict()
-        # TODO: check when to close traci
-        if self.interface_flag:
-            libsumo.start(self.sumo_cmd)
-            # TODO: set trip info output
-            self.eng = libsumo
-        else:
-            traci.start(self.sumo_cmd, label=self.connection_name)
-            self.eng = traci.getConnection(self.connection_name)
-        self.id2intersection = dict()
-        self.intersections = []
-        for ts in self.eng.trafficlight.getIDList():
-            self.id2intersection[ts] = Intersection(ts, self, self.green_phases[ts])  # this IntSec has different phases
-            self.intersections.append(self.id2intersection[ts])
-        self.id2idx = {i: idx for idx,i in enumerate(self.id2intersection)}
 
+        # vehicles are removed by loadState, register subscriptions again
+        self._subscribe_variables()
+        entering_v = self._fetch_subscriptions()
         for intsec in self.intersections:
             intsec.observe(self.step_length, self.max_distance)
         self._update_infos()
         # TODO: check if its the problem
-        entering_v = self.eng.simulation.getDepartedIDList()
         for v in entering_v:
             self.inside_vehicles.update({v: self.get_current_time()})
-        self.vehicle_trajectory = {}
         self.vehicle_maxspeed = {}
-        self.real_delay= {}
+        self.vehicle_tracker.reset()
+        if self.trajectory_store is not None:
+            self.trajectory_store.reset()
+            self.real_delay_accumulator.reset()
+
+    def _subscribe_variables(self):
+        '''
+        _subscribe_variables
+        Subscribe vehicle ids of all lanes, it's needed once after the engine starts.
+        Vehicles are subscribed in _fetch_subscriptions when they depart.
+
+        :param: None
+        :return: None
+        '''
+        for lane in self.all_lanes:
+            self.eng.lane.subscribe(lane, [tc.LAST_STEP_VEHICLE_ID_LIST])
+        self.eng.simulation.subscribe(SIMULATION_VARIABLES)
+        self.lane_results = {}
+        self.vehicle_results = {}
+        self.vehicle_table = None  # per-step cache of _get_vehicle_table
+        self.detectable_vehicles = {}  # key: max_distance, value: vehicles within the distance to a traffic light
+        # lanes ending at a traffic light, vehicles on other lanes are not detected by intersections
+        self.tls_lanes = set(link[0] for tls in self.topology["traffic_lights"].values()
+                             for links in tls["controlled_links"] for link in links)
+        self.tls_lane_mask = np.array([lane in self.tls_lanes for lane in self.all_lanes], dtype=bool)
+
+    def _fetch_subscriptions(self):
+        '''
+        _fetch_subscriptions
+        Subscribe departed vehicles and read results of all subscriptions in one batch.
+
+        :param: None
+        :return departed: ids of vehicles departed in the last step
+        '''
+        self.simulation_results = self.eng.simulation.getSubscriptionResults()
+        departed = self.simulation_results[tc.VAR_DEPARTED_VEHICLES_IDS]
+        for v in departed:
+            self.eng.vehicle.subscribe(v, VEHICLE_VARIABLES)
+        self.lane_results = self.eng.lane.getAllSubscriptionResults()
+        self.vehicle_results = self.eng.vehicle.getAllSubscriptionResults()
+        self.vehicle_table = None
+        self.detectable_vehicles = {}
+        return departed
+
+    def _get_vehicle_table(self):
+        '''
+        _get_vehicle_table
+        Get subscribed variables of all vehicles in array form, computed once per step.
+
+        :param: None
+        :return vehicles: list of vehicle ids
+        :return lanes: list of the lane id of each vehicle
+        :return lane_idx: np.ndarray of the lane index of each vehicle, -1 if it's not on a known lane
+        :return position: np.ndarray of the position of each vehicle on its lane
+        :return allowed_speed: np.ndarray of the allowed speed of each vehicle on its lane
+        '''
+        if self.vehicle_table is None:
+            vehicles = list(self.vehicle_results)
+            results = [self.vehicle_results[v] for v in vehicles]
+            lanes = [r[tc.VAR_LANE_ID] for r in results]
+            lane_idx = np.fromiter((self.lane_index.get(lane, -1) for lane in lanes), dtype=np.int64,
+                                   count=len(lanes))
+            position = np.fromiter((r[tc.VAR_LANEPOSITION] for r in results), dtype=np.float64,
+                                   count=len(results))
+            allowed_speed = np.fromiter((r[tc.VAR_ALLOWED_SPEED] for r in results), dtype=np.float64,
+                                        count=len(results))
+            self.vehicle_table = (vehicles, lanes, lane_idx, position, allowed_speed)
+        return self.vehicle_table
+
+    def get_detectable_vehicles(self, max_distance):
+        '''
+        get_detectable_vehicles
+        Get vehicles on lanes ending at a traffic light, within max_distance to the end of the lane.
+        It's computed on batched lane positions once per step.
+
+        :param max_distance: distance limitation to the end of the lane
+        :return detectable: set of vehicle ids
+        '''
+        if max_distance not in self.detectable_vehicles:
+            vehicles, _, lane_idx, position, _ = self._get_vehicle_table()
+            on_lane = lane_idx >= 0
+            mask = on_lane.copy()
+            mask[on_lane] = self.tls_lane_mask[lane_idx[on_lane]] & \
+                (self.lane_length_array[lane_idx[on_lane]] - position[on_lane] <= max_distance)
+            self.detectable_vehicles[max_distance] = set(compress(vehicles, mask))
+        detectable = self.detectable_vehicles[max_distance]
+        return detectable
+
+    def get_lane_vehicle_ids(self, lane):
+        '''
+        get_lane_vehicle_ids
+        Get ids of vehicles on a lane at current step from subscription results.
+
+        :param lane: lane id
+        :return vehicles: tuple of vehicle ids
+        '''
+        vehicles = self.lane_results[lane][tc.LAST_STEP_VEHICLE_ID_LIST]
+        return vehicles
+
+    def get_vehicle_results(self, vehicle):
+        '''
+        get_vehicle_results
+        Get subscribed variables of a vehicle at current step, see VEHICLE_VARIABLES.
+
+        :param vehicle: vehicle id
+        :return results: dict of traci constant to value
+        '''
+        results = self.vehicle_results.get(vehicle)
+        if results is None:
+            # vehicles inserted without departing are subscribed on first use
+            self.eng.vehicle.subscribe(vehicle, VEHICLE_VARIABLES)
+            results = self.eng.vehicle.getSubscriptionResults(vehicle)
+            self.vehicle_results[vehicle] = results
+        return results
 
     def get_current_time(self):
         '''
@@ -590,7 +772,7 @@ class World(object):
         :param: None
         :return result: current time
         '''
-        result = self.eng.simulation.getTime()
+        result = self.simulation_results[tc.VAR_TIME]
         return result
 
     def get_vehicles(self):
@@ -625,31 +807,64 @@ class World(object):
             if fn in self.info_functions:
                 if fn not in self.fns:
                     self.fns.append(fn)
+                if fn in ["vehicle_trajectory", "real_delay"]:
+                    # trajectories are only recorded when needed
+                    self.get_vehicle_trajectory()
             else:
                 raise Exception(f'Info function {fn} not implemented')
 
     def get_info(self, info):
         '''
         get_info
-        Get specific information.
+        Get specific information. It's computed on first request and memoized until the next step.
         
         :param info: the name of the specific information
         :return _info: specific information
         '''
+        if info not in self.info:
+            self.info[info] = self.info_functions[info]()
         _info = self.info[info]
         return _info
 
+    def get_lane_array(self, info):
+        '''
+        get_lane_array
+        Get specific lane information as an array ordered by self.lane_index.
+        It's computed on first request and memoized until the next step.
+        
+        :param info: the name of the specific lane information, must be in self.lane_infos
+        :return lane_array: np.ndarray of shape [num_lanes], lanes without a value are set to 0
+        '''
+        if info not in self.lane_state:
+            self.lane_state[info] = self._get_lane_array(self.get_info(info))
+        lane_array = self.lane_state[info]
+        return lane_array
+
+    def _get_lane_array(self, result):
+        '''
+        _get_lane_array
+        Convert a dict keyed by lane id into an array ordered by self.lane_index.
+        
+        :param result: dict of lane id to value
+        :return lane_array: np.ndarray of shape [num_lanes]
+        '''
+        lane_array = np.zeros(len(self.all_lanes), dtype=np.float32)
+        idx = np.fromiter(map(self.lane_index.__getitem__, result.keys()), dtype=np.int64, count=len(result))
+        lane_array[idx] = np.fromiter(result.values(), dtype=np.float32, count=len(result))
+        return lane_array
+
     def _update_infos(self):
         '''
         _update_infos
         Update global information after reset or each step.
+        Information is computed lazily by get_info, intersections are observed in step().
         
         :param: None
         :return: None
         '''
         self.info = {}
-        for fn in self.fns:
-            self.info[fn] = self.info_functions[fn]()
+        self.info_version += 1
+        self.lane_state = {}
 
     def get_lane_vehicle_count(self):
         '''
@@ -760,7 +975,7 @@ class World(object):
         '''
         result = []
         for intsec in self.intersections:
-            result.append(intsec.get_current_phase())
+            result.append(intsec.current_phase)
         return result
 
     def get_average_travel_time(self):
@@ -820,7 +1035,7 @@ class World(object):
             vehicles = lane_vehicles[key]['vehicles']
             lane_vehicle_count = len(vehicles)
             lane_avg_speed = 0.0
-            speed_limit = self.eng.lane.getMaxSpeed(key)
+            speed_limit = self.lane_max_speed[key]
             for vehicle in vehicles:
                 speed = vehicle['speed']
                 lane_avg_speed += speed
@@ -867,39 +1082,45 @@ class World(object):
         :return vehicle_maxspeed: max speed of each vehicle
         '''
         # get the current lane of each vehicle. {vehicle_id: lane_id}
-        vehicle_lane = {}
-        for lane in self.all_lanes:
-            vehicles = 	self.eng.lane.getLastStepVehicleIDs(lane)
-            for vehicle in vehicles:
-                vehicle_lane[vehicle] = lane
-                self.vehicle_maxspeed[(vehicle,lane)] = self.eng.vehicle.getAllowedSpeed(vehicle)
+        vehicles, lanes, lane_idx, _, allowed_speed = self._get_vehicle_table()
+        on_lane = lane_idx >= 0
+        vehicle_lane = dict(zip(compress(vehicles, on_lane), compress(lanes, on_lane)))
+        self.vehicle_maxspeed.update(zip(vehicle_lane.items(), allowed_speed[on_lane].tolist()))
         return vehicle_lane, self.vehicle_maxspeed
 
+    def update_vehicle_tracker(self):
+        '''
+        update_vehicle_tracker
+        Feed vehicles of all lanes into the vehicle tracker, its deltas are recorded by the trajectory store.
+
+        :param: None
+        :return: None
+        '''
+        lane_vehicles = {lane: self.get_lane_vehicle_ids(lane) for lane in self.all_lanes}
+        self.vehicle_tracker.update(lane_vehicles, self.get_current_time())
+
     def get_vehicle_trajectory(self):
         '''
         get_vehicle_trajectory
         Get trajectory of vehicles that have entered in roadnet, including vehicle_id, enter time, leave time or current time.
+        Trajectories are recorded from the vehicle tracker's deltas once this method or its info is used,
+        the allowed speed of each vehicle on each lane is kept in trajectory_store.speed.
         
         :param: None
         :return vehicle_trajectory: trajectory of vehicles that have entered in roadnet
-        :return vehicle_maxspeed: max speed of each vehicle that have entered in roadnet
         '''
         # lane_id and time spent on the corresponding lane that each vehicle went through
-        vehicle_lane, self.vehicle_maxspeed = self.get_vehicle_lane() # get vehicles on tne roads except turning
-        vehicles = list(self.eng.vehicle.getIDList())
-        # vehicles = [x for x in vehicle_lane]
-        for vehicle in vehicles:
-            if vehicle not in self.vehicle_trajectory:
-                self.vehicle_trajectory[vehicle] = [[vehicle_lane[vehicle], int(self.eng.simulation.getTime()), 0]]
-            else:
-                if vehicle not in vehicle_lane.keys(): # vehicle is turning
-                    continue
-                if vehicle_lane[vehicle] == self.vehicle_trajectory[vehicle][-1][0]: # vehicle is running on the same lane 
-                    self.vehicle_trajectory[vehicle][-1][2] += 1
-                else: # vehicle has changed the lane
-                    self.vehicle_trajectory[vehicle].append(
-                        [vehicle_lane[vehicle], int(self.eng.simulation.getTime()), 0])
-        return self.vehicle_trajectory, self.vehicle_maxspeed
+        if self.trajectory_store is None:
+            self.trajectory_store = TrajectoryStore(
+                self.all_lanes,
+                speed_fn=(lambda vehicle, lane: self.get_vehicle_results(vehicle)[tc.VAR_ALLOWED_SPEED]))
+            self.vehicle_tracker.subscribe(self.trajectory_store.update)
+            self.vehicle_trajectory = self.trajectory_store
+            self.real_delay_accumulator = RealDelayAccumulator(
+                self.trajectory_store,
+                [self.lane_length[lane] for lane in self.all_lanes],
+                [self.lane_max_speed[lane] for lane in self.all_lanes])
+        return self.vehicle_trajectory
 
     def get_real_delay(self):
         '''
@@ -910,29 +1131,18 @@ class World(object):
         :param: None
         :return avg_delay: average real delay of all vehicles
         '''
-        self.vehicle_trajectory, self.vehicle_maxspeed = self.get_vehicle_trajectory()
-        for v in self.vehicle_trajectory:
-            # get road level routes of vehicle
-            routes = self.vehicle_trajectory[v] # lane_level
-            for idx, lane in enumerate(routes):
-                speed = min(self.eng.lane.getMaxSpeed(lane[0]), self.vehicle_maxspeed[(v,lane[0])])
-                lane_length = self.eng.lane.getLength(lane[0])
-                if idx == len(routes)-1: # the last lane
-                    # judge whether the vehicle run over the whole lane.
-                    lane_length = self.eng.vehicle.getLanePosition(v) if v in self.eng.vehicle.getIDList() else lane_length
-                planned_tt = float(lane_length)/speed
-                real_delay = lane[-1] - planned_tt if lane[-1]>planned_tt else 0.
-                if v not in self.real_delay.keys():
-                    self.real_delay[v] = real_delay
-                else:
-                    self.real_delay[v] += real_delay
-
-        avg_delay = 0.
-        count = 0
-        for dic in self.real_delay.items():
-            avg_delay += dic[1]
-            count += 1
-        avg_delay = avg_delay / count
+        # delay of ended segments is accumulated when vehicles leave lanes,
+        # only the current lane of running vehicles is calculated here, up to their position on it
+        self.get_vehicle_trajectory()
+        store = self.trajectory_store
+        vehicles, _, _, position, _ = self._get_vehicle_table()
+        idx = np.fromiter((store.vehicle_index.get(v, -1) for v in vehicles), dtype=np.int64, count=len(vehicles))
+        recorded = idx >= 0
+        rows = store.last_row[idx[recorded]]
+        is_open = store.end[rows] < 0
+        open_delay = float(self.real_delay_accumulator.segment_delays(rows[is_open],
+                                                                      position[recorded][is_open]).sum())
+        avg_delay = self.real_delay_accumulator.average(open_delay)
         return avg_delay
 
 